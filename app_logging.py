@@ -0,0 +1,136 @@
+"""
+Structured, non-blocking logging.
+
+setup_logging() puts a QueueHandler on the root logger; a QueueListener
+thread formats the records (JSON lines by default) and writes them to stderr,
+so request threads and the event loop never wait on log I/O. When the queue is
+full, records are dropped and counted instead of blocking.
+
+Prompt and response bodies are large, so they are only logged for a sampled
+fraction of LLM calls (LOG_BODY_SAMPLE_RATE) and truncated to
+LOG_BODY_MAX_BYTES.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+# LOG_ASYNC=0 writes from the calling thread, e.g. to keep ordering with print() while debugging.
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", 0.01))
+# 0 disables truncation.
+LOG_BODY_MAX_BYTES = int(os.getenv("LOG_BODY_MAX_BYTES", 2048))
+
+# Set per request by the apps (the X-Trace-Id of the response) and added to every record.
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+# Attributes every LogRecord has; anything else came in through extra= and is logged as a field.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, trace ID, message and extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TraceIdFilter(logging.Filter):
+    """Stamps records with the current request's trace ID, in the calling thread."""
+
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, use_queue=LOG_ASYNC):
+    """Configures the root logger once per process; later calls are no-ops."""
+    global _listener
+    with _setup_lock:
+        root = logging.getLogger()
+        if getattr(root, "_app_logging", False):
+            return
+        root._app_logging = True
+
+        stream = logging.StreamHandler(sys.stderr)
+        if fmt == "json":
+            stream.setFormatter(JsonFormatter())
+        else:
+            stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"))
+
+        if use_queue:
+            handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            _listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_listener.stop)
+        else:
+            handler = stream
+        handler.addFilter(TraceIdFilter())
+
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        # httpx logs every request at INFO; the LLM calls are already logged by the apps.
+        logging.getLogger("httpx").setLevel(max(logging.WARNING, root.level))
+
+
+def dropped_records():
+    """Records dropped because the log queue was full."""
+    return sum(getattr(handler, "dropped", 0) for handler in logging.getLogger().handlers)
+
+
+def sample_bodies(rate=None):
+    """Decides once per LLM call whether its prompt and response are logged."""
+    rate = LOG_BODY_SAMPLE_RATE if rate is None else rate
+    return rate > 0 and random.random() < rate
+
+
+def truncate_body(text, max_bytes=None):
+    """Cuts text to max_bytes of UTF-8, noting how much was left out."""
+    max_bytes = LOG_BODY_MAX_BYTES if max_bytes is None else max_bytes
+    if text is None or max_bytes <= 0:
+        return text
+    data = text.encode("utf-8")
+    if len(data) <= max_bytes:
+        return text
+    return data[:max_bytes].decode("utf-8", "ignore") + f"... [{len(data) - max_bytes} more bytes]"
+
@@ -0,0 +1,719 @@
+"""
+Async (ASGI) version of the /api/process pipeline.
+
+Same request and response contract as the Flask app in main.py, but the two
+LLM calls are awaited on an event loop instead of blocking a worker thread,
+so a single process can hold hundreds of in-flight reasoner calls.
+
+Run with:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager, nullcontext
+
+from dotenv import load_dotenv
+
+# Load .env before the local modules below read their settings from the environment
+load_dotenv()
+
+from app_logging import sample_bodies, setup_logging, trace_id_var, truncate_body
+
+setup_logging()
+
+import logging
+import os
+
+import uvicorn
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from prompts import get_query_classification_prompt
+from zip_ingest import MAX_UPLOAD_BYTES, ZipIngestError
+from query_classifier import record_llm_label
+from llm_client import LLMError
+from hedging import AsyncHedgedClient
+from concurrency_limiter import (
+    LLM_LIMITER_ENABLED,
+    PRIORITY_ANSWER,
+    PRIORITY_CLASSIFY,
+    PRIORITY_SPECULATIVE,
+    AsyncAdaptiveLimiter,
+    Overloaded,
+    start_request_deadline,
+)
+from single_flight import AsyncSingleFlight
+from jobs import AsyncJobWorkers, async_job_updates
+from context_builder import estimate_tokens
+import metrics
+from pipeline import (
+    PREFETCH_INPUTS,
+    QUESTION,
+    USER_CODE,
+    AnswerPlan,
+    RequestError,
+    StageTimings,
+    allowed_file,
+    build_messages,
+    classification_key,
+    classify_locally,
+    extract_question_id,
+    input_loaders,
+    job_store,
+    local_classifier,
+    parse_classification,
+    plan_answer,
+    required_inputs,
+    response_cache,
+    sse_event,
+    submission_store,
+)
+import combined_call
+from model_routing import router as model_router
+from combined_call import COMBINED_CALL
+from speculation import SPECULATIVE_ANSWERS, SPECULATION_WORKERS, Speculation, guess_category
+from speculation import tracker as speculation_tracker
+
+logger = logging.getLogger(__name__)
+
+# Larger default pool than the sync client: waits here cost no threads.
+llm_client = AsyncHedgedClient.from_env(pool_size=int(os.getenv("LLM_ASYNC_POOL_SIZE", 200)))
+
+# Client of each model tier (see model_routing.py); a fast tier on another endpoint gets its own.
+llm_clients = {
+    tier.name: llm_client if (tier.url, tier.api_key) == (llm_client.url, llm_client.api_key)
+    else AsyncHedgedClient.from_env(pool_size=llm_client.pool_size, url=tier.url, api_key=tier.api_key)
+    for tier in model_router.tiers
+}
+
+# Bounds concurrent LLM calls; backs off on 429s (LLM_CONCURRENCY_*, LLM_QUEUE_*)
+llm_limiter = AsyncAdaptiveLimiter() if LLM_LIMITER_ENABLED else None
+if llm_limiter is not None:
+    # Every tier's client: a fast tier with its own endpoint gets 429s of its own.
+    for client in llm_clients.values():
+        client.status_listeners.append(llm_limiter.observe_status)
+        # Hedged duplicates need a free slot too, or aren't sent.
+        client.limiter = llm_limiter
+
+# Identical concurrent classification and answer calls are made once and shared.
+classify_flight = AsyncSingleFlight("classify")
+answer_flight = AsyncSingleFlight("answer")
+
+# In-flight speculative answer tasks, at most SPECULATION_WORKERS.
+speculative_tasks = set()
+
+metrics.registry.add_gauges(
+    "mentor_llm_client", "Request/retry counters of the shared LLM client.",
+    lambda: {(("stat", key),): value for key, value in llm_client.stats().items() if isinstance(value, int)},
+)
+metrics.registry.add_gauges(
+    "mentor_llm_limiter", "Adaptive LLM concurrency limit, queue and admission counters.",
+    lambda: {(("stat", key),): value for key, value in llm_limiter.stats().items()} if llm_limiter else {},
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    job_workers.start()
+    yield
+    await job_workers.stop()
+    for client in {llm_client, *llm_clients.values()}:
+        await client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Tags each request with a trace ID and records its latency and status code."""
+    trace_id = metrics.new_trace_id(request.headers.get("X-Trace-Id"))
+    trace_id_var.set(trace_id)
+    start_request_deadline()
+    start = time.perf_counter()
+    response = await call_next(request)
+    # For streamed responses this measures time to the first byte, not the whole stream.
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    metrics.REQUESTS.inc(endpoint=endpoint, status_code=response.status_code)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    response.headers["X-Trace-Id"] = trace_id
+    return response
+
+
+CALL_PRIORITIES = {"classify": PRIORITY_CLASSIFY, "speculative": PRIORITY_SPECULATIVE}
+
+
+def llm_slot(call):
+    """Waits for an LLM slot; classification calls are served before answers, speculative answers last."""
+    if llm_limiter is None:
+        return nullcontext()
+    return llm_limiter.slot(CALL_PRIORITIES.get(call, PRIORITY_ANSWER))
+
+
+async def complete_on(tier, messages, call, category):
+    """Async counterpart of main.complete_on."""
+    async with llm_slot(call):
+        start = time.perf_counter()
+        content, usage = await llm_clients[tier.name].complete(messages, model=tier.model, temperature=0.0,
+                                                               read_timeout=tier.latency_budget, latency_key=call)
+        seconds = time.perf_counter() - start
+    metrics.LLM_CALL_SECONDS.observe(seconds, call=call, category=metrics.category_label(category))
+    metrics.record_usage(usage, call, category)
+    logger.info("LLM call finished", extra={"call": call, "category": category, "model": tier.model,
+                                            "seconds": round(seconds, 3),
+                                            "prompt_tokens": usage.get("prompt_tokens"),
+                                            "completion_tokens": usage.get("completion_tokens")})
+    return content
+
+
+async def llm_call(system_prompt, user_prompt, call="answer", category=""):
+    """Async counterpart of main.llm_call, with the same routing and escalation."""
+    messages = build_messages(system_prompt, user_prompt)
+    log_bodies = sample_bodies()
+    if log_bodies:
+        logger.info("LLM prompt", extra={"call": call, "system_prompt": truncate_body(system_prompt),
+                                         "user_prompt": truncate_body(user_prompt)})
+    tier = model_router.tier_for(call, category, estimate_tokens(system_prompt) + estimate_tokens(user_prompt))
+    while True:
+        try:
+            content = await complete_on(tier, messages, call, category)
+        except LLMError as e:
+            escalated = model_router.escalate(tier, call, "error")
+            if escalated is None:
+                raise
+            logger.warning("Fast model call failed, escalating", extra={"call": call, "model": tier.model,
+                                                                         "error": str(e)})
+            tier = escalated
+            continue
+        if model_router.accepts(tier, call, content):
+            break
+        logger.warning("Fast model reply failed validation, escalating", extra={"call": call, "model": tier.model})
+        tier = model_router.escalate(tier, call, "invalid")
+    if log_bodies:
+        logger.info("LLM response", extra={"call": call, "response": truncate_body(content)})
+    return content
+
+
+async def analyze_user_query(user_query):
+    """
+    Analyzes the user query and classifies it into one of the predefined categories.
+    """
+    local_result = classify_locally(user_query)
+    if local_result is not None:
+        return local_result
+    return await classify_with_llm(user_query)
+
+
+async def classify_with_llm(user_query):
+    """Classifies the user query with the LLM, sharing the call with identical in-flight requests."""
+    async def classify():
+        result = parse_classification(await llm_call(get_query_classification_prompt(), user_query, call="classify"))
+        logger.info("Classified by LLM", extra={"query_category": result.get("query_category")})
+        record_llm_label(user_query, result.get("query_category"))
+        return result
+
+    # Waiters share the leader's dict; copy it so nobody mutates another request's result.
+    return dict(await classify_flight.do(classification_key(user_query), classify))
+
+
+async def generate_answer(plan):
+    """Answers a planned query with the LLM, sharing the call with identical in-flight requests."""
+    async def answer():
+        response = await llm_call(plan.system_prompt, plan.user_prompt, category=plan.query_category)
+        response_cache.put(plan.cache_key, response)
+        return response
+
+    return await answer_flight.do(plan.cache_key, answer)
+
+
+async def classify_and_answer(user_query, question_id, inputs, timings):
+    """Async counterpart of main.classify_and_answer; inputs are the loading tasks."""
+    try:
+        question_details = await inputs[QUESTION]
+        user_files = await inputs[USER_CODE]
+    except ZipIngestError:
+        question_details = None
+    if not question_details:
+        combined_call.tracker.count("skipped")
+        return None, None
+
+    request = await run_in_threadpool(
+        combined_call.build_request, question_id, user_query, question_details, user_files, timings)
+    reply = response_cache.get(request.cache_key)
+    cached = reply is not None
+    if not cached:
+        reply = await llm_call(request.system_prompt, request.user_prompt, call="combined")
+    try:
+        analysis_result, answer = combined_call.parse_reply(reply)
+    except ValueError as e:
+        combined_call.tracker.count("unparsed")
+        logger.warning("Unparseable combined reply, classifying separately", extra={"error": str(e)})
+        return None, None
+    query_category = analysis_result["query_category"]
+    logger.info("Classified by LLM", extra={"query_category": query_category, "call": "combined"})
+    record_llm_label(user_query, query_category)
+    if answer is None:
+        # Cut off before </answer>: keep the classification, answer it separately, don't cache the partial reply.
+        combined_call.tracker.count("unparsed")
+        logger.warning("Truncated combined reply, answering separately")
+        return analysis_result, None
+    if not cached:
+        response_cache.put(request.cache_key, reply)
+
+    if not combined_call.answered(analysis_result, answer):
+        combined_call.tracker.count("second_call")
+        return analysis_result, None
+    combined_call.tracker.count("answered")
+    return analysis_result, AnswerPlan(
+        analysis_result, analysis_result.get("user_query_summary", ""), query_category,
+        request.system_prompt, request.user_prompt, request.files_sent, request.cache_key, answer=answer)
+
+
+async def stream_answer(plan, timings):
+    """Async counterpart of main.stream_answer."""
+    future, leader = answer_flight.acquire(plan.cache_key)
+    if not leader:
+        with timings.stage("answer"):
+            response = await asyncio.shield(future)
+        yield response
+        return
+
+    parts = []
+    usage = {}
+    try:
+        with timings.stage("answer"):
+            async with llm_slot("answer"):
+                messages = build_messages(plan.system_prompt, plan.user_prompt)
+                tier = model_router.tier_for("answer", plan.query_category,
+                                             estimate_tokens(plan.system_prompt) + estimate_tokens(plan.user_prompt))
+                async for text in llm_clients[tier.name].stream_chat(messages, model=tier.model, temperature=0.0,
+                                                                     usage=usage, read_timeout=tier.latency_budget):
+                    parts.append(text)
+                    yield text
+    except BaseException as e:
+        # GeneratorExit: the client went away mid-stream; the waiters can't get the answer.
+        answer_flight.finish(plan.cache_key, future, error=e)
+        raise
+    response = "".join(parts)
+    metrics.LLM_CALL_SECONDS.observe(timings.durations["answer"], call="answer",
+                                     category=metrics.category_label(plan.query_category))
+    metrics.record_usage(usage, "answer", plan.query_category)
+    logger.info("LLM stream finished", extra={"category": plan.query_category,
+                                              "seconds": round(timings.durations["answer"], 3),
+                                              "completion_tokens": usage.get("completion_tokens")})
+    response_cache.put(plan.cache_key, response)
+    answer_flight.finish(plan.cache_key, future, result=response)
+
+
+async def stream_speculative(plan, speculation):
+    """
+    Streams the answer for a speculative plan; discarding the speculation cancels
+    this mid-stream. Returns the answer.
+    """
+    cached = response_cache.get(plan.cache_key)
+    if cached is not None:
+        return cached
+    messages = build_messages(plan.system_prompt, plan.user_prompt)
+    parts = []
+    usage = {}
+    async with llm_slot("speculative"):
+        start = time.perf_counter()
+        tier = model_router.tier_for("speculative", plan.query_category,
+                                     estimate_tokens(plan.system_prompt) + estimate_tokens(plan.user_prompt))
+        stream = llm_clients[tier.name].stream_chat(messages, model=tier.model, temperature=0.0, usage=usage,
+                                                    read_timeout=tier.latency_budget)
+        try:
+            async for text in stream:
+                parts.append(text)
+        finally:
+            # Closing the stream drops the connection, so the API stops generating.
+            await stream.aclose()
+            speculation.spent(usage.get("prompt_tokens") or estimate_tokens(plan.system_prompt + plan.user_prompt),
+                              usage.get("completion_tokens") or estimate_tokens("".join(parts)))
+    response = "".join(parts)
+    metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - start, call="speculative",
+                                     category=metrics.category_label(plan.query_category))
+    metrics.record_usage(usage, "speculative", plan.query_category)
+    response_cache.put(plan.cache_key, response)
+    return response
+
+
+async def run_speculation(speculation, question_id, inputs):
+    """Plans and streams a speculative answer; runs as the speculation.answer task and resolves speculation.plan."""
+    try:
+        guess = speculation.guess
+        names = list(required_inputs(guess["query_category"]))
+        loaded = dict(zip(names, await asyncio.gather(*(inputs[name] for name in names))))
+        plan = await run_in_threadpool(
+            plan_answer, question_id, guess, loaded.get(QUESTION), loaded.get(USER_CODE), StageTimings())
+        speculation.plan.set_result(plan)
+        return await stream_speculative(plan, speculation)
+    except Exception as e:
+        speculation.failed()
+        if not speculation.plan.done():
+            speculation.plan.set_exception(e)
+        raise
+
+
+def start_speculation(user_query, question_id, inputs, submit):
+    """Async counterpart of main.start_speculation."""
+    guess = guess_category(user_query)
+    if guess is None or len(speculative_tasks) >= SPECULATION_WORKERS:
+        speculation_tracker.count("skipped")
+        return None
+    for name in required_inputs(guess["query_category"]) - inputs.keys():
+        inputs[name] = submit(name)
+    speculation = Speculation(guess)
+    speculation.plan = asyncio.get_running_loop().create_future()
+    speculation.answer = asyncio.ensure_future(run_speculation(speculation, question_id, dict(inputs)))
+    for future in (speculation.plan, speculation.answer):
+        # A discarded speculation's outcome is never awaited; don't warn about it.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    speculative_tasks.add(speculation.answer)
+    speculation.answer.add_done_callback(speculative_tasks.discard)
+    logger.info("Speculating", extra={"query_category": guess["query_category"], "confidence": guess["confidence"]})
+    return speculation
+
+
+def discard_speculation(speculation):
+    speculation.discard()
+    speculation.answer.cancel()
+
+
+async def adopt_speculation(speculation, analysis_result):
+    """Async counterpart of main.adopt_speculation."""
+    if not speculation.agrees(analysis_result):
+        discard_speculation(speculation)
+        return None
+    try:
+        plan = await asyncio.shield(speculation.plan)
+    except Exception:
+        return None
+    speculation.keep()
+    return plan._replace(analysis_result=analysis_result,
+                         user_query_summary=analysis_result.get("user_query_summary", ""),
+                         query_category=analysis_result.get("query_category", "Other"),
+                         speculative_answer=speculation.answer)
+
+
+def respond(message, status_code):
+    return JSONResponse({"response": message}, status_code=status_code)
+
+
+@app.get("/", response_class=PlainTextResponse)
+async def home():
+    return "Hello, Render!"
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Latency histograms, token counters and upstream status codes in Prometheus text format."""
+    return Response(metrics.registry.expose(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """Connection pool and retry counters of the shared LLM client, plus the concurrency limiter and model routing."""
+    stats = llm_client.stats()
+    stats["limiter"] = llm_limiter.stats() if llm_limiter else {"enabled": False}
+    stats["models"] = model_router.stats()
+    return stats
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the answer cache."""
+    return response_cache.stats()
+
+
+@app.get("/api/submissions/stats")
+async def submission_stats():
+    """How often an upload reused the extraction of an identical earlier one, and the store's size."""
+    return submission_store.stats()
+
+
+@app.get("/api/classifier/stats")
+async def classifier_stats():
+    """How many classifications the local fast path answered without the LLM."""
+    return local_classifier.stats() if local_classifier else {"enabled": False}
+
+
+@app.get("/api/speculation/stats")
+async def speculation_stats():
+    """How often speculative answers were kept, and the tokens spent on discarded ones."""
+    return speculation_tracker.stats()
+
+
+@app.get("/api/combined/stats")
+async def combined_stats():
+    """How often the combined classify+answer call answered on its own, needed a second call or fell back."""
+    return combined_call.tracker.stats()
+
+
+@app.get("/api/coalescing/stats")
+async def coalescing_stats():
+    """How many LLM calls were saved by joining an identical in-flight call."""
+    return {"classify": classify_flight.stats(), "answer": answer_flight.stats()}
+
+
+async def read_process_form(query, file):
+    """
+    Validates the /api/process form.
+    Returns (user_query, question_id, zip_bytes); raises RequestError for a bad request.
+    """
+    if not query:
+        raise RequestError("User query is required")
+    if file is None:
+        raise RequestError("Zip file is required to extract the question ID")
+    if not file.filename or not allowed_file(file.filename):
+        raise RequestError("Invalid file type. Only .zip files are allowed")
+    zip_bytes = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(zip_bytes) > MAX_UPLOAD_BYTES:
+        raise RequestError("Zip file is too large", 413)
+
+    question_id = extract_question_id(file.filename)
+    if not question_id:
+        raise RequestError("Question ID not found in the zip file name")
+    return query, question_id, zip_bytes
+
+
+async def prepare_answer(user_query, question_id, zip_bytes, timings, speculate=SPECULATIVE_ANSWERS,
+                         combined=COMBINED_CALL):
+    """
+    Classifies the query, loads the inputs its category's route consumes and
+    builds the answer prompt, speculating on the answer or classifying and
+    answering in one call if asked; see main.prepare_answer.
+    Returns an AnswerPlan.
+    """
+    loaders = input_loaders(question_id, zip_bytes)
+
+    def submit(name):
+        stage, load, arg = loaders[name]
+        # Unzipping is CPU-bound; keep it off the event loop.
+        return asyncio.ensure_future(run_in_threadpool(timings.timed, stage, load, arg))
+
+    tasks = {}
+    speculation = None
+    combined_plan = None
+    try:
+        with timings.stage("parallel"):
+            with timings.stage("classify"):
+                analysis_result = classify_locally(user_query)
+                if analysis_result is None and combined:
+                    tasks = {name: submit(name) for name in loaders}
+                    analysis_result, combined_plan = await classify_and_answer(
+                        user_query, question_id, tasks, timings)
+                if analysis_result is None:
+                    # The inputs don't depend on the classification; load them while the LLM classifies.
+                    if PREFETCH_INPUTS and not tasks:
+                        tasks = {name: submit(name) for name in loaders}
+                    if speculate:
+                        speculation = start_speculation(user_query, question_id, tasks, submit)
+                    analysis_result = await classify_with_llm(user_query)
+
+            needed = required_inputs(analysis_result.get("query_category", "Other"))
+            for name in needed - tasks.keys():
+                tasks[name] = submit(name)
+            names = list(needed)
+            inputs = dict(zip(names, await asyncio.gather(*(tasks[name] for name in names))))
+        timings.record("overlap_saved", timings.overlap_saved("parallel", ["classify", "lookup", "extract"]))
+
+        if combined_plan is not None:
+            return combined_plan
+        if speculation is not None:
+            plan = await adopt_speculation(speculation, analysis_result)
+            if plan is not None:
+                return plan
+        return await run_in_threadpool(
+            plan_answer, question_id, analysis_result, inputs.get(QUESTION), inputs.get(USER_CODE), timings)
+    except BaseException:
+        # Classification, the inputs or the plan failed: stop the speculative answer.
+        if speculation is not None:
+            discard_speculation(speculation)
+        raise
+    finally:
+        # Unused or abandoned loads: nobody awaits them, so don't warn about their errors.
+        for task in tasks.values():
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def answer_for(plan, timings):
+    """
+    The answer to a plan: <mentor_required>, a cached answer or a new one.
+    Returns (response, cache_status); cache_status is "HIT", "MISS", "SPECULATIVE",
+    "COMBINED" or None when no answer was needed.
+    """
+    if plan.system_prompt is None:
+        return "<mentor_required>", None
+    if plan.answer is not None:
+        return plan.answer, "COMBINED"
+    if plan.speculative_answer is not None:
+        with timings.stage("answer"):
+            try:
+                response = await plan.speculative_answer
+            except Exception:
+                logger.warning("Speculative answer failed, answering again", exc_info=True)
+                response = None
+        if response is not None:
+            return response, "SPECULATIVE"
+    response = response_cache.get(plan.cache_key)
+    if response is not None:
+        return response, "HIT"
+    with timings.stage("answer"):
+        return await generate_answer(plan), "MISS"
+
+
+async def run_job(job, progress):
+    """Runs one /api/jobs job through the /api/process pipeline; returns the /api/process response body."""
+    timings = StageTimings()
+    plan = await prepare_answer(job.user_query, job.question_id, job.zip_bytes, timings)
+    await progress("answering", {"query_category": plan.query_category, "user_query_summary": plan.user_query_summary})
+    response, _ = await answer_for(plan, timings)
+    logger.info("Job finished", extra={"job_id": job.job_id, "timings": timings.server_timing()})
+    return {"response": response, "included_files": plan.files_sent, "timings": timings.server_timing()}
+
+
+# Background workers for /api/jobs (JOB_WORKERS tasks), started with the app
+job_workers = AsyncJobWorkers(job_store, run_job)
+
+
+def error_response(e):
+    """Maps pipeline exceptions to the JSON error responses of /api/process."""
+    if isinstance(e, RequestError):
+        return respond(str(e), e.status_code)
+    if isinstance(e, ZipIngestError):
+        return respond(str(e), 400)
+    if isinstance(e, Overloaded) or (isinstance(e, LLMError) and e.status_code == 429):
+        # Shed load quickly instead of a 500; the client should retry later.
+        retry_after = getattr(e, "retry_after", None) or (llm_limiter.retry_after() if llm_limiter else 1)
+        logger.warning("Overloaded, asking the client to retry", extra={"retry_after": retry_after})
+        return JSONResponse({"response": "The mentor is busy right now, please retry shortly"}, status_code=503,
+                            headers={"Retry-After": str(retry_after)})
+    logger.exception("Request failed")
+    return respond(str(e), 500)
+
+
+@app.post("/api/process")
+async def process_query(query: str = Form(None), file: UploadFile = File(None)):
+    """
+    Handles the POST request from the frontend.
+    Expects a user query and a zip file named after the question ID.
+    """
+    try:
+        timings = StageTimings()
+        with timings.stage("upload"):
+            user_query, question_id, zip_bytes = await read_process_form(query, file)
+        plan = await prepare_answer(user_query, question_id, zip_bytes, timings)
+
+        headers = {}
+        response, cache_status = await answer_for(plan, timings)
+        if cache_status:
+            headers["X-Cache"] = cache_status
+
+        logger.info("Request finished", extra={"timings": timings.server_timing()})
+        headers["Server-Timing"] = timings.server_timing()
+        return JSONResponse({"response": response, "included_files": plan.files_sent}, status_code=200, headers=headers)
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.post("/api/process/stream")
+async def process_query_stream(query: str = Form(None), file: UploadFile = File(None)):
+    """
+    Streaming variant of /api/process using server-sent events; see main.process_query_stream.
+    """
+    try:
+        timings = StageTimings()
+        with timings.stage("upload"):
+            user_query, question_id, zip_bytes = await read_process_form(query, file)
+        plan = await prepare_answer(user_query, question_id, zip_bytes, timings, speculate=False, combined=False)
+    except Exception as e:
+        return error_response(e)
+
+    async def generate():
+        yield sse_event("classification", {
+            "query_category": plan.query_category,
+            "user_query_summary": plan.user_query_summary,
+        })
+        try:
+            if plan.system_prompt is None:
+                yield sse_event("token", {"text": "<mentor_required>"})
+            else:
+                cached = response_cache.get(plan.cache_key)
+                if cached is not None:
+                    yield sse_event("token", {"text": cached})
+                else:
+                    async for text in stream_answer(plan, timings):
+                        yield sse_event("token", {"text": text})
+            yield sse_event("done", {"included_files": plan.files_sent, "timings": timings.server_timing()})
+        except Exception as e:
+            error = {"response": str(e)}
+            if isinstance(e, Overloaded):
+                error["retry_after"] = e.retry_after
+            yield sse_event("error", error)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": timings.server_timing()}
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: Request, query: str = Form(None), file: UploadFile = File(None)):
+    """
+    Job variant of /api/process; see main.submit_job.
+    """
+    try:
+        user_query, question_id, zip_bytes = await read_process_form(query, file)
+        job_id = await run_in_threadpool(job_store.submit, user_query, question_id, zip_bytes, trace_id_var.get())
+    except Exception as e:
+        return error_response(e)
+    job_workers.notify()
+    status_url = str(request.url_for("job_status", job_id=job_id).path)
+    return JSONResponse({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": status_url,
+        "events_url": str(request.url_for("job_events", job_id=job_id).path),
+    }, status_code=202, headers={"Location": status_url})
+
+
+@app.get("/api/jobs/stats")
+async def job_stats():
+    """Jobs in the store by status."""
+    return await run_in_threadpool(job_store.stats)
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """A job's status, stage, classification once known, and result or error; see main.job_status."""
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        return respond("Job not found", 404)
+    return job
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent "status" events each time the job's status or stage changes; see main.job_events."""
+    if await run_in_threadpool(job_store.get, job_id) is None:
+        return respond("Job not found", 404)
+
+    async def generate():
+        async for job in async_job_updates(job_store, job_id):
+            if job is None:
+                yield sse_event("error", {"response": "Job not found"})
+            elif not job:
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event("status", job)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8000)
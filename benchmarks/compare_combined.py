@@ -0,0 +1,113 @@
+"""
+A/B of the two-call pipeline (classify, then answer) against the combined
+classify+answer call (COMBINED_CALL, see combined_call.py).
+
+Every labelled query goes through main.prepare_answer and main.answer_for
+once per mode, sequentially and with the answer cache and the local
+classifier off, so each query really reaches the LLM. Reported per mode:
+latency, LLM calls made and, per query, whether both modes chose the same
+category (and the same answer prompt), plus each mode's accuracy against the
+labels and the combined mode's parse fallbacks.
+
+By default the LLM is the local stub, whose classification is canned: that
+measures the saved round trip only. With --live the REQUEST_URL and API_KEY
+of the environment (or .env) are used, which is what agreement and accuracy
+are meaningful for; it makes two to three paid calls per query.
+
+    python benchmarks/compare_combined.py --limit 20
+    python benchmarks/compare_combined.py --live --limit 40
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import zipfile
+
+# Read by the app modules at import time.
+os.environ.update(RESPONSE_CACHE_SIZE="0", LOCAL_CLASSIFIER_ENABLED="0", SPECULATIVE_ANSWERS="0",
+                  LOG_LEVEL="WARNING", JOB_WORKERS="0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_stub import start_stub  # noqa: E402
+from pipeline import route_for  # noqa: E402
+from query_classifier import SEED_LABELS_PATH  # noqa: E402
+
+
+def labelled_queries(path, limit):
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row["query"], row["query_category"]) for row in rows][:limit]
+
+
+def submission_zip(question_id):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr(f"{question_id}/src/components/LoginForm/index.js",
+                    "onSubmitForm = async event => {\n  const response = await fetch(url)\n}\n")
+        zf.writestr(f"{question_id}/src/App.js", "export default App\n")
+    return buffer.getvalue()
+
+
+def run(main, query, question_id, zip_bytes, combined):
+    """One request through the pipeline; returns (seconds, query_category, LLM calls, cache_status)."""
+    calls = main.llm_client.stats()["requests"]
+    timings = main.StageTimings()
+    start = time.perf_counter()
+    plan = main.prepare_answer(query, question_id, zip_bytes, timings, speculate=False, combined=combined)
+    _, status = main.answer_for(plan, timings)
+    seconds = time.perf_counter() - start
+    return seconds, plan.query_category, main.llm_client.stats()["requests"] - calls, status
+
+
+def report(name, results, labels):
+    latencies = [seconds for seconds, _, _, _ in results]
+    accuracy = sum(category == label for (_, category, _, _), label in zip(results, labels)) / len(labels)
+    print(f"{name:<10} p50 {statistics.median(latencies):.2f}s  mean {statistics.mean(latencies):.2f}s"
+          f"  max {max(latencies):.2f}s  LLM calls {sum(calls for _, _, calls, _ in results):>4}"
+          f"  accuracy {accuracy:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=None, help="JSONL of {query, query_category} (default: seed labels)")
+    parser.add_argument("--limit", type=int, default=20, help="queries to run")
+    parser.add_argument("--live", action="store_true", help="call the configured LLM instead of the stub")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency per call (seconds)")
+    parser.add_argument("--question-id", default="RJSCPFGWRF")
+    args = parser.parse_args()
+
+    if not args.live:
+        stub, stub_url = start_stub(latency=args.latency)
+        os.environ.update(REQUEST_URL=stub_url, API_KEY="stub")
+    import main as app_main  # reads REQUEST_URL and API_KEY
+
+    queries = labelled_queries(args.labels or SEED_LABELS_PATH, args.limit)
+    labels = [label for _, label in queries]
+    zip_bytes = submission_zip(args.question_id)
+    print(f"{len(queries)} queries, {'live LLM' if args.live else f'stub LLM, {args.latency}s per call'}\n")
+
+    two_call, combined = [], []
+    for query, _ in queries:
+        two_call.append(run(app_main, query, args.question_id, zip_bytes, combined=False))
+        combined.append(run(app_main, query, args.question_id, zip_bytes, combined=True))
+
+    report("two-call", two_call, labels)
+    report("combined", combined, labels)
+    same = sum(a[1] == b[1] for a, b in zip(two_call, combined))
+    same_route = sum(route_for(a[1]) is route_for(b[1]) for a, b in zip(two_call, combined))
+    stats = app_main.combined_call.tracker.stats()
+    print(f"\nsame category {same}/{len(queries)}, same answer prompt {same_route}/{len(queries)}")
+    print(f"combined: answered in one call {stats['answered']}, second call {stats['second_call']}, "
+          f"unparsed (fell back) {stats['unparsed']}, skipped {stats['skipped']}")
+    for (query, label), a, b in zip(queries, two_call, combined):
+        if a[1] != b[1]:
+            print(f"  {label:<24} two-call {a[1]!r:<28} combined {b[1]!r:<28} {query[:60]}")
+    if not args.live:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Side-by-side throughput of the Flask (gunicorn) and ASGI (uvicorn) apps.
+
+Both servers are pointed at the local LLM stub, so the numbers measure how
+many slow upstream waits each deployment can overlap, not the real API.
+
+    python benchmarks/compare_flask_asgi.py --requests 200 --concurrency 100 --latency 0.5
+"""
+import argparse
+import io
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from llm_stub import start_stub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def sample_zip():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("loginApp/src/components/LoginForm/index.js",
+                   "class LoginForm extends Component {\n  onSubmitForm = event => {}\n}\n")
+        z.writestr("loginApp/src/App.js", "const App = () => <LoginForm />\nexport default App\n")
+    return buf.getvalue()
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def drive(url, total, concurrency, question_id, zip_bytes):
+    """Fires total requests with the given concurrency; returns (wall seconds, latencies, errors)."""
+    def one(_):
+        start = time.perf_counter()
+        r = requests.post(url, data={"query": "My login test cases are failing"},
+                          files={"file": (f"{question_id}.zip", zip_bytes)}, timeout=300)
+        return time.perf_counter() - start, r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+    latencies = sorted(latency for latency, status in results if status == 200)
+    return wall, latencies, sum(1 for _, status in results if status != 200)
+
+
+def run_server(name, command, env, args, zip_bytes):
+    port = free_port()
+    proc = subprocess.Popen(
+        [arg.format(port=port) for arg in command], cwd=REPO_ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_until_up(base + "/")
+        wall, latencies, errors = drive(base + "/api/process", args.requests, args.concurrency,
+                                        args.question_id, zip_bytes)
+    finally:
+        proc.terminate()
+        proc.wait()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float("nan")
+    print(f"{name:<28} {args.requests / wall:>8.1f} req/s  p50 {statistics.median(latencies) if latencies else float('nan'):.2f}s"
+          f"  p95 {p(0.95):.2f}s  errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency per call (seconds)")
+    parser.add_argument("--flask-workers", type=int, default=4)
+    parser.add_argument("--flask-threads", type=int, default=1)
+    parser.add_argument("--question-id", default="RJSCPFGWRF")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(latency=args.latency)
+    env = dict(os.environ, REQUEST_URL=stub_url, API_KEY="stub")
+    zip_bytes = sample_zip()
+    print(f"{args.requests} requests, concurrency {args.concurrency}, stub latency {args.latency}s per LLM call\n")
+
+    run_server(
+        f"flask gunicorn {args.flask_workers}w x {args.flask_threads}t",
+        [sys.executable, "-m", "gunicorn", "-w", str(args.flask_workers), "--threads", str(args.flask_threads),
+         "-b", "127.0.0.1:{port}", "main:app"],
+        env, args, zip_bytes,
+    )
+    run_server(
+        "asgi uvicorn 1 process",
+        [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", "{port}", "--log-level", "warning"],
+        env, args, zip_bytes,
+    )
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
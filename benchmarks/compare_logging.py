@@ -0,0 +1,104 @@
+"""
+Throughput of the Flask app with full synchronous prompt logging (what the
+old print() calls did) versus the default sampled, queue-based logging.
+
+The app's stderr is piped back to this process and drained at --drain-kbps,
+standing in for a container log driver or shipper that can't keep up with
+bursts (0 drains as fast as possible). The zip is large enough that the user
+prompt carries a full code context, as in production.
+
+    python benchmarks/compare_logging.py --requests 200 --concurrency 32 --drain-kbps 512
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+
+from compare_flask_asgi import REPO_ROOT, drive, free_port, wait_until_up
+from llm_stub import start_stub
+
+CONFIGS = [
+    ("full prompts, synchronous", {"LOG_ASYNC": "0", "LOG_BODY_SAMPLE_RATE": "1", "LOG_BODY_MAX_BYTES": "0"}),
+    ("sampled 1%, 2KB cap, queued", {"LOG_ASYNC": "1", "LOG_BODY_SAMPLE_RATE": "0.01", "LOG_BODY_MAX_BYTES": "2048"}),
+]
+
+
+def large_zip(files=60, lines=80):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(files):
+            body = "".join(f"export const handler{i}_{j} = (state, action) => state.items[{i * j}]\n"
+                           for j in range(lines))
+            z.writestr(f"loginApp/src/components/Component{i}/index.js", body)
+    return buf.getvalue()
+
+
+def drain(stream, counter, kbps):
+    chunk_size = 16384
+    while True:
+        chunk = stream.read1(chunk_size)
+        if not chunk:
+            return
+        counter[0] += len(chunk)
+        if kbps:
+            time.sleep(len(chunk) / (kbps * 1024))
+
+
+def run(name, overrides, env, args, zip_bytes):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "--threads", str(args.threads),
+         "-b", f"127.0.0.1:{port}", "main:app"],
+        cwd=REPO_ROOT, env=dict(env, **overrides), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    log_bytes = [0]
+    reader = threading.Thread(target=drain, args=(proc.stderr, log_bytes, args.drain_kbps), daemon=True)
+    reader.start()
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_until_up(base + "/")
+        drive(base + "/api/process", args.concurrency, args.concurrency, args.question_id, zip_bytes)  # warm-up
+        log_bytes[0] = 0
+        wall, latencies, errors = drive(base + "/api/process", args.requests, args.concurrency,
+                                        args.question_id, zip_bytes)
+    finally:
+        proc.terminate()
+        proc.wait()
+        reader.join(timeout=5)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else float("nan")
+    print(f"{name:<30} {args.requests / wall:>8.1f} req/s  p50 {statistics.median(latencies) if latencies else float('nan'):.3f}s"
+          f"  p95 {p95:.3f}s  logs {log_bytes[0] / args.requests / 1024:>7.1f} KB/req  errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM latency per call (seconds)")
+    parser.add_argument("--drain-kbps", type=float, default=512, help="log pipeline read rate (0 = unthrottled)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--question-id", default="RJSCPFGWRF")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(latency=args.latency)
+    # Every request misses the answer cache and goes to the LLM classifier, so
+    # each one makes both calls and logs both prompts.
+    env = dict(os.environ, REQUEST_URL=stub_url, API_KEY="stub", RESPONSE_CACHE_SIZE="0",
+               LOCAL_CLASSIFIER_ENABLED="0", LOG_LEVEL="INFO")
+    zip_bytes = large_zip()
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"gunicorn {args.workers}w x {args.threads}t, stub latency {args.latency}s per LLM call, "
+          f"log drain {args.drain_kbps or 'unthrottled'} KB/s\n")
+    for name, overrides in CONFIGS:
+        run(name, overrides, env, args, zip_bytes)
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+End-to-end benchmark of /api/process against the LLM stub, with baselines.
+
+Each app (the Flask app under gunicorn, the ASGI app under uvicorn) is started
+against a local llm_stub and driven with a mix of real question ids from
+commands.csv, a generated submission zip per question (its app folder,
+components named after the question, plus node_modules noise) and the
+labelled queries of query_labels_seed.jsonl. Reported per app: throughput,
+errors by status, p50/p95/p99 of the whole request and of every
+Server-Timing stage, and what the stub served.
+
+The stub either answers with canned replies after --latency (spread by
+--jitter, with --error-rate 503s) or replays a recording made with
+llm_stub.py --record (--replay, optionally with --replay-latency). The answer
+cache is off unless --env RESPONSE_CACHE_SIZE=... says otherwise, so every
+request reaches the stub; other app settings can be set the same way.
+
+--save-baseline writes the results as JSON. --baseline compares against one
+and exits 1, listing every regression, when throughput dropped or a p95/p99
+grew by more than --tolerance plus --slack ms: the p99 of the stages that take
+milliseconds (lookup, extract, upload) swings by tens of them between runs.
+benchmarks/baselines/stub.json is such a baseline, recorded with the first
+command below; record your own on the machine you compare on.
+
+    python benchmarks/e2e.py --requests 300 --concurrency 32 --save-baseline benchmarks/baselines/stub.json
+    python benchmarks/e2e.py --requests 300 --concurrency 32 --baseline benchmarks/baselines/stub.json
+    python benchmarks/e2e.py --apps asgi --replay llm_recording.jsonl --replay-latency --env COMBINED_CALL=1
+"""
+import argparse
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from compare_flask_asgi import REPO_ROOT, free_port, wait_until_up
+from llm_stub import start_stub, stub_stats
+
+SEED_LABELS = os.path.join(REPO_ROOT, "query_labels_seed.jsonl")
+COMMANDS_CSV = os.path.join(REPO_ROOT, "commands.csv")
+QUANTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+# Server-Timing entries that are savings, not durations: growing is no regression.
+SAVINGS = {"overlap_saved"}
+
+
+def app_commands(args):
+    return {
+        "flask": [sys.executable, "-m", "gunicorn", "-w", str(args.flask_workers), "--threads",
+                  str(args.flask_threads), "-b", "127.0.0.1:{port}", "main:app"],
+        "asgi": [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", "{port}", "--log-level", "warning"],
+    }
+
+
+def questions(limit):
+    """(question id, app folder name, question content) of the first limit questions in commands.csv."""
+    df = pd.read_csv(COMMANDS_CSV, usecols=["question_command_id", "question_folder_location", "question_content"],
+                     dtype=str, keep_default_na=False).drop_duplicates("question_command_id")
+    return [(row.question_command_id, os.path.basename(row.question_folder_location.rstrip("/")) or "app",
+             row.question_content) for row in df.head(limit).itertuples()]
+
+
+def submission_zip(folder, content, files):
+    """A submission shaped like the real ones: components named after the question's capitalized words."""
+    names = [word for word, _ in Counter(re.findall(r"\b[A-Z][a-z]{3,}\b", content)).most_common(files)]
+    names += [f"Component{i}" for i in range(files - len(names))]
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(f"{folder}/package.json", json.dumps({"name": folder, "dependencies": {"react": "^17.0.0"}}))
+        z.writestr(f"{folder}/node_modules/react/index.js", "module.exports = require('./cjs/react.js')\n" * 200)
+        z.writestr(f"{folder}/src/App.js", "".join(f"import {name} from './components/{name}'\n" for name in names)
+                   + "const App = () => <BrowserRouter><Switch /></BrowserRouter>\nexport default App\n")
+        for name in names:
+            body = "".join(f"  render{name}Part{i} = () => <div className=\"{name.lower()}-{i}\">{{this.state.items[{i}]}}</div>\n"
+                           for i in range(40))
+            z.writestr(f"{folder}/src/components/{name}/index.js",
+                       f"import {{Component}} from 'react'\n\nclass {name} extends Component {{\n{body}}}\n\nexport default {name}\n")
+    return buf.getvalue()
+
+
+def workload(args):
+    """The (query, file name, zip) of every request, cycling through questions and queries."""
+    with open(SEED_LABELS, encoding="utf-8") as f:
+        queries = [json.loads(line)["query"] for line in f if line.strip()]
+    uploads = [(f"{question_id}.zip", submission_zip(folder, content, args.files))
+               for question_id, folder, content in questions(args.questions)]
+    return [(queries[i % len(queries)], *uploads[i % len(uploads)]) for i in range(args.requests)]
+
+
+def parse_server_timing(header):
+    """Server-Timing "stage;dur=12.3, ..." as {stage: seconds}."""
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration) / 1000
+    return stages
+
+
+def drive(url, requests_, concurrency):
+    """Sends every request with the given concurrency; returns (wall seconds, [(status, seconds, stages)])."""
+    def one(request):
+        query, filename, zip_bytes = request
+        start = time.perf_counter()
+        try:
+            r = requests.post(url, data={"query": query}, files={"file": (filename, zip_bytes)}, timeout=600)
+        except requests.RequestException:
+            return "error", time.perf_counter() - start, {}
+        return r.status_code, time.perf_counter() - start, parse_server_timing(r.headers.get("Server-Timing"))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, requests_))
+    return time.perf_counter() - start, results
+
+
+def quantiles(values):
+    values = sorted(values)
+    return {name: round(values[min(len(values) - 1, int(q * len(values)))], 4) for name, q in QUANTILES} \
+        if values else {}
+
+
+def summarize(wall, results):
+    ok = [(seconds, stages) for status, seconds, stages in results if status == 200]
+    stage_names = sorted({stage for _, stages in ok for stage in stages})
+    return {
+        "requests": len(results),
+        "throughput": round(len(ok) / wall, 2),
+        "errors": {str(status): count for status, count in Counter(status for status, _, _ in results).items()
+                   if status != 200},
+        "latency": quantiles([seconds for seconds, _ in ok]),
+        "stages": {stage: quantiles([stages[stage] for _, stages in ok if stage in stages]) for stage in stage_names},
+    }
+
+
+def run_app(name, command, env, args, work, stub_url):
+    port = free_port()
+    proc = subprocess.Popen([arg.format(port=port) for arg in command], cwd=REPO_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_until_up(base + "/")
+        before = stub_stats(stub_url)
+        drive(base + "/api/process", work[:args.warmup], args.concurrency)
+        wall, results = drive(base + "/api/process", work, args.concurrency)
+        after = stub_stats(stub_url)
+    finally:
+        proc.terminate()
+        proc.wait()
+    summary = summarize(wall, results)
+    summary["stub"] = {key: after[key] - before[key] for key in after if isinstance(after[key], int)
+                       and key != "recorded_entries"}
+    report(name, summary)
+    return summary
+
+
+def report(name, summary):
+    latency = summary["latency"]
+    errors = ", ".join(f"{status}: {count}" for status, count in summary["errors"].items()) or "none"
+    print(f"\n{name}: {summary['throughput']:.1f} req/s, errors {errors}, stub {summary['stub']}")
+    print(f"  {'stage':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, values in [("request", latency)] + list(summary["stages"].items()):
+        if values:
+            print(f"  {stage:<16} " + " ".join(f"{values[q] * 1000:>9.1f}" for q, _ in QUANTILES))
+
+
+def regressions(results, baseline, tolerance, slack):
+    """Human-readable regressions of results against a baseline of the same shape."""
+    found = []
+    for app, current in results.items():
+        base = baseline.get("apps", {}).get(app)
+        if base is None:
+            continue
+        if current["throughput"] < base["throughput"] * (1 - tolerance):
+            found.append(f"{app}: throughput {current['throughput']:.1f} req/s < baseline {base['throughput']:.1f}")
+        new_errors, old_errors = sum(current["errors"].values()), sum(base["errors"].values())
+        if new_errors > old_errors:
+            found.append(f"{app}: {new_errors} errors, baseline {old_errors}")
+        pairs = [("request", current["latency"], base["latency"])] + [
+            (stage, values, base["stages"][stage]) for stage, values in current["stages"].items()
+            if stage in base["stages"] and stage not in SAVINGS]
+        for stage, values, old in pairs:
+            for q in ("p95", "p99"):
+                if q in values and q in old and values[q] > old[q] * (1 + tolerance) + slack:
+                    found.append(f"{app}: {stage} {q} {values[q] * 1000:.1f} ms > baseline {old[q] * 1000:.1f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", default="flask,asgi", help="comma-separated: flask, asgi")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--questions", type=int, default=10, help="question ids taken from commands.csv")
+    parser.add_argument("--files", type=int, default=20, help="components in each generated submission")
+    parser.add_argument("--flask-workers", type=int, default=4)
+    parser.add_argument("--flask-threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub latency per LLM call (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="lognormal sigma of the stub latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub calls answered with 503")
+    parser.add_argument("--replay", help="llm_stub recording to answer from")
+    parser.add_argument("--replay-latency", action="store_true", help="replay the recorded latencies")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="app setting (repeatable)")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="fail when the results regressed against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--slack", type=float, default=50.0, help="allowed absolute regression per stage (ms)")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                replay=args.replay, replay_latency=args.replay_latency)
+    env = dict(os.environ, REQUEST_URL=stub_url, API_KEY="stub", RESPONSE_CACHE_SIZE="0", LOG_LEVEL="WARNING")
+    env.update(item.split("=", 1) for item in args.env)
+    work = workload(args)
+    config = {key: getattr(args, key) for key in ("requests", "concurrency", "questions", "files", "flask_workers",
+                                                  "flask_threads", "latency", "jitter", "error_rate", "replay",
+                                                  "replay_latency", "env")}
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.questions} questions, "
+          f"{len(work[0][2]) // 1024} KB zips, stub {'replaying ' + args.replay if args.replay else 'canned'}")
+
+    commands = app_commands(args)
+    results = {}
+    for app in args.apps.split(","):
+        results[app] = run_app(app, commands[app], env, args, work, stub_url)
+    stub.shutdown()
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "apps": results}, f, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("\nWarning: the baseline was recorded with different settings:", baseline.get("config"))
+        found = regressions(results, baseline, args.tolerance, args.slack / 1000)
+        if found:
+            print("\nREGRESSIONS against", args.baseline)
+            for line in found:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
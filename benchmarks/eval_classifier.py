@@ -0,0 +1,88 @@
+"""
+Offline evaluation of the local fast-path classifier against LLM labels.
+
+Labels are JSONL rows of {"query", "query_category"} as written by the app
+when LABEL_LOG_PATH is set. The naive Bayes model is evaluated with k-fold
+cross-validation (trained on the seed labels plus the other folds), so the
+numbers reflect queries the model has not seen.
+
+    python benchmarks/eval_classifier.py --labels llm_labels.jsonl --threshold 0.9
+    python benchmarks/eval_classifier.py            # cross-validates the bundled seed labels
+"""
+import argparse
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_classifier import (  # noqa: E402
+    LOCAL_MODEL_THRESHOLD,
+    SEED_LABELS_PATH,
+    LocalClassifier,
+    NaiveBayesModel,
+    read_labels,
+)
+
+
+def evaluate(examples, seed, folds, threshold, model_threshold):
+    rng = random.Random(0)
+    examples = list(examples)
+    rng.shuffle(examples)
+    rows = []
+    for fold in range(folds):
+        held_out = examples[fold::folds]
+        training = seed + [example for i, example in enumerate(examples) if i % folds != fold]
+        classifier = LocalClassifier(NaiveBayesModel.train(training), threshold=threshold,
+                                     model_threshold=model_threshold)
+        for query, label in held_out:
+            predicted, confidence, source = classifier.predict(query)
+            fast = classifier.classify(query)
+            rows.append((label, predicted, fast["query_category"] if fast else None, source))
+    return rows
+
+
+def report(rows):
+    total = len(rows)
+    fast = [(label, category, source) for label, _, category, source in rows if category is not None]
+    fast_correct = sum(1 for label, category, _ in fast if label == category)
+    raw_correct = sum(1 for label, predicted, _, _ in rows if label == predicted)
+    print(f"queries evaluated:            {total}")
+    print(f"top-1 agreement (no cutoff):  {raw_correct / total:.1%}")
+    print(f"LLM calls saved (fast path):  {len(fast)} ({len(fast) / total:.1%})")
+    if fast:
+        print(f"fast-path agreement with LLM: {fast_correct / len(fast):.1%}")
+        print(f"fast-path by source:          {dict(Counter(source for _, _, source in fast))}")
+    print("\nper category: labelled / fast-path / fast-path correct")
+    for category in sorted({label for label, *_ in rows}):
+        labelled = sum(1 for label, *_ in rows if label == category)
+        answered = [(label, c) for label, c, _ in fast if c == category]
+        correct = sum(1 for label, c in answered if label == c)
+        print(f"  {category:<26} {labelled:>5} {len(answered):>5} {correct:>5}")
+    mistakes = [(label, category) for label, category, _ in fast if label != category]
+    if mistakes:
+        print("\nfast-path disagreements (LLM label -> local label):")
+        for (label, category), count in Counter(mistakes).most_common(10):
+            print(f"  {label} -> {category}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", help="JSONL of LLM-labelled queries; defaults to the seed labels")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--model-threshold", type=float, default=LOCAL_MODEL_THRESHOLD)
+    args = parser.parse_args()
+
+    seed = read_labels(SEED_LABELS_PATH)
+    if args.labels:
+        examples = read_labels(args.labels)
+    else:
+        examples, seed = seed, []
+    rows = evaluate(examples, seed, args.folds, args.threshold, args.model_threshold)
+    report(rows)
+
+
+if __name__ == "__main__":
+    main()
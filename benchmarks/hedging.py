@@ -0,0 +1,95 @@
+"""
+Tail latency and cost of hedged requests and failover (hedging.py) against
+stub endpoints with a slow tail.
+
+Each stub answers in --latency seconds, except --tail-fraction of the calls,
+which take --tail-latency. The same calls are sent through a HedgedClient:
+
+  single endpoint   one stub, no hedging: what the app did before
+  hedged            two stubs, a duplicate after the recent p95 latency
+  failover          the preferred stub answers 503 to everything; the
+                    breaker opens and the calls move to the second stub
+
+Cost is upstream requests per call (1.0 means no duplicates).
+
+    python benchmarks/hedging.py --calls 400 --tail-fraction 0.03 --tail-latency 3
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Read by hedging.py at import time; the stub's latencies are far below the production defaults.
+os.environ.setdefault("LLM_HEDGE_MIN_DELAY", "0.05")
+os.environ.setdefault("LLM_HEDGE_MIN_SAMPLES", "20")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hedging import HedgedClient  # noqa: E402
+from llm_client import LLMClient, LLMError  # noqa: E402
+from llm_stub import start_stub  # noqa: E402
+
+MESSAGES = [{"role": "system", "content": "You are a mentor."}, {"role": "user", "content": "My test fails"}]
+
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(name, urls, hedging, args):
+    client = HedgedClient([LLMClient(url, "stub", max_retries=1, backoff_base=0.05) for url in urls],
+                          hedging=hedging)
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            client.complete(MESSAGES, "stub-model", latency_key="answer")
+        except LLMError:
+            return None
+        return time.perf_counter() - start
+
+    # Fills the latency window the hedge delay is taken from.
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.warmup)))
+        before = client.stats()
+        latencies = list(pool.map(one, range(args.calls)))
+    stats = client.stats()
+    ok = [seconds for seconds in latencies if seconds is not None]
+    upstream = stats["requests"] - before["requests"]
+    hedging_stats = stats["hedging"]
+    print(f"{name:<16} ok {len(ok):>4}/{args.calls}  p50 {statistics.median(ok):.2f}s  p95 {quantile(ok, 0.95):.2f}s"
+          f"  p99 {quantile(ok, 0.99):.2f}s  max {max(ok):.2f}s  cost {upstream / args.calls:.2f}"
+          f"  hedged {hedging_stats['hedged']} (won {hedging_stats['hedge_wins']})"
+          f"  failovers {hedging_stats['failovers']}"
+          f"  breakers {','.join(endpoint['breaker'] for endpoint in stats['endpoints'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=40, help="calls before measuring")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1, help="stub latency of a normal call (seconds)")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="stub latency of a slow-tail call")
+    parser.add_argument("--tail-fraction", type=float, default=0.03, help="fraction of calls in the slow tail")
+    args = parser.parse_args()
+    logging.getLogger("hedging").setLevel(logging.ERROR)  # one failover warning per call otherwise
+
+    stubs = [start_stub(latency=args.latency, tail_latency=args.tail_latency, tail_fraction=args.tail_fraction)
+             for _ in range(2)]
+    down, down_url = start_stub(latency=args.latency, error_rate=1.0)
+    primary, secondary = (url for _, url in stubs)
+    print(f"{args.calls} calls, concurrency {args.concurrency}, stub latency {args.latency}s, "
+          f"{args.tail_fraction:.0%} of calls take {args.tail_latency}s\n")
+    run("single endpoint", [primary], False, args)
+    run("hedged", [primary, secondary], True, args)
+    run("failover", [down_url, secondary], False, args)
+    for server, _ in stubs + [(down, down_url)]:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-category cost of the local pipeline steps with eager versus lazy inputs.
+
+Eager is what /api/process used to do for every query: look up the question
+and extract the zip, then build the prompt. Lazy loads only the inputs the
+category's route lists (pipeline.ANSWER_ROUTES), so publishing, IDE,
+conceptual and mentor-required queries skip both. This is the latency saved
+whenever the category is known up front (local classifier) and the CPU saved
+in every case; with PREFETCH_INPUTS=1 an LLM classification still hides the
+loads of code-based categories behind its round trip.
+
+The submission store is disabled so every run really extracts the zip.
+
+    python benchmarks/lazy_inputs.py --runs 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["SUBMISSION_STORE_MAX_BYTES"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compare_logging import large_zip  # noqa: E402
+from pipeline import QUESTION, USER_CODE, StageTimings, input_loaders, plan_answer, required_inputs  # noqa: E402
+
+CATEGORIES = [
+    "Test case failures",
+    "Fix specific errors",
+    "Implementation guidance",
+    "Code publishing issue",
+    "IDE issue",
+    "Conceptual doubts",
+    "Other",
+]
+
+
+def prepare(question_id, zip_bytes, category, names, pool):
+    """Loads the named inputs in parallel and plans the answer; returns (wall, cpu) seconds."""
+    analysis = {"user_query_summary": "My login form does not redirect after a successful login",
+                "error_description": "", "query_category": category}
+    timings = StageTimings()
+    loaders = input_loaders(question_id, zip_bytes)
+    wall, cpu = time.perf_counter(), time.process_time()
+    futures = {name: pool.submit(timings.timed, *loaders[name]) for name in names}
+    inputs = {name: future.result() for name, future in futures.items()}
+    plan_answer(question_id, analysis, inputs.get(QUESTION), inputs.get(USER_CODE), timings)
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--files", type=int, default=60, help="files in the generated submission")
+    parser.add_argument("--question-id", default="RJSCPFGWRF")
+    args = parser.parse_args()
+
+    zip_bytes = large_zip(files=args.files)
+    print(f"{args.runs} runs per category, {len(zip_bytes) // 1024} KB zip with {args.files} files\n")
+    print(f"{'category':<26} {'inputs':<20} {'eager ms':>9} {'lazy ms':>9} {'saved ms':>9} {'cpu saved ms':>13}")
+    with ThreadPoolExecutor(2) as pool:
+        prepare(args.question_id, zip_bytes, CATEGORIES[0], (QUESTION, USER_CODE), pool)  # warm-up
+        for category in CATEGORIES:
+            needed = required_inputs(category)
+            eager = [prepare(args.question_id, zip_bytes, category, (QUESTION, USER_CODE), pool)
+                     for _ in range(args.runs)]
+            lazy = [prepare(args.question_id, zip_bytes, category, needed, pool) for _ in range(args.runs)]
+            eager_ms = statistics.median(wall for wall, _ in eager) * 1000
+            lazy_ms = statistics.median(wall for wall, _ in lazy) * 1000
+            cpu_saved = (statistics.median(cpu for _, cpu in eager) - statistics.median(cpu for _, cpu in lazy)) * 1000
+            print(f"{category:<26} {', '.join(sorted(needed)) or '-':<20} {eager_ms:>9.1f} {lazy_ms:>9.1f}"
+                  f" {eager_ms - lazy_ms:>9.1f} {cpu_saved:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Local stand-in for the chat-completions endpoint.
+
+Answers classification prompts with a canned JSON classification, combined
+classify+answer prompts (COMBINED_CALL) with both in their tagged format and
+every other prompt with a short mentor reply, after a configurable delay.
+Requests with "stream": true get the reply as chat-completion chunks
+(server-sent events), one word every --token-delay seconds. With
+--max-concurrent, calls beyond that many in flight get a 429 with
+Retry-After, like a rate-limited provider. --tail-fraction of the calls take
+--tail-latency instead of --latency (a slow tail for hedging to cut),
+--jitter spreads the others lognormally around --latency, and --error-rate
+of them get a 503. Point REQUEST_URL at it to exercise the apps without
+calling the paid API.
+
+Real replies can be recorded once and replayed for free:
+
+    # proxies to the real API and appends every exchange to the recording
+    python benchmarks/llm_stub.py --record llm_recording.jsonl --upstream "$REQUEST_URL" --upstream-key "$API_KEY"
+    # answers from the recording: the exact prompt's reply when it was recorded,
+    # otherwise another recorded reply of the same kind (classification, combined, answer)
+    python benchmarks/llm_stub.py --replay llm_recording.jsonl --replay-latency
+
+With --replay-latency, replies take as long as they did when recorded
+(times --latency-scale) instead of --latency. GET /stats reports the calls
+served, replayed, missed and recorded.
+
+    python benchmarks/llm_stub.py --port 9100 --latency 0.5 --token-delay 0.02
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+CLASSIFICATION = {
+    "user_query_summary": "The user reports that test cases are failing for the login route.",
+    "error_description": "",
+    "query_category": "Test case failures",
+}
+
+
+ANSWER = (
+    "Hi,\n\nCheck the handler passed to onSubmit: it has to call event.preventDefault() "
+    "before making the login request, otherwise the page reloads and the jwt_token cookie is never set.\n"
+)
+
+
+def usage_for(messages, content):
+    """Rough token counts (4 characters per token) in the API's usage shape."""
+    prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+    completion_tokens = len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def call_kind(messages):
+    """Which of the app's prompts a request carries: "combined", "classify" or "answer"."""
+    system_prompt = (messages or [{}])[0].get("content") or ""
+    if "<classification>" in system_prompt:
+        return "combined"
+    if "classify user query" in system_prompt:
+        return "classify"
+    return "answer"
+
+
+def canned_reply(kind):
+    if kind == "combined":
+        return f"<classification>\n{json.dumps(CLASSIFICATION)}\n</classification>\n<answer>\n{ANSWER}</answer>"
+    if kind == "classify":
+        return json.dumps(CLASSIFICATION)
+    return ANSWER
+
+
+def exchange_key(body):
+    """Identifies a request by its model and messages."""
+    return hashlib.sha256(json.dumps([body.get("model"), body.get("messages")], sort_keys=True).encode()).hexdigest()
+
+
+class Recording:
+    """
+    Recorded exchanges, one JSON object per line: key, kind, content, usage and
+    the upstream latency in seconds. Replays exact matches first, then cycles
+    through the recorded replies of the same kind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.by_key = {}
+        self.by_kind = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+        except FileNotFoundError:
+            pass
+        self._cycles = {kind: itertools.cycle(entries) for kind, entries in self.by_kind.items()}
+
+    def _add(self, entry):
+        self.by_key[entry["key"]] = entry
+        self.by_kind.setdefault(entry["kind"], []).append(entry)
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def find(self, body):
+        """(entry, exact) for a request; entry is None when nothing of its kind was recorded."""
+        entry = self.by_key.get(exchange_key(body))
+        if entry is not None:
+            return entry, True
+        with self._lock:
+            cycle = self._cycles.get(call_kind(body.get("messages")))
+            return (next(cycle), False) if cycle else (None, False)
+
+    def append(self, entry):
+        with self._lock:
+            self._add(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+def make_handler(latency, token_delay=0.0, max_concurrent=0, tail_latency=0.0, tail_fraction=0.0, error_rate=0.0,
+                 jitter=0.0, recording=None, upstream=None, upstream_key=None, replay_latency=False,
+                 latency_scale=1.0):
+    in_flight = [0]
+    lock = threading.Lock()
+    counts = {"calls": 0, "replayed": 0, "replayed_exact": 0, "missed": 0, "recorded": 0}
+    session = requests.Session()
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def delay():
+        if random.random() < tail_fraction:
+            return tail_latency
+        return latency * random.lognormvariate(0, jitter) if jitter else latency
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                payload = json.dumps(dict(counts, recorded_entries=len(recording) if recording else 0)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            count("calls")
+            with lock:
+                limited = bool(max_concurrent) and in_flight[0] >= max_concurrent
+                if not limited:
+                    in_flight[0] += 1
+            if limited:
+                self.rate_limited()
+                return
+            try:
+                if random.random() < error_rate:
+                    self.unavailable()
+                else:
+                    self.reply(body)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        def rate_limited(self):
+            payload = b'{"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}'
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def unavailable(self):
+            payload = b'{"error": {"message": "Service unavailable", "type": "server_error"}}'
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def record(self, body):
+            """
+            Asks the real API (never streamed) and records the exchange; returns the
+            entry, or None after passing an upstream error on unrecorded.
+            """
+            start = time.perf_counter()
+            response = session.post(upstream, json=dict(body, stream=False, stream_options=None),
+                                    headers={"Authorization": f"Bearer {upstream_key}"}, timeout=600)
+            if response.status_code >= 400:
+                self.send_response(response.status_code)
+                self.send_header("Content-Type", response.headers.get("Content-Type", "application/json"))
+                self.send_header("Content-Length", str(len(response.content)))
+                if "Retry-After" in response.headers:
+                    self.send_header("Retry-After", response.headers["Retry-After"])
+                self.end_headers()
+                self.wfile.write(response.content)
+                return None
+            data = response.json()
+            entry = {"key": exchange_key(body), "kind": call_kind(body.get("messages")),
+                     "content": data["choices"][0]["message"]["content"], "usage": data.get("usage") or {},
+                     "latency": round(time.perf_counter() - start, 3)}
+            recording.append(entry)
+            count("recorded")
+            return entry
+
+        def reply(self, body):
+            messages = body.get("messages", [])
+            if upstream:
+                # Exchanges already in the recording aren't paid for twice.
+                entry = recording.by_key.get(exchange_key(body)) or self.record(body)
+                if entry is None:
+                    return
+                content, usage, wait = entry["content"], entry["usage"], 0.0
+            else:
+                entry, exact = recording.find(body) if recording else (None, False)
+                if entry is not None:
+                    count("replayed_exact" if exact else "replayed")
+                    content, usage = entry["content"], entry["usage"] or usage_for(messages, entry["content"])
+                    wait = entry["latency"] * latency_scale if replay_latency else delay()
+                else:
+                    if recording:
+                        count("missed")
+                    content = canned_reply(call_kind(messages))
+                    usage, wait = usage_for(messages, content), delay()
+            time.sleep(wait)
+            if body.get("stream"):
+                self.stream(content, usage if (body.get("stream_options") or {}).get("include_usage") else None)
+                return
+            payload = json.dumps({
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def stream(self, content, usage=None):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in content.split(" "):
+                chunk = {"choices": [{"delta": {"content": word + " "}, "finish_reason": None}]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                time.sleep(token_delay)
+            if usage:
+                self.write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubHandler
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up (e.g. a benchmark server being stopped) are expected.
+        pass
+
+
+def start_stub(port=0, latency=0.5, token_delay=0.0, max_concurrent=0, tail_latency=0.0, tail_fraction=0.0,
+               error_rate=0.0, jitter=0.0, replay=None, record=None, upstream=None, upstream_key=None,
+               replay_latency=False, latency_scale=1.0):
+    """
+    Starts the stub on a background thread; returns (server, url). max_concurrent=0 never rate limits.
+    replay or record name a recording file; recording also needs the upstream URL and key.
+    """
+    if record and not upstream:
+        raise ValueError("Recording needs the upstream endpoint to record from")
+    recording = Recording(record or replay) if (record or replay) else None
+    handler = make_handler(latency, token_delay, max_concurrent, tail_latency, tail_fraction, error_rate, jitter,
+                           recording, upstream if record else None, upstream_key, replay_latency, latency_scale)
+    server = StubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+def stub_stats(url):
+    """The /stats counters of a running stub, given its chat-completions URL."""
+    return requests.get(url.rsplit("/v1/", 1)[0] + "/stats", timeout=5).json()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed words")
+    parser.add_argument("--max-concurrent", type=int, default=0,
+                        help="answer 429 beyond this many calls in flight (0 = unlimited)")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="seconds before a slow-tail reply")
+    parser.add_argument("--tail-fraction", type=float, default=0.0, help="fraction of calls in the slow tail")
+    parser.add_argument("--jitter", type=float, default=0.0, help="lognormal sigma of the latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with a 503")
+    parser.add_argument("--replay", help="recording to answer from")
+    parser.add_argument("--replay-latency", action="store_true", help="replay the recorded latencies")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier of the replayed latencies")
+    parser.add_argument("--record", help="recording to append the upstream exchanges to")
+    parser.add_argument("--upstream", help="real chat-completions URL to record from")
+    parser.add_argument("--upstream-key", help="API key of the upstream endpoint")
+    args = parser.parse_args()
+    server, url = start_stub(args.port, args.latency, args.token_delay, args.max_concurrent,
+                             args.tail_latency, args.tail_fraction, args.error_rate, args.jitter,
+                             args.replay, args.record, args.upstream, args.upstream_key,
+                             args.replay_latency, args.latency_scale)
+    print(f"LLM stub listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,92 @@
+"""
+A burst of requests against a rate-limited LLM, with and without the
+adaptive concurrency limiter (LLM_LIMITER_ENABLED).
+
+The stub answers 429 once more than --provider-limit calls are in flight.
+Without the limiter every request goes straight upstream and the overflow
+burns its retries on 429s; with it, calls queue in the app and the limit
+settles just under the provider's. The app runs as a single uvicorn process
+because the limiter is per process.
+
+    python benchmarks/rate_limit_burst.py --requests 200 --concurrency 100 --provider-limit 8
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from compare_flask_asgi import REPO_ROOT, free_port, sample_zip, wait_until_up
+from llm_stub import start_stub
+
+CONFIGS = [
+    ("no limiter", {"LLM_LIMITER_ENABLED": "0"}),
+    ("adaptive limiter", {"LLM_LIMITER_ENABLED": "1"}),
+]
+
+
+def burst(url, total, concurrency, question_id, zip_bytes):
+    """Fires total requests at once; returns (wall seconds, [(latency, status)])."""
+    def one(i):
+        start = time.perf_counter()
+        # Distinct queries, so coalescing and the answer cache don't hide the burst.
+        r = requests.post(url, data={"query": f"My login test cases are failing ({i})"},
+                          files={"file": (f"{question_id}.zip", zip_bytes)}, timeout=300)
+        return time.perf_counter() - start, r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    return time.perf_counter() - start, results
+
+
+def run(name, overrides, env, args, zip_bytes):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=dict(env, **overrides), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_until_up(base + "/")
+        wall, results = burst(base + "/api/process", args.requests, args.concurrency, args.question_id, zip_bytes)
+        stats = requests.get(base + "/api/llm/stats", timeout=5).json()
+    finally:
+        proc.terminate()
+        proc.wait()
+    statuses = Counter(status for _, status in results)
+    latencies = sorted(latency for latency, status in results if status == 200)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else float("nan")
+    upstream_429 = stats["status_codes"].get("429", stats["status_codes"].get(429, 0))
+    print(f"{name:<18} ok {statuses[200]:>4}  503 {statuses[503]:>4}  other {sum(statuses.values()) - statuses[200] - statuses[503]:>4}"
+          f"  p50 {statistics.median(latencies) if latencies else float('nan'):.2f}s  p95 {p95:.2f}s"
+          f"  wall {wall:.1f}s  upstream 429s {upstream_429}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency per call (seconds)")
+    parser.add_argument("--provider-limit", type=int, default=8, help="stub's concurrent calls before 429")
+    parser.add_argument("--question-id", default="RJSCPFGWRF")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(latency=args.latency, max_concurrent=args.provider_limit)
+    env = dict(os.environ, REQUEST_URL=stub_url, API_KEY="stub", RESPONSE_CACHE_SIZE="0",
+               LOCAL_CLASSIFIER_ENABLED="0", LOG_LEVEL="WARNING")
+    zip_bytes = sample_zip()
+    print(f"{args.requests} requests, concurrency {args.concurrency}, stub latency {args.latency}s, "
+          f"provider limit {args.provider_limit} concurrent calls\n")
+    for name, overrides in CONFIGS:
+        run(name, overrides, env, args, zip_bytes)
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
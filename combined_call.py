@@ -0,0 +1,118 @@
+"""
+Single-call classification and answer (opt-in, COMBINED_CALL=1).
+
+Normally a query the local classifier can't place costs two reasoner round
+trips: the classification, then the answer for its category. In combined
+mode one call does both. Its system prompt is the classification prompt plus
+the instructions of every code-based answer route (pipeline.ANSWER_ROUTES
+consuming ISSUE_CONTEXT), and its user prompt is the issue context built from
+the raw query, so the question and the user's code are loaded before the call
+instead of after it. The reply carries the classification JSON and, for those
+categories, the answer:
+
+    <classification>{"user_query_summary": ..., "query_category": ...}</classification>
+    <answer>...</answer>
+
+Publishing, IDE and conceptual queries and mentor-required ones come back with
+an empty answer and are answered by their own prompt as usual. A reply without
+a parseable classification falls back to the two-call path; one whose answer
+was cut off before </answer> keeps its classification and is answered by a
+second call, and is never cached.
+
+Only /api/process and jobs use it; the streaming endpoint keeps two calls so
+the answer streams on its own. Compare both modes with
+benchmarks/compare_combined.py before turning it on.
+"""
+import os
+import re
+import threading
+from collections import namedtuple
+
+import metrics
+from context_builder import build_code_context
+from pipeline import ANSWER_ROUTES, ISSUE_CONTEXT, build_issue_context, parse_classification, route_for
+from prompts import get_classify_and_answer_prompt
+from query_classifier import CATEGORIES
+from response_cache import answer_cache_key
+
+COMBINED_CALL = os.getenv("COMBINED_CALL", "0") == "1"
+
+COMBINED_CALLS = metrics.registry.counter(
+    "mentor_combined_calls_total",
+    "Combined classify+answer calls by outcome (answered, second_call, unparsed, skipped).")
+
+# Routes answered in the combined reply, and the classifier categories they cover.
+ANSWERED_ROUTES = tuple(
+    route for route in ANSWER_ROUTES
+    if route.inputs == ISSUE_CONTEXT and any(category in CATEGORIES for category in route.categories)
+)
+# The code routes' prompts don't depend on the query text.
+SYSTEM_PROMPT = get_classify_and_answer_prompt([
+    (tuple(category for category in route.categories if category in CATEGORIES), route.prompt(""))
+    for route in ANSWERED_ROUTES
+])
+
+CLASSIFICATION_RE = re.compile(r"<classification>(.*?)</classification>", re.DOTALL)
+ANSWER_RE = re.compile(r"<answer>(.*?)</answer>", re.DOTALL)
+
+# The prompts of one combined call; cache_key identifies its raw reply in the answer cache.
+CombinedRequest = namedtuple("CombinedRequest", ["system_prompt", "user_prompt", "files_sent", "cache_key"])
+
+
+def build_request(question_id, user_query, question_details, user_files, timings):
+    """The combined call for a query, with the user's files ranked against the raw query."""
+    with timings.stage("context"):
+        user_code, files_sent = build_code_context(user_files or [], user_query,
+                                                   question_details["question_test_cases"])
+    user_prompt = build_issue_context(user_query, question_details["question_context"], user_code)
+    cache_key = answer_cache_key(question_id, user_query, "combined", SYSTEM_PROMPT, user_code,
+                                 question_details["question_context"])
+    return CombinedRequest(SYSTEM_PROMPT, user_prompt, files_sent, cache_key)
+
+
+def parse_reply(reply):
+    """
+    Splits a combined reply into (analysis_result, answer); answer is "" when the
+    reply has none and None when it was cut short (max_tokens, a dropped
+    connection) before </answer>. Raises ValueError when there is no valid
+    classification.
+    """
+    match = CLASSIFICATION_RE.search(reply)
+    if match is None:
+        raise ValueError("No <classification> block in the reply")
+    analysis_result = parse_classification(match.group(1).strip())
+    if not isinstance(analysis_result, dict) or not analysis_result.get("query_category"):
+        raise ValueError("The classification has no query_category")
+    answer = ANSWER_RE.search(reply, match.end())
+    if answer is None:
+        return analysis_result, None if "<answer>" in reply[match.end():] else ""
+    return analysis_result, answer.group(1).strip()
+
+
+def answered(analysis_result, answer):
+    """True when the reply's answer can be used as is: a code-based category, answered."""
+    return bool(answer) and route_for(analysis_result["query_category"]) in ANSWERED_ROUTES
+
+
+class _Tracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"answered": 0, "second_call": 0, "unparsed": 0, "skipped": 0}
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+        COMBINED_CALLS.inc(outcome=outcome)
+
+    def stats(self):
+        with self._lock:
+            calls = self.counts["answered"] + self.counts["second_call"] + self.counts["unparsed"]
+            return dict(
+                self.counts,
+                enabled=COMBINED_CALL,
+                single_call_rate=self.counts["answered"] / calls if calls else 0.0,
+                fallback_rate=self.counts["unparsed"] / calls if calls else 0.0,
+            )
+
+
+tracker = _Tracker()
@@ -0,0 +1,257 @@
+"""
+Adaptive concurrency limit for calls to the LLM API.
+
+At most `limit` calls are in flight; the rest wait in a bounded priority
+queue (classification ahead of answers, since every request needs one before
+it can make the other). The limit grows by about one per round of successful
+calls and is halved when the API answers 429 (AIMD), so bursts settle just
+under the provider's rate limit instead of all failing at once.
+
+A call that can't be queued, or whose request deadline passes while queued,
+raises Overloaded, which the apps turn into a 503 with Retry-After.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+LLM_LIMITER_ENABLED = os.getenv("LLM_LIMITER_ENABLED", "1") == "1"
+LLM_CONCURRENCY_INITIAL = float(os.getenv("LLM_CONCURRENCY_INITIAL", 16))
+LLM_CONCURRENCY_MIN = float(os.getenv("LLM_CONCURRENCY_MIN", 1))
+LLM_CONCURRENCY_MAX = float(os.getenv("LLM_CONCURRENCY_MAX", 64))
+LLM_QUEUE_DEPTH = int(os.getenv("LLM_QUEUE_DEPTH", 200))
+# Longest a call waits for a slot when its request has no earlier deadline.
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 30))
+# Whole-request budget, set per request by the apps (see start_request_deadline).
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 120))
+
+PRIORITY_CLASSIFY = 0
+PRIORITY_ANSWER = 1
+# Speculative answers (see speculation.py) only use capacity nobody else is waiting for.
+PRIORITY_SPECULATIVE = 2
+
+# Halve on 429, at most once per cooldown so one burst of 429s counts once.
+DECREASE_FACTOR = 0.5
+DECREASE_COOLDOWN = 1.0
+
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+def start_request_deadline(budget=REQUEST_DEADLINE):
+    """Starts the current request's deadline (time.monotonic based)."""
+    request_deadline.set(time.monotonic() + budget)
+
+
+class Overloaded(Exception):
+    """No LLM slot could be had in time; retry after retry_after seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _AIMDLimit:
+    """
+    Limit bookkeeping and counters shared by the thread and asyncio limiters.
+    """
+
+    def __init__(self, initial=LLM_CONCURRENCY_INITIAL, minimum=LLM_CONCURRENCY_MIN,
+                 maximum=LLM_CONCURRENCY_MAX, queue_depth=LLM_QUEUE_DEPTH, queue_timeout=LLM_QUEUE_TIMEOUT):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self._call_seconds = 5.0  # moving average; seeds Retry-After before any call finishes
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "rate_limited": 0, "decreases": 0}
+
+    def _adjust(self, status_code):
+        """Applies one upstream status to the limit; True when the limit grew."""
+        if status_code == 429:
+            self.counters["rate_limited"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_COOLDOWN:
+                self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+                self._last_decrease = now
+                self.counters["decreases"] += 1
+            return False
+        if status_code < 400 and self.limit < self.maximum:
+            before = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            return int(self.limit) > before
+        return False
+
+    def _record_duration(self, seconds):
+        self._call_seconds += 0.1 * (seconds - self._call_seconds)
+
+    def retry_after(self):
+        """Seconds until the current queue should have drained, for the Retry-After header."""
+        rounds = len(self._waiting) / max(1, int(self.limit)) + 1
+        return max(1, min(60, math.ceil(rounds * self._call_seconds)))
+
+    def _try_admit(self):
+        """Takes a slot when one is free and nobody is waiting for it; never queues."""
+        if self._waiting or self._in_flight >= int(self.limit):
+            return False
+        self._in_flight += 1
+        self.counters["admitted"] += 1
+        return True
+
+    def _wait_timeout(self):
+        deadline = request_deadline.get()
+        timeout = self.queue_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        return timeout
+
+    def _stats(self):
+        return dict(self.counters, limit=round(self.limit, 2), in_flight=self._in_flight, queued_now=len(self._waiting),
+                    avg_call_seconds=round(self._call_seconds, 3))
+
+
+class AdaptiveLimiter(_AIMDLimit):
+    """
+    Thread-based limiter for the Flask app.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._cond = threading.Condition()
+
+    def observe_status(self, status_code):
+        """Upstream status listener (LLMClient.status_listeners)."""
+        with self._cond:
+            if self._adjust(status_code):
+                self._cond.notify_all()
+
+    def try_acquire(self):
+        """A slot if one is free right now (release() it when done), for extra calls like hedges."""
+        with self._cond:
+            return self._try_admit()
+
+    def acquire(self, priority):
+        """Blocks until a slot is free; raises Overloaded when the queue is full or time runs out."""
+        with self._cond:
+            if self._try_admit():
+                return
+            if len(self._waiting) >= self.queue_depth:
+                self.counters["rejected"] += 1
+                raise Overloaded("Too many requests are waiting for the LLM", self.retry_after())
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            self.counters["queued"] += 1
+            deadline = time.monotonic() + self._wait_timeout()
+            try:
+                while self._waiting[0] != entry or self._in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["timed_out"] += 1
+                        raise Overloaded("Timed out waiting for the LLM", self.retry_after())
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            self.counters["admitted"] += 1
+            # The next waiter may fit as well.
+            self._cond.notify_all()
+
+    def release(self, seconds=None):
+        with self._cond:
+            self._in_flight -= 1
+            if seconds is not None:
+                self._record_duration(seconds)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority):
+        self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self):
+        with self._cond:
+            return self._stats()
+
+
+class AsyncAdaptiveLimiter(_AIMDLimit):
+    """
+    asyncio limiter for the ASGI app; must only be used from one event loop.
+    """
+
+    def observe_status(self, status_code):
+        if self._adjust(status_code):
+            self._wake()
+
+    def _wake(self):
+        while self._waiting and self._in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            self._in_flight += 1
+            self.counters["admitted"] += 1
+            future.set_result(None)
+
+    def try_acquire(self):
+        return self._try_admit()
+
+    async def acquire(self, priority):
+        if self._try_admit():
+            return
+        if len(self._waiting) >= self.queue_depth:
+            self.counters["rejected"] += 1
+            raise Overloaded("Too many requests are waiting for the LLM", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiting, entry)
+        self.counters["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(0.0, self._wait_timeout()))
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as we gave up; hand it on.
+                self.release()
+            else:
+                future.cancel()
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters["timed_out"] += 1
+                raise Overloaded("Timed out waiting for the LLM", self.retry_after()) from None
+            raise
+
+    def release(self, seconds=None):
+        self._in_flight -= 1
+        if seconds is not None:
+            self._record_duration(seconds)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority):
+        await self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self):
+        return self._stats()
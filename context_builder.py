@@ -0,0 +1,171 @@
+"""
+Selects which of the user's files go into the prompt.
+
+Known noise (dependencies, lockfiles, build output, tooling config) is dropped,
+the remaining files are ranked by lexical relevance to the query, and the best
+ones are packed into a token budget.
+"""
+import math
+import os
+import posixpath
+import re
+from collections import Counter, namedtuple
+
+from zip_ingest import format_user_code
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 12000))
+# Don't bother including a truncated file when fewer tokens than this are left.
+MIN_PARTIAL_TOKENS = 200
+
+NOISE_DIRS = {
+    "node_modules", "build", "dist", "coverage", ".git", ".next", ".cache",
+    "__MACOSX", ".vscode", ".idea", "__fixtures__", "__snapshots__",
+}
+NOISE_FILES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", ".DS_Store", ".gitignore",
+    ".npmrc", ".editorconfig", ".prettierignore", ".eslintignore", "LICENSE",
+}
+NOISE_PREFIXES = (".eslintrc", ".prettierrc", ".babelrc", "jest.config", "setupTests")
+NOISE_SUFFIXES = (".map", ".min.js", ".min.css", ".snap", ".lock", ".log", ".svg")
+
+# Source files are what the mentor prompts reason about; tests and docs rarely are.
+SOURCE_EXTENSIONS = {".js", ".jsx", ".ts", ".tsx", ".css", ".html", ".py", ".json"}
+TEST_MARKERS = (".test.", ".spec.", "__tests__/")
+
+TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+STOPWORDS = {
+    "the", "and", "for", "with", "this", "that", "from", "are", "not", "should",
+    "when", "then", "have", "has", "was", "but", "you", "your", "can",
+    "will", "element", "html", "text", "content", "consist", "const", "return",
+    "import", "export", "default", "function", "class", "props", "true", "false",
+}
+
+
+# A user file with its term counts, computed once before ranking.
+IndexedFile = namedtuple("IndexedFile", ["name", "text", "terms"])
+
+
+def estimate_tokens(text):
+    """Rough token count; ~4 characters per token for code and English."""
+    return len(text) // 4 + 1
+
+
+def tokenize(text):
+    """Lower-cased identifier-ish terms, with camelCase identifiers also split into parts."""
+    terms = []
+    for word in TOKEN_RE.findall(text):
+        lowered = word.lower()
+        if lowered not in STOPWORDS:
+            terms.append(lowered)
+        parts = CAMEL_RE.split(word)
+        if len(parts) > 1:
+            terms.extend(p.lower() for p in parts if len(p) > 2 and p.lower() not in STOPWORDS)
+    return terms
+
+
+def is_noise(name):
+    """True for paths that never help answer a query (dependencies, lockfiles, build output, config)."""
+    parts = name.split("/")
+    if any(part in NOISE_DIRS for part in parts[:-1]):
+        return True
+    base = parts[-1]
+    return (
+        base in NOISE_FILES
+        or base.startswith(NOISE_PREFIXES)
+        or base.endswith(NOISE_SUFFIXES)
+        or base.startswith("._")
+    )
+
+
+def prior_weight(name):
+    """Relevance multiplier from the path alone."""
+    ext = posixpath.splitext(name)[1].lower()
+    weight = 1.0 if ext in SOURCE_EXTENSIONS else 0.5
+    if any(marker in name for marker in TEST_MARKERS):
+        weight *= 0.3
+    if "/src/" in f"/{name}":
+        weight *= 1.5
+    if posixpath.basename(name) in ("package.json", "README.md"):
+        weight *= 0.4
+    return weight
+
+
+def index_files(files):
+    """
+    Drops noise paths and tokenizes the remaining (name, text) tuples.
+    This doesn't depend on the query, so it can run before classification finishes.
+    """
+    return [
+        IndexedFile(name, text, Counter(tokenize(f"{name} {text}")))
+        for name, text in files
+        if not is_noise(name)
+    ]
+
+
+def rank_files(indexed, query_text, test_case_text=""):
+    """
+    Scores each IndexedFile by BM25-style term overlap with the query.
+    Query terms weigh fully, test case terms at a fraction; files named in
+    the query get a large boost. Returns (score, name, text) sorted best first.
+    """
+    query_weights = Counter()
+    for term in tokenize(query_text):
+        query_weights[term] += 1.0
+    for term in tokenize(test_case_text):
+        query_weights[term] += 0.3
+
+    if not indexed:
+        return []
+    avg_len = sum(sum(tf.values()) for _, _, tf in indexed) / len(indexed) or 1.0
+    doc_freq = Counter()
+    for _, _, tf in indexed:
+        doc_freq.update(term for term in tf if term in query_weights)
+
+    query_lower = query_text.lower()
+    ranked = []
+    for name, text, tf in indexed:
+        length = sum(tf.values())
+        score = 0.0
+        for term, q_weight in query_weights.items():
+            freq = tf.get(term)
+            if not freq:
+                continue
+            idf = math.log(1 + (len(indexed) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += q_weight * idf * freq * 2.2 / (freq + 1.2 * (0.25 + 0.75 * length / avg_len))
+        stem = posixpath.splitext(posixpath.basename(name))[0].lower()
+        if len(stem) > 2 and stem in query_lower:
+            score += 10.0
+        ranked.append(((score + 1.0) * prior_weight(name), name, text))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+
+def build_code_context(indexed, query_text, test_case_text="", token_budget=None):
+    """
+    Picks the most relevant of the index_files() output that fit in token_budget.
+    Returns (user_code, included_files) where user_code keeps the
+    "=== name ===" layout and included_files lists the chosen paths.
+    """
+    if token_budget is None:
+        token_budget = CONTEXT_TOKEN_BUDGET
+    if not indexed:
+        return "No valid text files found in the zip file.", []
+
+    chosen = {}
+    remaining = token_budget
+    for _, name, text in rank_files(indexed, query_text, test_case_text):
+        cost = estimate_tokens(f"\n\n=== {name} ===\n{text}")
+        if cost <= remaining:
+            chosen[name] = text
+            remaining -= cost
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            keep = (remaining - estimate_tokens(name) - 10) * 4
+            chosen[name] = text[:keep] + "\n... [truncated]"
+            remaining = 0
+        if remaining <= 0:
+            break
+
+    # Present the chosen files in archive order, which keeps related files together.
+    included = [(f.name, chosen[f.name]) for f in indexed if f.name in chosen]
+    return format_user_code(included), [name for name, _ in included]
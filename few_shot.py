@@ -0,0 +1,104 @@
+"""
+Retrieval of the few-shot examples for the IDE and publishing prompts.
+
+The example corpora in prompts.py are split into individual issue/resolution
+entries and indexed with BM25 once at import. Each query gets only its top-k
+entries, so the prompt stays the same size however many resolutions mentors
+add to the corpora.
+"""
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from prompts import ide_queries_examples, publishing_queries_example
+
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", 3))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# A new entry starts at an unindented "- **Issue n:**", "1) ..." or "Additional Templates:" line.
+_ENTRY_START_RE = re.compile(r"^(?:- |\d+\) |[A-Z][\w ]*:\s*$)")
+_TERM_RE = re.compile(r"[a-z0-9]+")
+_URL_RE = re.compile(r"https?://\S+")
+STOPWORDS = {
+    "the", "and", "for", "with", "this", "that", "from", "are", "not", "you", "your",
+    "can", "when", "then", "have", "has", "was", "but", "will", "into", "its",
+    "is", "to", "in", "of", "a", "an", "i", "my", "me", "on", "as", "be", "it", "or",
+    "issue", "error", "below", "above", "once", "check", "try",
+}
+
+
+def terms(text):
+    """Lower-cased words and numbers, URLs and stopwords removed."""
+    return [term for term in _TERM_RE.findall(_URL_RE.sub(" ", text.lower())) if term not in STOPWORDS]
+
+
+def split_examples(corpus):
+    """Splits an example corpus into its top-level entries, dropping section headings."""
+    entries = []
+    for line in corpus.strip("\n").splitlines():
+        if _ENTRY_START_RE.match(line):
+            entries.append([line])
+        elif entries:
+            entries[-1].append(line)
+    return [
+        "\n".join(lines).rstrip() for lines in entries
+        # A heading such as "Additional Templates:" has no body of its own.
+        if len(lines) > 1 or not lines[0].rstrip().endswith(":")
+    ]
+
+
+class ExampleIndex:
+    """
+    BM25 over the entries of one corpus, with postings lists so a query only
+    touches the entries that share a term with it.
+    """
+
+    def __init__(self, examples):
+        self.examples = examples
+        self.postings = defaultdict(list)
+        lengths = []
+        for i, example in enumerate(examples):
+            counts = Counter(terms(example))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self.postings[term].append((i, count))
+        average = (sum(lengths) / len(lengths)) if lengths else 1.0
+        self.length_norm = [BM25_K1 * (1 - BM25_B + BM25_B * length / average) for length in lengths]
+        total = len(examples)
+        self.idf = {
+            term: math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def search(self, query, k=None):
+        """Indexes of the k best matching entries, best first."""
+        if k is None:
+            k = FEW_SHOT_K
+        scores = defaultdict(float)
+        for term in set(terms(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, count in self.postings[term]:
+                scores[i] += idf * count * (BM25_K1 + 1) / (count + self.length_norm[i])
+        return sorted(scores, key=lambda i: (-scores[i], i))[:k]
+
+    def select(self, query, k=None):
+        """
+        The k entries most similar to query, in corpus order, joined as a corpus.
+        The first k entries (the most common issues) are used when nothing matches.
+        """
+        if k is None:
+            k = FEW_SHOT_K
+        chosen = sorted(self.search(query, k)) or list(range(min(k, len(self.examples))))
+        return "\n\n".join(self.examples[i] for i in chosen)
+
+    def __len__(self):
+        return len(self.examples)
+
+
+ide_examples = ExampleIndex(split_examples(ide_queries_examples))
+publishing_examples = ExampleIndex(split_examples(publishing_queries_example))
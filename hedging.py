@@ -0,0 +1,489 @@
+"""
+Hedged requests, failover and circuit breaking across several LLM endpoints.
+
+REQUEST_URL is the preferred endpoint; LLM_FALLBACK_URLS lists more, in order,
+serving the same models (LLM_FALLBACK_API_KEY, or API_KEY). Every endpoint
+has its own pooled client (llm_client.py) and a circuit breaker. After
+LLM_BREAKER_FAILURES consecutive failures (connection errors, timeouts, 429s
+and 5xx once the client's own retries are spent; not a call running out of its
+model's latency budget, which is the model's fault) an endpoint is skipped for
+LLM_BREAKER_RESET seconds. Then one probe call decides whether it closes
+again. A call that fails on one endpoint fails over to the next healthy one.
+An endpoint with an open breaker is only tried when no healthy endpoint is
+left, so a single endpoint behaves as before.
+
+With LLM_HEDGING=1, a completion that hasn't returned after the recent
+LLM_HEDGE_QUANTILE latency of its kind of call (by model and call, once
+LLM_HEDGE_MIN_SAMPLES have been seen; LLM_HEDGE_INITIAL_DELAY before that) is
+sent again. The duplicate goes to the next healthy endpoint, or the same one
+if there is no other. The first success wins. Hedges are capped at
+LLM_HEDGE_MAX_RATIO of all calls, so a slow provider can't double the bill,
+and each takes a slot of the app's LLM concurrency limiter (limiter) when one
+is free; a call with no free slot isn't hedged.
+The async client cancels the losing request, which closes its connection. The
+Flask client can't interrupt a blocked read, so the loser finishes on the
+hedge pool and its reply is dropped.
+
+Streams fail over to the next endpoint when they fail before their first
+token, but are not hedged.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+from llm_client import AsyncLLMClient, LLMClient, LLMError
+
+logger = logging.getLogger(__name__)
+
+LLM_FALLBACK_URLS = [url.strip() for url in os.getenv("LLM_FALLBACK_URLS", "").split(",") if url.strip()]
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.95))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", 30))
+# Never hedge sooner than this, however fast recent calls were.
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", 0.1))
+# Threads running the Flask app's completions while hedging is on.
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", 64))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+# Recent latencies kept per kind of call for the hedge delay.
+LATENCY_WINDOW = 200
+
+HEDGES = metrics.registry.counter(
+    "mentor_llm_hedges_total", "Hedged duplicate LLM requests by outcome (won, lost, failed).")
+FAILOVERS = metrics.registry.counter("mentor_llm_failovers_total", "LLM calls retried on another endpoint.")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def endpoint_fault(error, read_timeout=None):
+    """
+    True for failures that say something about the endpoint rather than the
+    request. Running out of a latency budget the caller set (read_timeout, a
+    model tier's) is the model being slow: it neither counts against the
+    breaker nor fails over, so the caller can escalate to another model.
+    """
+    if read_timeout is not None and error.timed_out:
+        return False
+    return error.status_code is None or error.status_code == 429 or error.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. After reset_timeout it
+    lets a single probe call through (half open); its outcome closes or reopens it.
+    """
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def available(self):
+        """
+        True when a call may be sent now. Claims the probe of a breaker that is due
+        one; a probe that gets no verdict is offered again after another reset_timeout.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+
+class LatencyWindow:
+    """Recent successful latencies of one kind of call, for its hedge delay."""
+
+    def __init__(self):
+        self._samples = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def hedge_delay(self, quantile=LLM_HEDGE_QUANTILE):
+        samples = sorted(self._samples)
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_INITIAL_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, samples[min(len(samples) - 1, int(quantile * len(samples)))])
+
+
+class Endpoint:
+    """One upstream endpoint: its pooled client and circuit breaker."""
+
+    def __init__(self, client):
+        self.client = client
+        self.breaker = CircuitBreaker()
+
+    def record(self, error=None, read_timeout=None):
+        if error is None:
+            self.breaker.success()
+        elif endpoint_fault(error, read_timeout):
+            self.breaker.failure()
+
+
+class _Candidates:
+    """
+    The endpoints one call may try, in order: those whose breaker lets a call
+    through, then the others as a last resort. A breaker is only asked (and
+    its probe claimed) when its endpoint is about to be tried.
+    """
+
+    def __init__(self, endpoints):
+        self._unchecked = list(endpoints)
+        self._skipped = []
+
+    def __bool__(self):
+        return bool(self._unchecked or self._skipped)
+
+    def next(self):
+        while self._unchecked:
+            endpoint = self._unchecked.pop(0)
+            if endpoint.breaker.available():
+                return endpoint
+            self._skipped.append(endpoint)
+        return self._skipped.pop(0)
+
+
+class _HedgedBase:
+    """Endpoint selection, hedge budget and counters shared by the sync and async clients."""
+
+    client_class = None
+
+    def __init__(self, clients, hedging=LLM_HEDGING, max_hedge_ratio=LLM_HEDGE_MAX_RATIO):
+        self.endpoints = [Endpoint(client) for client in clients]
+        self.hedging = hedging
+        self.max_hedge_ratio = max_hedge_ratio
+        # The app's AdaptiveLimiter; a hedge needs a free slot of it, as the calls themselves do.
+        self.limiter = None
+        # Shared with every endpoint's client, so listeners see all upstream statuses.
+        self.status_listeners = []
+        for endpoint in self.endpoints:
+            endpoint.client.status_listeners = self.status_listeners
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self.counts = {"calls": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    @classmethod
+    def from_env(cls, pool_size=None, url=None, api_key=None):
+        """
+        Clients for REQUEST_URL and LLM_FALLBACK_URLS, or for url alone when given
+        (a model tier with its own endpoint).
+        """
+        if url is not None:
+            return cls([cls.client_class.from_env(pool_size, url=url, api_key=api_key)])
+        fallback_key = os.getenv("LLM_FALLBACK_API_KEY") or None
+        return cls([cls.client_class.from_env(pool_size)] + [
+            cls.client_class.from_env(pool_size, url=fallback, api_key=fallback_key) for fallback in LLM_FALLBACK_URLS
+        ])
+
+    @property
+    def url(self):
+        return self.endpoints[0].client.url
+
+    @property
+    def api_key(self):
+        return self.endpoints[0].client.api_key
+
+    @property
+    def pool_size(self):
+        return self.endpoints[0].client.pool_size
+
+    def _candidates(self):
+        return _Candidates(self.endpoints)
+
+    def _window(self, key):
+        with self._lock:
+            return self._latencies.setdefault(key, LatencyWindow())
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _take_hedge(self):
+        """
+        Claims a hedge if they are still under max_hedge_ratio of all calls and the
+        limiter has a free slot, which _hold_hedge_slot gives back.
+        """
+        with self._lock:
+            if self.counts["hedged"] + 1 > self.max_hedge_ratio * self.counts["calls"]:
+                return False
+            if self.limiter is not None and not self.limiter.try_acquire():
+                return False
+            self.counts["hedged"] += 1
+            return True
+
+    def _hold_hedge_slot(self, attempts):
+        """
+        Keeps the hedge's limiter slot until both attempts are done. The caller
+        releases its own slot once one of them wins, while the loser may still
+        be running upstream (the Flask client can't interrupt it).
+        """
+        if self.limiter is None:
+            return
+        lock = threading.Lock()
+        remaining = [len(attempts)]
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.limiter.release()
+
+        for attempt in attempts:
+            attempt.add_done_callback(done)
+
+    def _failed_over(self, endpoint, error):
+        self._count("failovers")
+        FAILOVERS.inc()
+        logger.warning("LLM endpoint failed, trying the next one", extra={"url": endpoint.client.url,
+                                                                          "error": str(error)})
+
+    def stats(self):
+        """The endpoints' request/retry counters summed, plus each endpoint's breaker and the hedging counters."""
+        per_endpoint = [endpoint.client.stats() for endpoint in self.endpoints]
+        stats = {key: sum(s[key] for s in per_endpoint)
+                 for key, value in per_endpoint[0].items() if isinstance(value, int)}
+        stats["status_codes"] = {}
+        for s in per_endpoint:
+            for code, count in s["status_codes"].items():
+                stats["status_codes"][code] = stats["status_codes"].get(code, 0) + count
+        stats["pools"] = [pool for s in per_endpoint for pool in s["pools"]]
+        stats["endpoints"] = [{"url": endpoint.client.url, "breaker": endpoint.breaker.state,
+                               "consecutive_failures": endpoint.breaker.failures, "trips": endpoint.breaker.trips}
+                              for endpoint in self.endpoints]
+        with self._lock:
+            stats["hedging"] = dict(
+                self.counts, enabled=self.hedging,
+                delays={f"{model}/{call}": round(window.hedge_delay(), 3)
+                        for (model, call), window in self._latencies.items()},
+            )
+        return stats
+
+
+class HedgedClient(_HedgedBase):
+    """Drop-in for LLMClient in the Flask app, over one or more endpoints."""
+
+    client_class = LLMClient
+
+    def __init__(self, clients, **kwargs):
+        super().__init__(clients, **kwargs)
+        self._pool = ThreadPoolExecutor(max_workers=LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+
+    def _attempt(self, endpoint, window, messages, model, temperature, read_timeout):
+        start = time.perf_counter()
+        try:
+            result = endpoint.client.complete(messages, model, temperature, read_timeout=read_timeout)
+        except LLMError as e:
+            endpoint.record(e, read_timeout)
+            raise
+        endpoint.record()
+        window.add(time.perf_counter() - start)
+        return result
+
+    def complete(self, messages, model, temperature=0.0, read_timeout=None, latency_key=""):
+        """
+        Runs a chat completion, hedged and failed over as configured; returns
+        (content, usage). latency_key names the kind of call (e.g. "classify")
+        whose recent latencies set the hedge delay.
+        """
+        self._count("calls")
+        window = self._window((model, latency_key))
+        candidates = self._candidates()
+        args = (window, messages, model, temperature, read_timeout)
+        error = None
+        while candidates:
+            endpoint = candidates.next()
+            try:
+                if self.hedging:
+                    return self._hedged(endpoint, candidates, args)
+                return self._attempt(endpoint, *args)
+            except LLMError as e:
+                if not endpoint_fault(e, read_timeout):
+                    raise
+                error = e
+                if candidates:
+                    self._failed_over(endpoint, e)
+        raise error
+
+    def _hedged(self, endpoint, candidates, args):
+        """
+        Sends to endpoint and, after the hedge delay, also to the next candidate
+        (which it then takes off the list); returns the first success.
+        """
+        # Each thread needs its own copy of the context (it carries the trace ID).
+        first = self._pool.submit(contextvars.copy_context().run, self._attempt, endpoint, *args)
+        done, _ = wait([first], timeout=args[0].hedge_delay())
+        if done or not self._take_hedge():
+            return first.result()
+        backup = candidates.next() if candidates else endpoint
+        logger.info("Hedging slow LLM call", extra={"url": backup.client.url})
+        second = self._pool.submit(contextvars.copy_context().run, self._attempt, backup, *args)
+        self._hold_hedge_slot([first, second])
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    won = future is second
+                    if won:
+                        self._count("hedge_wins")
+                    HEDGES.inc(outcome="won" if won else "lost")
+                    for loser in pending:
+                        loser.cancel()  # only if it hasn't started; otherwise its reply is dropped
+                    return future.result()
+                error = future.exception()
+        HEDGES.inc(outcome="failed")
+        raise error
+
+    def chat(self, messages, model, temperature=0.0):
+        return self.complete(messages, model, temperature)[0]
+
+    def stream_chat(self, messages, model, temperature=0.0, usage=None, read_timeout=None):
+        """Streams a chat completion, failing over to the next endpoint until the first token arrives."""
+        self._count("calls")
+        candidates = self._candidates()
+        while candidates:
+            endpoint = candidates.next()
+            started = False
+            stream = endpoint.client.stream_chat(messages, model, temperature, usage=usage, read_timeout=read_timeout)
+            try:
+                for text in stream:
+                    started = True
+                    yield text
+            except LLMError as e:
+                endpoint.record(e, read_timeout)
+                if started or not candidates or not endpoint_fault(e, read_timeout):
+                    raise
+                self._failed_over(endpoint, e)
+                continue
+            finally:
+                # Closed early by the caller: drop the upstream connection now.
+                stream.close()
+            endpoint.record()
+            return
+
+
+class AsyncHedgedClient(_HedgedBase):
+    """Drop-in for AsyncLLMClient in the ASGI app, over one or more endpoints."""
+
+    client_class = AsyncLLMClient
+
+    async def _attempt(self, endpoint, window, messages, model, temperature, read_timeout):
+        start = time.perf_counter()
+        try:
+            result = await endpoint.client.complete(messages, model, temperature, read_timeout=read_timeout)
+        except LLMError as e:
+            endpoint.record(e, read_timeout)
+            raise
+        endpoint.record()
+        window.add(time.perf_counter() - start)
+        return result
+
+    async def complete(self, messages, model, temperature=0.0, read_timeout=None, latency_key=""):
+        """Async counterpart of HedgedClient.complete; the losing hedge is cancelled."""
+        self._count("calls")
+        window = self._window((model, latency_key))
+        candidates = self._candidates()
+        args = (window, messages, model, temperature, read_timeout)
+        error = None
+        while candidates:
+            endpoint = candidates.next()
+            try:
+                if self.hedging:
+                    return await self._hedged(endpoint, candidates, args)
+                return await self._attempt(endpoint, *args)
+            except LLMError as e:
+                if not endpoint_fault(e, read_timeout):
+                    raise
+                error = e
+                if candidates:
+                    self._failed_over(endpoint, e)
+        raise error
+
+    async def _hedged(self, endpoint, candidates, args):
+        first = asyncio.ensure_future(self._attempt(endpoint, *args))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=args[0].hedge_delay())
+            if done or not self._take_hedge():
+                return await first
+            backup = candidates.next() if candidates else endpoint
+            logger.info("Hedging slow LLM call", extra={"url": backup.client.url})
+            second = asyncio.ensure_future(self._attempt(backup, *args))
+            self._hold_hedge_slot([first, second])
+            pending, error = {first, second}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        won = task is second
+                        if won:
+                            self._count("hedge_wins")
+                        HEDGES.inc(outcome="won" if won else "lost")
+                        return task.result()
+                    error = task.exception()
+            HEDGES.inc(outcome="failed")
+            raise error
+        finally:
+            # The loser, or both when the caller is cancelled: closing the request stops the generation.
+            for task in pending:
+                task.cancel()
+
+    async def chat(self, messages, model, temperature=0.0):
+        return (await self.complete(messages, model, temperature))[0]
+
+    async def stream_chat(self, messages, model, temperature=0.0, usage=None, read_timeout=None):
+        """Async counterpart of HedgedClient.stream_chat."""
+        self._count("calls")
+        candidates = self._candidates()
+        while candidates:
+            endpoint = candidates.next()
+            started = False
+            stream = endpoint.client.stream_chat(messages, model, temperature, usage=usage, read_timeout=read_timeout)
+            try:
+                async for text in stream:
+                    started = True
+                    yield text
+            except LLMError as e:
+                endpoint.record(e, read_timeout)
+                if started or not candidates or not endpoint_fault(e, read_timeout):
+                    raise
+                self._failed_over(endpoint, e)
+                continue
+            finally:
+                await stream.aclose()
+            endpoint.record()
+            return
+
+    async def aclose(self):
+        for endpoint in self.endpoints:
+            await endpoint.client.aclose()
@@ -0,0 +1,432 @@
+"""
+Asynchronous job mode for /api/process.
+
+POST /api/jobs stores the query and zip in a local SQLite database and returns
+a job id at once; a pool of workers runs the usual classification and answer
+pipeline and writes the progress and the result back, which clients poll
+(GET /api/jobs/<id>) or subscribe to (GET /api/jobs/<id>/events). The HTTP
+worker is free again as soon as the job is stored, however long the reasoner
+takes.
+
+Jobs survive restarts: a worker holds a job under a lease it renews on every
+progress update, and a job whose lease ran out (its process died) is picked
+up again. Every gunicorn worker runs its own job workers against the same
+database; claiming a job is a single transaction, so each job runs once.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from app_logging import trace_id_var
+from concurrency_limiter import Overloaded
+from llm_client import LLMError
+from zip_ingest import ZipIngestError
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+# Job workers per process; 0 only accepts jobs (another process runs them).
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+# Seconds a running job is held without a progress update before another worker may take it.
+JOB_LEASE = float(os.getenv("JOB_LEASE", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Idle workers look for jobs submitted to other processes this often.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+# Finished and failed jobs are deleted after this many seconds.
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 24 * 60 * 60))
+PRUNE_INTERVAL = 600
+# /api/jobs/<id>/events checks the job this often, and sends a keep-alive when nothing changed for a while.
+JOB_EVENTS_POLL = float(os.getenv("JOB_EVENTS_POLL", 0.5))
+KEEPALIVE_INTERVAL = 15
+# The Flask app's event streams end after this many seconds (each holds a sync worker); clients reconnect.
+JOB_EVENTS_MAX_DURATION = float(os.getenv("JOB_EVENTS_MAX_DURATION", 300))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+# A claimed job, with everything a worker needs to run it.
+Job = namedtuple("Job", ["job_id", "user_query", "question_id", "zip_bytes", "trace_id", "attempts"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    user_query TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    zip_bytes BLOB,
+    trace_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    classification TEXT,
+    result TEXT,
+    error TEXT,
+    error_status INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, run_after);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed job table. Thread-safe; the database is opened on first use.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, lease=JOB_LEASE):
+        self.path = path
+        self.lease = lease
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            # WAL lets the other gunicorn workers read while one writes.
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+            db.row_factory = sqlite3.Row
+            self._db = db
+        return self._db
+
+    def _execute(self, sql, params=()):
+        """Runs one statement; returns the number of rows it changed."""
+        with self._lock:
+            return self._connect().execute(sql, params).rowcount
+
+    def _fetch(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def submit(self, user_query, question_id, zip_bytes, trace_id=None):
+        """Stores a new job; returns its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (job_id, status, stage, user_query, question_id, zip_bytes, trace_id,"
+            " run_after, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, QUEUED, user_query, question_id, zip_bytes, trace_id, now, now, now),
+        )
+        return job_id
+
+    def claim(self):
+        """Takes the oldest runnable job (queued, or running under an expired lease); None when there is none."""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            # IMMEDIATE takes the write lock up front, so two processes can't claim the same row.
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose worker died JOB_MAX_ATTEMPTS times is more likely the cause than the victim.
+                db.execute(
+                    "UPDATE jobs SET status = ?, stage = ?, error = ?, error_status = 500, zip_bytes = NULL,"
+                    " lease_until = NULL, updated_at = ? WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, FAILED, "The job was interrupted too many times", now, RUNNING, now, JOB_MAX_ATTEMPTS),
+                )
+                row = db.execute(
+                    "SELECT job_id, user_query, question_id, zip_bytes, trace_id, attempts FROM jobs"
+                    " WHERE (status = ? AND run_after <= ?) OR (status = ? AND lease_until < ?)"
+                    " ORDER BY created_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, stage = ?, attempts = attempts + 1, lease_until = ?,"
+                        " updated_at = ? WHERE job_id = ?",
+                        (RUNNING, "classifying", now + self.lease, now, row["job_id"]),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Job(row["job_id"], row["user_query"], row["question_id"], row["zip_bytes"], row["trace_id"],
+                   row["attempts"] + 1)
+
+    def progress(self, job_id, stage, classification=None):
+        """Records the stage a running job reached and renews its lease."""
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET stage = ?, classification = COALESCE(?, classification), lease_until = ?,"
+            " updated_at = ? WHERE job_id = ? AND status = ?",
+            (stage, json.dumps(classification) if classification is not None else None, now + self.lease,
+             now, job_id, RUNNING),
+        )
+
+    def finish(self, job_id, result):
+        """Stores a job's result; the zip is no longer needed."""
+        self._execute(
+            "UPDATE jobs SET status = ?, stage = ?, result = ?, zip_bytes = NULL, lease_until = NULL,"
+            " updated_at = ? WHERE job_id = ?",
+            (DONE, DONE, json.dumps(result), time.time(), job_id),
+        )
+
+    def fail(self, job_id, error, error_status=500):
+        self._execute(
+            "UPDATE jobs SET status = ?, stage = ?, error = ?, error_status = ?, zip_bytes = NULL,"
+            " lease_until = NULL, updated_at = ? WHERE job_id = ?",
+            (FAILED, FAILED, error, error_status, time.time(), job_id),
+        )
+
+    def retry(self, job_id, delay, error):
+        """Puts a job back in the queue, not to be run for delay seconds."""
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = ?, stage = ?, error = ?, run_after = ?, lease_until = NULL,"
+            " updated_at = ? WHERE job_id = ?",
+            (QUEUED, QUEUED, error, now + delay, now, job_id),
+        )
+
+    def get(self, job_id):
+        """The job's public state as a dict, or None for an unknown id."""
+        rows = self._fetch(
+            "SELECT job_id, status, stage, attempts, classification, result, error, error_status,"
+            " created_at, updated_at FROM jobs WHERE job_id = ?",
+            (job_id,),
+        )
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["classification"] = json.loads(job["classification"]) if job["classification"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        if job["status"] != FAILED:
+            # A retried job keeps its last error only for the logs.
+            job["error"] = job["error_status"] = None
+        return job
+
+    def prune(self, retention=JOB_RETENTION):
+        """Deletes finished jobs older than retention seconds; returns how many."""
+        return self._execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, time.time() - retention),
+        )
+
+    def stats(self):
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        for status, count in self._fetch("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
+
+
+def _changes(job, last):
+    """The job when its status or stage moved on since last, else None."""
+    if job is None or last is None or (job["status"], job["stage"]) != (last["status"], last["stage"]):
+        return job
+    return None
+
+
+def job_updates(store, job_id, poll_interval=JOB_EVENTS_POLL, max_duration=None):
+    """
+    Yields the job's state each time its status or stage changes, ending after
+    it finishes (or None-s for an unknown job). Yields "" as a keep-alive when
+    nothing changed for KEEPALIVE_INTERVAL seconds. Also ends, unfinished,
+    after max_duration seconds.
+    """
+    last = None
+    quiet_since = time.monotonic()
+    deadline = None if max_duration is None else quiet_since + max_duration
+    while deadline is None or time.monotonic() < deadline:
+        job = store.get(job_id)
+        changed = _changes(job, last)
+        if changed is not None or job is None:
+            yield changed
+            if job is None or job["status"] in FINISHED:
+                return
+            last, quiet_since = job, time.monotonic()
+        elif time.monotonic() - quiet_since >= KEEPALIVE_INTERVAL:
+            yield ""
+            quiet_since = time.monotonic()
+        time.sleep(poll_interval)
+
+
+async def async_job_updates(store, job_id, poll_interval=JOB_EVENTS_POLL):
+    """Async counterpart of job_updates."""
+    last = None
+    quiet_since = time.monotonic()
+    while True:
+        job = await asyncio.to_thread(store.get, job_id)
+        changed = _changes(job, last)
+        if changed is not None or job is None:
+            yield changed
+            if job is None or job["status"] in FINISHED:
+                return
+            last, quiet_since = job, time.monotonic()
+        elif time.monotonic() - quiet_since >= KEEPALIVE_INTERVAL:
+            yield ""
+            quiet_since = time.monotonic()
+        await asyncio.sleep(poll_interval)
+
+
+def retryable(e):
+    """Overload, and upstream failures that may pass: network errors, timeouts, 429s and 5xx."""
+    if isinstance(e, Overloaded):
+        return True
+    return isinstance(e, LLMError) and (e.status_code is None or e.status_code == 429 or e.status_code >= 500)
+
+
+def classify_failure(e, job):
+    """
+    Decides what to do with a job whose handler raised e.
+    Returns ("retry", delay) for retryable failures while attempts remain,
+    otherwise ("fail", status_code): a rejected request (a bad API key, a
+    prompt too large) fails at once with the upstream status, and a bad upload
+    or request (ZipIngestError, pipeline.RequestError) with the 400 /api/process
+    would have answered.
+    """
+    if retryable(e) and job.attempts < JOB_MAX_ATTEMPTS:
+        return "retry", getattr(e, "retry_after", None) or 5 * job.attempts
+    if isinstance(e, Overloaded):
+        return "fail", 503
+    if isinstance(e, ZipIngestError):
+        return "fail", 400
+    status_code = getattr(e, "status_code", None)
+    return "fail", status_code if status_code and status_code >= 400 else 500
+
+
+class _Workers:
+    def __init__(self, store, handler, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._last_prune = 0.0
+
+    def _prune_due(self):
+        now = time.monotonic()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return False
+        self._last_prune = now
+        return True
+
+    def _record_failure(self, job, e):
+        action, value = classify_failure(e, job)
+        if action == "retry":
+            logger.warning("Job failed, retrying", extra={"job_id": job.job_id, "attempt": job.attempts,
+                                                          "retry_in": value, "error": str(e)})
+            self.store.retry(job.job_id, value, str(e))
+            return
+        if value >= 500:
+            logger.error("Job failed", exc_info=e, extra={"job_id": job.job_id})
+        else:
+            logger.warning("Job rejected", extra={"job_id": job.job_id, "error": str(e)})
+        self.store.fail(job.job_id, str(e), value)
+
+
+class JobWorkers(_Workers):
+    """
+    Worker threads for the Flask app. handler(job, progress) runs the pipeline
+    for one Job and returns its JSON-serializable result; progress(stage,
+    classification=None) reports how far it got.
+    """
+
+    def __init__(self, store, handler, **kwargs):
+        super().__init__(store, handler, **kwargs)
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """Wakes an idle worker for a job submitted to this process."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                if self._prune_due():
+                    self.store.prune()
+                job = self.store.claim()
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._process(job)
+
+    def _process(self, job):
+        trace_id_var.set(job.trace_id or job.job_id)
+        logger.info("Job started", extra={"job_id": job.job_id, "attempt": job.attempts})
+        try:
+            result = self.handler(job, lambda stage, classification=None: self.store.progress(
+                job.job_id, stage, classification))
+        except Exception as e:
+            self._record_failure(job, e)
+            return
+        self.store.finish(job.job_id, result)
+
+
+class AsyncJobWorkers(_Workers):
+    """
+    Worker tasks for the ASGI app; handler and progress are coroutines. The
+    SQLite calls run in threads so they never block the event loop.
+    """
+
+    def __init__(self, store, handler, **kwargs):
+        super().__init__(store, handler, **kwargs)
+        self._wake = None
+        self._tasks = []
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(), name=f"job-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                if self._prune_due():
+                    await asyncio.to_thread(self.store.prune)
+                job = await asyncio.to_thread(self.store.claim)
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            await self._process(job)
+
+    async def _process(self, job):
+        trace_id_var.set(job.trace_id or job.job_id)
+        logger.info("Job started", extra={"job_id": job.job_id, "attempt": job.attempts})
+
+        async def progress(stage, classification=None):
+            await asyncio.to_thread(self.store.progress, job.job_id, stage, classification)
+
+        try:
+            result = await self.handler(job, progress)
+        except Exception as e:
+            await asyncio.to_thread(self._record_failure, job, e)
+            return
+        await asyncio.to_thread(self.store.finish, job.job_id, result)
@@ -0,0 +1,367 @@
+"""
+Shared, connection-pooled HTTP clients for the chat-completions API.
+
+One requests.Session (LLMClient) or httpx.AsyncClient (AsyncLLMClient) is
+reused by every llm_call so TLS connections to REQUEST_URL are kept alive
+between calls. Calls have connect/read timeouts and are retried with
+jittered exponential backoff on 429, 5xx and connection failures.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+from metrics import UPSTREAM_RESPONSES
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The upstream API failed or returned something we can't use."""
+
+    def __init__(self, message, status_code=None, timed_out=False):
+        super().__init__(message)
+        self.status_code = status_code
+        # The read timeout ran out: the model was still generating, or the endpoint stalled.
+        self.timed_out = timed_out
+
+
+def _read_timed_out(error):
+    """True for a read timeout; mid-stream, requests reports one as a ConnectionError wrapping urllib3's."""
+    return isinstance(error, requests.Timeout) or any(isinstance(arg, ReadTimeoutError) for arg in error.args)
+
+
+class _BaseClient:
+    """
+    Settings, retry policy and counters shared by the sync and async clients.
+    """
+
+    def __init__(self, url, api_key, connect_timeout=5.0, read_timeout=120.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0, pool_size=20):
+        self.url = url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+        }
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0, "status_codes": {}}
+        # Called with every upstream status code, retried attempts included (e.g. by the concurrency limiter).
+        self.status_listeners = []
+
+    @classmethod
+    def from_env(cls, pool_size=None, url=None, api_key=None):
+        """Builds a client from REQUEST_URL, API_KEY (unless given) and the LLM_* tuning variables."""
+        return cls(
+            url or os.getenv("REQUEST_URL"),
+            api_key or os.getenv("API_KEY"),
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", 5)),
+            read_timeout=float(os.getenv("LLM_READ_TIMEOUT", 120)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", 0.5)),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX", 8)),
+            pool_size=pool_size or int(os.getenv("LLM_POOL_SIZE", 20)),
+        )
+
+    def _count(self, key, status_code=None):
+        with self._stats_lock:
+            if key:
+                self._stats[key] += 1
+            if status_code is not None:
+                codes = self._stats["status_codes"]
+                codes[status_code] = codes.get(status_code, 0) + 1
+        if status_code is not None:
+            UPSTREAM_RESPONSES.inc(status_code=status_code)
+            for listener in self.status_listeners:
+                listener(status_code)
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.backoff_max))
+            except ValueError:
+                pass
+        return delay
+
+    def _check_response(self, status_code, text):
+        """Raises LLMError for an error status that will not be retried."""
+        if status_code >= 400:
+            self._count("failures")
+            raise LLMError(f"LLM API returned {status_code}: {text[:500]}", status_code=status_code)
+
+    @staticmethod
+    def _message_content(data):
+        try:
+            return data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Unexpected LLM response: {str(data)[:500]}") from e
+
+    @staticmethod
+    def _stream_delta(line, usage=None):
+        """
+        Parses one server-sent-event line of a streamed completion.
+        Returns (done, content delta or None); token usage, when the API
+        reports it in the final chunk, is copied into the usage dict.
+        """
+        if not line.startswith("data:"):
+            return False, None
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            return True, None
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            return False, None
+        if usage is not None and isinstance(chunk, dict) and chunk.get("usage"):
+            usage.update(chunk["usage"])
+        try:
+            choice = chunk["choices"][0]
+        except (KeyError, IndexError, TypeError):
+            return False, None
+        return False, (choice.get("delta") or {}).get("content")
+
+    @staticmethod
+    def _stream_body(messages, model, temperature):
+        return {
+            "messages": messages, "model": model, "temperature": temperature,
+            "stream": True, "stream_options": {"include_usage": True},
+        }
+
+    def _counters(self):
+        with self._stats_lock:
+            return dict(self._stats, status_codes=dict(self._stats["status_codes"]))
+
+
+class LLMClient(_BaseClient):
+    """
+    Thread-safe client for a single chat-completions endpoint.
+    """
+
+    def __init__(self, url, api_key, **kwargs):
+        super().__init__(url, api_key, **kwargs)
+        self.timeout = (self.connect_timeout, self.read_timeout)
+        self.session = requests.Session()
+        # Retries are handled in _send so they can be counted and jittered.
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers.update(self.headers)
+
+    def _send(self, body, stream=False, read_timeout=None):
+        """
+        POSTs body to the endpoint and returns the successful response.
+        read_timeout overrides the client's for this call (a model's latency budget).
+        Raises LLMError once retries are exhausted or on a non-retryable error.
+        """
+        timeout = self.timeout if read_timeout is None else (self.connect_timeout, read_timeout)
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self._count("attempts" if attempt == 0 else "retries")
+            try:
+                response = self.session.post(self.url, json=body, timeout=timeout, stream=stream)
+            except requests.ConnectionError as e:
+                if last_attempt:
+                    self._count("failures")
+                    raise LLMError(f"LLM request failed: {e}") from e
+                time.sleep(self._backoff_delay(attempt))
+                continue
+            except requests.Timeout as e:
+                # A read timeout is not retried: the reasoner already spent the whole budget.
+                self._count("failures")
+                raise LLMError(f"LLM request timed out: {e}", timed_out=True) from e
+
+            self._count(None, response.status_code)
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                response.close()
+                time.sleep(self._backoff_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            if response.status_code >= 400:
+                with response:
+                    self._check_response(response.status_code, response.text)
+            return response
+
+    def post_json(self, body, read_timeout=None):
+        """POSTs body and returns the decoded JSON response."""
+        response = self._send(body, read_timeout=read_timeout)
+        try:
+            return response.json()
+        except ValueError as e:
+            self._count("failures")
+            raise LLMError("LLM API returned invalid JSON", status_code=response.status_code) from e
+
+    def complete(self, messages, model, temperature=0.0, read_timeout=None):
+        """Runs a chat completion; returns (assistant message content, usage dict)."""
+        data = self.post_json({"messages": messages, "model": model, "temperature": temperature}, read_timeout)
+        return self._message_content(data), data.get("usage") or {}
+
+    def chat(self, messages, model, temperature=0.0):
+        """Runs a chat completion and returns the assistant message content."""
+        return self.complete(messages, model, temperature)[0]
+
+    def stream_chat(self, messages, model, temperature=0.0, usage=None, read_timeout=None):
+        """
+        Runs a streamed chat completion, yielding content deltas as they arrive.
+        Token usage reported at the end of the stream is copied into usage.
+        """
+        response = self._send(self._stream_body(messages, model, temperature), stream=True,
+                              read_timeout=read_timeout)
+        with response:
+            try:
+                for line in response.iter_lines():
+                    done, text = self._stream_delta(line.decode("utf-8"), usage)
+                    if done:
+                        break
+                    if text:
+                        yield text
+            except requests.RequestException as e:
+                self._count("failures")
+                raise LLMError(f"LLM stream interrupted: {e}", timed_out=_read_timed_out(e)) from e
+
+    def stats(self):
+        """Request/retry counters plus per-host connection pool usage."""
+        stats = self._counters()
+        pools = []
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests_sent": pool.num_requests,
+                # The queue is pre-filled with None placeholders for unopened slots.
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                "max_size": pool.pool.maxsize if pool.pool else 0,
+            })
+        stats["pools"] = pools
+        return stats
+
+
+class AsyncLLMClient(_BaseClient):
+    """
+    asyncio client for the ASGI app; one event loop can keep hundreds of
+    LLM calls in flight over a shared keep-alive pool.
+    """
+
+    def __init__(self, url, api_key, **kwargs):
+        super().__init__(url, api_key, **kwargs)
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+        self._in_flight = 0
+
+    async def _send(self, body, stream=False, read_timeout=None):
+        """Async counterpart of LLMClient._send with the same retry policy."""
+        timeout = (httpx.USE_CLIENT_DEFAULT if read_timeout is None
+                   else httpx.Timeout(read_timeout, connect=self.connect_timeout))
+        self._count("requests")
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self._count("attempts" if attempt == 0 else "retries")
+            try:
+                request = self.client.build_request("POST", self.url, json=body, timeout=timeout)
+                response = await self.client.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                if last_attempt:
+                    self._count("failures")
+                    raise LLMError(f"LLM request failed: {e!r}") from e
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+            except httpx.TimeoutException as e:
+                # A read timeout is not retried: the reasoner already spent the whole budget.
+                self._count("failures")
+                raise LLMError(f"LLM request timed out: {e!r}", timed_out=True) from e
+            except httpx.HTTPError as e:
+                self._count("failures")
+                raise LLMError(f"LLM request failed: {e!r}") from e
+
+            self._count(None, response.status_code)
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                await response.aclose()
+                await asyncio.sleep(self._backoff_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            if response.status_code >= 400:
+                await response.aread()
+                await response.aclose()
+                self._check_response(response.status_code, response.text)
+            return response
+
+    async def post_json(self, body, read_timeout=None):
+        """POSTs body and returns the decoded JSON response."""
+        self._in_flight += 1
+        try:
+            response = await self._send(body, read_timeout=read_timeout)
+        finally:
+            self._in_flight -= 1
+        try:
+            return response.json()
+        except ValueError as e:
+            self._count("failures")
+            raise LLMError("LLM API returned invalid JSON", status_code=response.status_code) from e
+
+    async def complete(self, messages, model, temperature=0.0, read_timeout=None):
+        """Runs a chat completion; returns (assistant message content, usage dict)."""
+        data = await self.post_json({"messages": messages, "model": model, "temperature": temperature},
+                                    read_timeout)
+        return self._message_content(data), data.get("usage") or {}
+
+    async def chat(self, messages, model, temperature=0.0):
+        """Runs a chat completion and returns the assistant message content."""
+        return (await self.complete(messages, model, temperature))[0]
+
+    async def stream_chat(self, messages, model, temperature=0.0, usage=None, read_timeout=None):
+        """
+        Runs a streamed chat completion, yielding content deltas as they arrive.
+        Token usage reported at the end of the stream is copied into usage.
+        """
+        self._in_flight += 1
+        try:
+            response = await self._send(self._stream_body(messages, model, temperature), stream=True,
+                                        read_timeout=read_timeout)
+            try:
+                async for line in response.aiter_lines():
+                    done, text = self._stream_delta(line, usage)
+                    if done:
+                        break
+                    if text:
+                        yield text
+            except httpx.HTTPError as e:
+                self._count("failures")
+                raise LLMError(f"LLM stream interrupted: {e!r}",
+                               timed_out=isinstance(e, httpx.TimeoutException)) from e
+            finally:
+                await response.aclose()
+        finally:
+            self._in_flight -= 1
+
+    def stats(self):
+        """Request/retry counters plus in-flight calls and pool limits."""
+        stats = self._counters()
+        stats["pools"] = [{
+            "host": str(httpx.URL(self.url).copy_with(path="/", query=None)) if self.url else None,
+            "in_flight": self._in_flight,
+            "max_size": self.pool_size,
+        }]
+        return stats
+
+    async def aclose(self):
+        await self.client.aclose()
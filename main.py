@@ -1,152 +1,595 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from fastapi import FastAPI
-import json
+import contextvars
+import logging
 import os
-import pandas as pd
-import zipfile
-from werkzeug.utils import secure_filename
-import requests
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context, url_for
+from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from dotenv import load_dotenv
-import uvicorn
-
-from prompts import (
-    conceptual_doubt_prompt,
-    get_implementation_guidance_prompt,
-    get_test_cases_qr_v0_prompt,
-    get_specific_errors_qr_v0_prompt,
-    get_publishing_related_query_system_prompt,
-    get_ide_related_queries_system_prompt,
-    get_query_classification_prompt
+
+# Load .env before the local modules below read their settings from the environment
+load_dotenv()
+
+from app_logging import sample_bodies, setup_logging, trace_id_var, truncate_body
+
+setup_logging()
+
+from prompts import get_query_classification_prompt
+from zip_ingest import MAX_UPLOAD_BYTES, ZipIngestError
+from query_classifier import record_llm_label
+from llm_client import LLMError
+from hedging import HedgedClient
+from concurrency_limiter import (
+    LLM_LIMITER_ENABLED,
+    PRIORITY_ANSWER,
+    PRIORITY_CLASSIFY,
+    PRIORITY_SPECULATIVE,
+    AdaptiveLimiter,
+    Overloaded,
+    start_request_deadline,
+)
+from single_flight import SingleFlight
+from jobs import JOB_EVENTS_MAX_DURATION, JobWorkers, job_updates
+from context_builder import estimate_tokens
+import metrics
+from pipeline import (
+    PREFETCH_INPUTS,
+    QUESTION,
+    USER_CODE,
+    AnswerPlan,
+    RequestError,
+    StageTimings,
+    allowed_file,
+    build_messages,
+    classification_key,
+    classify_locally,
+    extract_question_id,
+    input_loaders,
+    job_store,
+    local_classifier,
+    parse_classification,
+    plan_answer,
+    required_inputs,
+    response_cache,
+    sse_event,
+    submission_store,
 )
+import combined_call
+from model_routing import router as model_router
+from combined_call import COMBINED_CALL
+from speculation import SPECULATIVE_ANSWERS, SPECULATION_WORKERS, Speculation, guess_category
+from speculation import tracker as speculation_tracker
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-load_dotenv()
-
-# Configuration for file uploads
-UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'zip'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Zips are read in memory and never written to disk.
+# Leave some room for the form fields around the zip itself
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+# Shared HTTP clients for the LLM API (REQUEST_URL, API_KEY, LLM_* timeouts and retries),
+# hedged and failed over across LLM_FALLBACK_URLS (see hedging.py)
+llm_client = HedgedClient.from_env()
+
+# Client of each model tier (see model_routing.py); a fast tier on another endpoint gets its own.
+llm_clients = {
+    tier.name: llm_client if (tier.url, tier.api_key) == (llm_client.url, llm_client.api_key)
+    else HedgedClient.from_env(url=tier.url, api_key=tier.api_key)
+    for tier in model_router.tiers
+}
+
+# Bounds concurrent LLM calls; backs off on 429s (LLM_CONCURRENCY_*, LLM_QUEUE_*)
+llm_limiter = AdaptiveLimiter() if LLM_LIMITER_ENABLED else None
+if llm_limiter is not None:
+    # Every tier's client: a fast tier with its own endpoint gets 429s of its own.
+    for client in llm_clients.values():
+        client.status_listeners.append(llm_limiter.observe_status)
+        # Hedged duplicates need a free slot too, or aren't sent.
+        client.limiter = llm_limiter
+
+# Identical concurrent classification and answer calls are made once and shared.
+classify_flight = SingleFlight("classify")
+answer_flight = SingleFlight("answer")
+
+# Runs the local steps (question lookup, zip extraction) while the request
+# thread waits on the classification call.
+pipeline_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_WORKERS", 2 * (os.cpu_count() or 4))),
+    thread_name_prefix="pipeline",
+)
 
-# Ensure the upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Speculative answer calls run here, at most SPECULATION_WORKERS at a time.
+speculation_pool = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="speculation")
+speculation_slots = threading.BoundedSemaphore(SPECULATION_WORKERS)
 
-# Path to the commands.csv file
-COMMANDS_CSV_PATH = 'commands.csv'
+metrics.registry.add_gauges(
+    "mentor_llm_client", "Request/retry counters of the shared LLM client.",
+    lambda: {(("stat", key),): value for key, value in llm_client.stats().items() if isinstance(value, int)},
+)
 
-def allowed_file(filename):
-    """Check if the file has an allowed extension."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+metrics.registry.add_gauges(
+    "mentor_llm_limiter", "Adaptive LLM concurrency limit, queue and admission counters.",
+    lambda: {(("stat", key),): value for key, value in llm_limiter.stats().items()} if llm_limiter else {},
+)
 
-def extract_question_id(filename):
+CALL_PRIORITIES = {"classify": PRIORITY_CLASSIFY, "speculative": PRIORITY_SPECULATIVE}
+
+def llm_slot(call):
+    """Waits for an LLM slot; classification calls are served before answers, speculative answers last."""
+    if llm_limiter is None:
+        return nullcontext()
+    return llm_limiter.slot(CALL_PRIORITIES.get(call, PRIORITY_ANSWER))
+
+def complete_on(tier, messages, call, category):
+    """One chat completion on a model tier, within its latency budget; returns the content."""
+    # Reuses pooled keep-alive connections; retries 429/5xx with jittered backoff.
+    with llm_slot(call):
+        start = time.perf_counter()
+        content, usage = llm_clients[tier.name].complete(messages, model=tier.model, temperature=0.0,
+                                                         read_timeout=tier.latency_budget, latency_key=call)
+        seconds = time.perf_counter() - start
+    metrics.LLM_CALL_SECONDS.observe(seconds, call=call, category=metrics.category_label(category))
+    metrics.record_usage(usage, call, category)
+    logger.info("LLM call finished", extra={"call": call, "category": category, "model": tier.model,
+                                            "seconds": round(seconds, 3),
+                                            "prompt_tokens": usage.get("prompt_tokens"),
+                                            "completion_tokens": usage.get("completion_tokens")})
+    return content
+
+def llm_call(system_prompt, user_prompt, call="answer", category=""):
     """
-    Extracts the question ID from the zip file's name.
-    Assumes the zip file name is in the format "RJSCPYQN94.zip".
+    Runs one LLM call on the model tier its stage and category route to, redoing
+    it on the reasoner when a fast-tier call fails or its reply doesn't validate.
     """
-    # Remove the .zip extension and extract the question ID
-    if filename.endswith('.zip'):
-        return filename[:-4]  # Remove the last 4 characters (.zip)
-    return None
+    messages = build_messages(system_prompt, user_prompt)
+
+    # Prompts are several KB (plus the user's code); only a sample is logged, truncated.
+    log_bodies = sample_bodies()
+    if log_bodies:
+        logger.info("LLM prompt", extra={"call": call, "system_prompt": truncate_body(system_prompt),
+                                         "user_prompt": truncate_body(user_prompt)})
+
+    tier = model_router.tier_for(call, category, estimate_tokens(system_prompt) + estimate_tokens(user_prompt))
+    while True:
+        try:
+            content = complete_on(tier, messages, call, category)
+        except LLMError as e:
+            escalated = model_router.escalate(tier, call, "error")
+            if escalated is None:
+                raise
+            logger.warning("Fast model call failed, escalating", extra={"call": call, "model": tier.model,
+                                                                         "error": str(e)})
+            tier = escalated
+            continue
+        if model_router.accepts(tier, call, content):
+            break
+        logger.warning("Fast model reply failed validation, escalating", extra={"call": call, "model": tier.model})
+        tier = model_router.escalate(tier, call, "invalid")
+    if log_bodies:
+        logger.info("LLM response", extra={"call": call, "response": truncate_body(content)})
+    return content
 
-def get_question_details(question_id):
+def analyze_user_query(user_query):
     """
-    Fetches the question details from the commands.csv file based on the question ID.
+    Analyzes the user query and classifies it into one of the predefined categories.
+    """
+    local_result = classify_locally(user_query)
+    if local_result is not None:
+        return local_result
+    return classify_with_llm(user_query)
+
+def classify_with_llm(user_query):
+    """Classifies the user query with the LLM, sharing the call with identical in-flight requests."""
+    def classify():
+        system_prompt = get_query_classification_prompt()
+        result = llm_call(system_prompt, user_query, call="classify")
+        result = parse_classification(result)
+        logger.info("Classified by LLM", extra={"query_category": result.get("query_category")})
+        record_llm_label(user_query, result.get("query_category"))
+        return result
+
+    # Waiters share the leader's dict; copy it so nobody mutates another request's result.
+    return dict(classify_flight.do(classification_key(user_query), classify))
+
+def generate_answer(plan):
+    """Answers a planned query with the LLM, sharing the call with identical in-flight requests."""
+    def answer():
+        response = llm_call(plan.system_prompt, plan.user_prompt, category=plan.query_category)
+        response_cache.put(plan.cache_key, response)
+        return response
+
+    return answer_flight.do(plan.cache_key, answer)
+
+def classify_and_answer(user_query, question_id, inputs, timings):
+    """
+    Classifies and answers the query with one LLM call (see combined_call.py);
+    inputs are the futures loading the question and the user's files.
+    Returns (analysis_result, plan). plan is None when the category still needs
+    its own answer call, and both are None when the two-call path has to take
+    over: the question is unknown, the zip unreadable or the reply unparseable.
     """
     try:
-        df = pd.read_csv(COMMANDS_CSV_PATH)
-        question_details = df[df['question_command_id'] == question_id]
-        return {
-            "question_content": question_details['question_content'],
-            "question_test_cases": question_details['question_test_cases']
-        }
+        question_details = inputs[QUESTION].result()
+        user_files = inputs[USER_CODE].result()
+    except ZipIngestError:
+        question_details = None
+    if not question_details:
+        combined_call.tracker.count("skipped")
+        return None, None
+
+    request = combined_call.build_request(question_id, user_query, question_details, user_files, timings)
+    reply = response_cache.get(request.cache_key)
+    cached = reply is not None
+    if not cached:
+        reply = llm_call(request.system_prompt, request.user_prompt, call="combined")
+    try:
+        analysis_result, answer = combined_call.parse_reply(reply)
+    except ValueError as e:
+        combined_call.tracker.count("unparsed")
+        logger.warning("Unparseable combined reply, classifying separately", extra={"error": str(e)})
+        return None, None
+    query_category = analysis_result["query_category"]
+    logger.info("Classified by LLM", extra={"query_category": query_category, "call": "combined"})
+    record_llm_label(user_query, query_category)
+    if answer is None:
+        # Cut off before </answer>: keep the classification, answer it separately, don't cache the partial reply.
+        combined_call.tracker.count("unparsed")
+        logger.warning("Truncated combined reply, answering separately")
+        return analysis_result, None
+    if not cached:
+        response_cache.put(request.cache_key, reply)
+
+    if not combined_call.answered(analysis_result, answer):
+        combined_call.tracker.count("second_call")
+        return analysis_result, None
+    combined_call.tracker.count("answered")
+    return analysis_result, AnswerPlan(
+        analysis_result, analysis_result.get("user_query_summary", ""), query_category,
+        request.system_prompt, request.user_prompt, request.files_sent, request.cache_key, answer=answer)
+
+def stream_answer(plan, timings):
+    """
+    Yields the answer text as it is generated upstream. When an identical answer
+    is already being generated for another request, waits for it and yields it whole.
+    """
+    call, leader = answer_flight.acquire(plan.cache_key)
+    if not leader:
+        with timings.stage("answer"):
+            response = call.wait()
+        yield response
+        return
+
+    parts = []
+    usage = {}
+    try:
+        with timings.stage("answer"), llm_slot("answer"):
+            messages = build_messages(plan.system_prompt, plan.user_prompt)
+            tier = model_router.tier_for("answer", plan.query_category,
+                                         estimate_tokens(plan.system_prompt) + estimate_tokens(plan.user_prompt))
+            for text in llm_clients[tier.name].stream_chat(messages, model=tier.model, temperature=0.0, usage=usage,
+                                                           read_timeout=tier.latency_budget):
+                parts.append(text)
+                yield text
+    except BaseException as e:
+        # GeneratorExit: the client went away mid-stream; the waiters can't get the answer.
+        answer_flight.finish(plan.cache_key, call, error=e)
+        raise
+    response = "".join(parts)
+    metrics.LLM_CALL_SECONDS.observe(timings.durations["answer"], call="answer",
+                                     category=metrics.category_label(plan.query_category))
+    metrics.record_usage(usage, "answer", plan.query_category)
+    logger.info("LLM stream finished", extra={"category": plan.query_category,
+                                              "seconds": round(timings.durations["answer"], 3),
+                                              "completion_tokens": usage.get("completion_tokens")})
+    response_cache.put(plan.cache_key, response)
+    answer_flight.finish(plan.cache_key, call, result=response)
+
+def stream_speculative(plan, speculation):
+    """
+    Streams the answer for a speculative plan, stopping early once the request
+    discards the speculation. Returns the answer, or None when it was discarded.
+    """
+    cached = response_cache.get(plan.cache_key)
+    if cached is not None:
+        return cached
+    messages = build_messages(plan.system_prompt, plan.user_prompt)
+    parts = []
+    usage = {}
+    finished = False
+    with llm_slot("speculative"):
+        if speculation.discarded:
+            return None
+        start = time.perf_counter()
+        tier = model_router.tier_for("speculative", plan.query_category,
+                                     estimate_tokens(plan.system_prompt) + estimate_tokens(plan.user_prompt))
+        stream = llm_clients[tier.name].stream_chat(messages, model=tier.model, temperature=0.0, usage=usage,
+                                                    read_timeout=tier.latency_budget)
+        try:
+            for text in stream:
+                parts.append(text)
+                if speculation.discarded:
+                    break
+            else:
+                finished = True
+        finally:
+            # Closing the stream drops the connection, so the API stops generating.
+            stream.close()
+            speculation.spent(usage.get("prompt_tokens") or estimate_tokens(plan.system_prompt + plan.user_prompt),
+                              usage.get("completion_tokens") or estimate_tokens("".join(parts)))
+    if not finished:
+        return None
+    response = "".join(parts)
+    metrics.LLM_CALL_SECONDS.observe(time.perf_counter() - start, call="speculative",
+                                     category=metrics.category_label(plan.query_category))
+    metrics.record_usage(usage, "speculative", plan.query_category)
+    # A finished answer is right for its own cache key even when this request didn't want it.
+    response_cache.put(plan.cache_key, response)
+    return None if speculation.discarded else response
+
+def run_speculation(speculation, question_id, inputs):
+    """Plans and streams a speculative answer on the speculation pool, resolving speculation.plan and .answer."""
+    try:
+        guess = speculation.guess
+        loaded = {name: inputs[name].result() for name in required_inputs(guess["query_category"])}
+        plan = plan_answer(question_id, guess, loaded.get(QUESTION), loaded.get(USER_CODE), StageTimings())
+        speculation.plan.set_result(plan)
+        speculation.answer.set_result(stream_speculative(plan, speculation))
     except Exception as e:
-        print(f"Error fetching question details: {e}")
+        speculation.failed()
+        for future in (speculation.plan, speculation.answer):
+            if not future.done():
+                future.set_exception(e)
+    finally:
+        speculation_slots.release()
+
+def start_speculation(user_query, question_id, inputs, submit):
+    """
+    Starts a speculative answer for the local classifier's guess at the category.
+    Returns the Speculation, or None when there is no usable guess or no free worker.
+    submit(name) starts loading an input; the guessed route's missing inputs are added to inputs.
+    """
+    guess = guess_category(user_query)
+    if guess is None or not speculation_slots.acquire(blocking=False):
+        speculation_tracker.count("skipped")
         return None
-
-def extract_user_code(zip_path):
+    for name in required_inputs(guess["query_category"]) - inputs.keys():
+        inputs[name] = submit(name)
+    speculation = Speculation(guess)
+    speculation.plan, speculation.answer = Future(), Future()
+    speculation_pool.submit(contextvars.copy_context().run, run_speculation, speculation, question_id, dict(inputs))
+    logger.info("Speculating", extra={"query_category": guess["query_category"], "confidence": guess["confidence"]})
+    return speculation
+
+def adopt_speculation(speculation, analysis_result):
     """
-    Extracts and reads all files from the uploaded zip file.
-    Returns a concatenated string of all file contents.
+    The speculative plan relabelled with the real classification when the two
+    agree; otherwise discards the speculation and returns None.
     """
+    if not speculation.agrees(analysis_result):
+        speculation.discard()
+        return None
     try:
-        user_code = ""
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(UPLOAD_FOLDER)
-            extracted_files = zip_ref.namelist()
-            print(f"Extracted files: {extracted_files}")  # Debug: List all files in the zip
-
-            for file in extracted_files:
-                file_path = os.path.join(UPLOAD_FOLDER, file)
-                if os.path.isfile(file_path):  # Ensure it's a file, not a directory
-                    # print(f"Reading file: {file_path}")  # Debug: Print the file being read
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as code_file:
-                            content = code_file.read()
-                            user_code += f"\n\n=== {file} ===\n"
-                            user_code += content
-                    except UnicodeDecodeError:
-                        print(f"Skipping binary or non-utf-8 file: {file_path}")
-                    except Exception as e:
-                        print(f"Error reading file {file_path}: {e}")
-
-        if not user_code:
-            print("No valid text files found in the zip file.")  # Debug: No files were read
-            return "No valid text files found in the zip file."
-        return user_code
-    except Exception as e:
-        print(f"Error extracting user code: {e}")
+        plan = speculation.plan.result()
+    except Exception:
+        # Planning the real classification runs into the same error and reports it.
         return None
+    speculation.keep()
+    return plan._replace(analysis_result=analysis_result,
+                         user_query_summary=analysis_result.get("user_query_summary", ""),
+                         query_category=analysis_result.get("query_category", "Other"),
+                         speculative_answer=speculation.answer)
+
+@app.before_request
+def start_trace():
+    g.trace_id = metrics.new_trace_id(request.headers.get("X-Trace-Id"))
+    trace_id_var.set(g.trace_id)
+    g.request_start = time.perf_counter()
+    start_request_deadline()
+
+@app.after_request
+def finish_trace(response):
+    # For streamed responses this measures time to the first byte, not the whole stream.
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUESTS.inc(endpoint=endpoint, status_code=response.status_code)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    response.headers["X-Trace-Id"] = g.trace_id
+    return response
 
-def llm_call(system_prompt, user_prompt):
-    print("Calling Deepseek API")
-
-    # Prepare messages as required by the API.
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ]
-
-    print("system_prompt", system_prompt)
-    print("user_prompt", user_prompt)
-    request_body = {
-        "messages": messages,
-        "model": "DEEPSEEK-REASONER", # Specify the valid model
-        "temperature": 0.0
-    }
-
-    # Instantiate the OpenAI client with the proper endpoint and API key.
-    request_url = os.getenv("REQUEST_URL")
-    api_key = os.getenv("API_KEY")
-
-    # Send the request and get the response.
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
+@app.route("/")
+def home():
+    return "Hello, Render!"
 
-    response = requests.post(request_url, headers=headers, json=request_body)
+@app.route("/metrics")
+def metrics_endpoint():
+    """Latency histograms, token counters and upstream status codes in Prometheus text format."""
+    return Response(metrics.registry.expose(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/api/llm/stats")
+def llm_stats():
+    """Connection pool and retry counters of the shared LLM client, plus the concurrency limiter and model routing."""
+    stats = llm_client.stats()
+    stats["limiter"] = llm_limiter.stats() if llm_limiter else {"enabled": False}
+    stats["models"] = model_router.stats()
+    return jsonify(stats), 200
+
+@app.route("/api/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the answer cache."""
+    return jsonify(response_cache.stats()), 200
+
+@app.route("/api/submissions/stats")
+def submission_stats():
+    """How often an upload reused the extraction of an identical earlier one, and the store's size."""
+    return jsonify(submission_store.stats()), 200
+
+@app.route("/api/classifier/stats")
+def classifier_stats():
+    """How many classifications the local fast path answered without the LLM."""
+    return jsonify(local_classifier.stats() if local_classifier else {"enabled": False}), 200
+
+@app.route("/api/speculation/stats")
+def speculation_stats():
+    """How often speculative answers were kept, and the tokens spent on discarded ones."""
+    return jsonify(speculation_tracker.stats()), 200
+
+@app.route("/api/combined/stats")
+def combined_stats():
+    """How often the combined classify+answer call answered on its own, needed a second call or fell back."""
+    return jsonify(combined_call.tracker.stats()), 200
+
+@app.route("/api/coalescing/stats")
+def coalescing_stats():
+    """How many LLM calls were saved by joining an identical in-flight call."""
+    return jsonify({"classify": classify_flight.stats(), "answer": answer_flight.stats()}), 200
+
+def read_process_form():
+    """
+    Validates the /api/process form.
+    Returns (user_query, question_id, zip_bytes); raises RequestError for a bad request.
+    """
+    # Get the user query from the request
+    user_query = request.form.get('query')
+    if not user_query:
+        raise RequestError("User query is required")
+
+    # Handle file upload (if any)
+    zip_bytes = None
+    if 'file' in request.files:
+        file = request.files['file']
+        if file and allowed_file(file.filename):
+            zip_bytes = file.read(MAX_UPLOAD_BYTES + 1)
+            if len(zip_bytes) > MAX_UPLOAD_BYTES:
+                raise RequestError("Zip file is too large", 413)
+            logger.info("Zip uploaded", extra={"file_name": file.filename, "bytes": len(zip_bytes)})
+        else:
+            raise RequestError("Invalid file type. Only .zip files are allowed")
+
+    # Extract question ID from the zip file name
+    if zip_bytes is None:
+        raise RequestError("Zip file is required to extract the question ID")
+    question_id = extract_question_id(file.filename)
+    if not question_id:
+        raise RequestError("Question ID not found in the zip file name")
+    return user_query, question_id, zip_bytes
+
+def prepare_answer(user_query, question_id, zip_bytes, timings, speculate=SPECULATIVE_ANSWERS,
+                   combined=COMBINED_CALL):
+    """
+    Classifies the query, loads the inputs its category's route consumes and
+    builds the answer prompt. With speculate, an answer for the locally guessed
+    category starts while the LLM classifies (see speculation.py). With combined,
+    one call classifies and answers (see combined_call.py); its time counts as
+    the classify stage and the plan carries the answer.
+    Returns an AnswerPlan.
+    """
+    loaders = input_loaders(question_id, zip_bytes)
 
-    # Convert response to JSON and extract the assistant's message.
-    data = response.json()
-    res_text = data["choices"][0]["message"]["content"]
-    return res_text
+    def submit(name):
+        stage, load, arg = loaders[name]
+        # copy_context() carries the trace ID into the pool threads' log records.
+        return pipeline_pool.submit(contextvars.copy_context().run, timings.timed, stage, load, arg)
 
-def analyze_user_query(user_query):
+    futures = {}
+    speculation = None
+    combined_plan = None
+    try:
+        with timings.stage("parallel"):
+            with timings.stage("classify"):
+                analysis_result = classify_locally(user_query)
+                if analysis_result is None and combined:
+                    futures = {name: submit(name) for name in loaders}
+                    analysis_result, combined_plan = classify_and_answer(user_query, question_id, futures, timings)
+                if analysis_result is None:
+                    # Classification is an LLM round trip; the question lookup and zip
+                    # extraction don't depend on it, so they can load in the meantime.
+                    if PREFETCH_INPUTS and not futures:
+                        futures = {name: submit(name) for name in loaders}
+                    if speculate:
+                        speculation = start_speculation(user_query, question_id, futures, submit)
+                    analysis_result = classify_with_llm(user_query)
+
+            # Publishing, IDE and conceptual answers use neither input.
+            needed = required_inputs(analysis_result.get("query_category", "Other"))
+            for name in needed - futures.keys():
+                futures[name] = submit(name)
+            for name in futures.keys() - needed:
+                futures[name].cancel()
+            inputs = {name: futures[name].result() for name in needed}
+        timings.record("overlap_saved", timings.overlap_saved("parallel", ["classify", "lookup", "extract"]))
+
+        if combined_plan is not None:
+            return combined_plan
+        if speculation is not None:
+            plan = adopt_speculation(speculation, analysis_result)
+            if plan is not None:
+                return plan
+        return plan_answer(question_id, analysis_result, inputs.get(QUESTION), inputs.get(USER_CODE), timings)
+    except BaseException:
+        # Classification, the inputs or the plan failed: the speculative answer is wasted.
+        if speculation is not None:
+            speculation.discard()
+        raise
+
+def answer_for(plan, timings):
     """
-    Analyzes the user query and classifies it into one of the predefined categories.
+    The answer to a plan: <mentor_required>, a cached answer or a new one.
+    Returns (response, cache_status); cache_status is "HIT", "MISS", "SPECULATIVE",
+    "COMBINED" or None when no answer was needed.
     """
-    print("statred")
-    system_prompt = get_query_classification_prompt()
-    result = llm_call(system_prompt, user_query)
-    result = json.loads(result.replace("```json","").replace("```",""))
-    print(result)
-    return result
-
-@app.route("/")
-def home():
-    return "Hello, Render!"
+    if plan.system_prompt is None:
+        return "<mentor_required>", None
+    if plan.answer is not None:
+        return plan.answer, "COMBINED"
+    if plan.speculative_answer is not None:
+        with timings.stage("answer"):
+            try:
+                response = plan.speculative_answer.result()
+            except Exception:
+                logger.warning("Speculative answer failed, answering again", exc_info=True)
+                response = None
+        if response is not None:
+            return response, "SPECULATIVE"
+    response = response_cache.get(plan.cache_key)
+    if response is not None:
+        return response, "HIT"
+    with timings.stage("answer"):
+        return generate_answer(plan), "MISS"
+
+def run_job(job, progress):
+    """Runs one /api/jobs job through the /api/process pipeline; returns the /api/process response body."""
+    timings = StageTimings()
+    plan = prepare_answer(job.user_query, job.question_id, job.zip_bytes, timings)
+    progress("answering", {"query_category": plan.query_category, "user_query_summary": plan.user_query_summary})
+    response, _ = answer_for(plan, timings)
+    logger.info("Job finished", extra={"job_id": job.job_id, "timings": timings.server_timing()})
+    return {"response": response, "included_files": plan.files_sent, "timings": timings.server_timing()}
+
+# Background workers for /api/jobs (JOB_WORKERS per process)
+job_workers = JobWorkers(job_store, run_job)
+job_workers.start()
+
+def error_response(e):
+    """Maps pipeline exceptions to the JSON error responses of /api/process."""
+    if isinstance(e, RequestError):
+        return jsonify({"response": str(e)}), e.status_code
+    if isinstance(e, ZipIngestError):
+        return jsonify({"response": str(e)}), 400
+    if isinstance(e, RequestEntityTooLarge):
+        return jsonify({"response": "Zip file is too large"}), 413
+    if isinstance(e, Overloaded) or (isinstance(e, LLMError) and e.status_code == 429):
+        # Shed load quickly instead of a 500; the client should retry later.
+        retry_after = getattr(e, "retry_after", None) or (llm_limiter.retry_after() if llm_limiter else 1)
+        logger.warning("Overloaded, asking the client to retry", extra={"retry_after": retry_after})
+        return jsonify({"response": "The mentor is busy right now, please retry shortly"}), 503, {"Retry-After": str(retry_after)}
+    # Handle any unexpected errors
+    logger.exception("Request failed")
+    return jsonify({"response": str(e)}), 500
 
 @app.route('/api/process', methods=['POST'])
 def process_query():
@@ -155,84 +598,125 @@ def process_query():
     Expects a user query and an optional zip file.
     """
     try:
-        # Get the user query from the request
-        user_query = request.form.get('query')
-        if not user_query:
-            return jsonify({"response": "User query is required"}), 400
-
-        # Handle file upload (if any)
-        file_path = None
-        if 'file' in request.files:
-            file = request.files['file']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                print(f"File uploaded successfully: {file_path}")
-            else:
-                return jsonify({"response": "Invalid file type. Only .zip files are allowed"}), 400
+        timings = StageTimings()
+        with timings.stage("upload"):
+            user_query, question_id, zip_bytes = read_process_form()
+        plan = prepare_answer(user_query, question_id, zip_bytes, timings)
 
-        # Extract question ID from the zip file name
-        if file_path:
-            question_id = extract_question_id(file.filename)
-            if not question_id:
-                return jsonify({"response": "Question ID not found in the zip file name"}), 400
-        else:
-            return jsonify({"response": "Zip file is required to extract the question ID"}), 400
-
-        # Analyze the user query
-        print("stated")
-        analysis_result = analyze_user_query(user_query)
-        print("ended")
-        user_query_summary = analysis_result.get("user_query_summary", "")
-        query_category = analysis_result.get("query_category", "Other")
-
-        # Fetch question details from the CSV file
-        question_details = get_question_details(question_id)
-        if not question_details:
-            return jsonify({"response": "Question details not found"}), 400
-
-        # Extract user code from the zip file
-        user_code = extract_user_code(file_path) if file_path else "No code provided"
-
-        # Construct the issue context
-        issue_context = (
-            f"User Query: {user_query_summary}, "
-            f"Question details: {question_details}, "
-            f"User code: {user_code}"
-        )
-        
-        # Import prompts based on query category
-        # Replace this with your actual logic to import prompts
-        if "Test case failures" in query_category or \
-        "Unexpected output" in query_category or \
-        "Mistakes Explanation" in query_category:
-            response = llm_call(get_test_cases_qr_v0_prompt(), issue_context)
-
-        elif "Fix specific errors" in query_category:
-            response = llm_call(get_specific_errors_qr_v0_prompt(), issue_context)
-
-        elif "Code publishing issue" in query_category:
-            response = llm_call(get_publishing_related_query_system_prompt(), user_query_summary)
-
-        elif "IDE issue" in query_category:
-            response = llm_call(get_ide_related_queries_system_prompt(), user_query_summary)
-
-        elif "Conceptual doubts" in query_category:
-            response = llm_call(conceptual_doubt_prompt(), user_query_summary)
-
-        elif "Problem solving approach" in query_category or "Implementation guidance" in query_category:
-            response = llm_call(get_implementation_guidance_prompt(), issue_context)
+        headers = {}
+        response, cache_status = answer_for(plan, timings)
+        if cache_status:
+            headers["X-Cache"] = cache_status
 
-        else:
-            response = "<mentor_required>"
+        logger.info("Request finished", extra={"timings": timings.server_timing()})
+        headers["Server-Timing"] = timings.server_timing()
 
         # Return the response as JSON
-        return jsonify({"response": response}), 200
+        return jsonify({"response": response, "included_files": plan.files_sent}), 200, headers
 
     except Exception as e:
-        # Handle any unexpected errors
-        return jsonify({"response": str(e)}), 500
+        return error_response(e)
+
+@app.route('/api/process/stream', methods=['POST'])
+def process_query_stream():
+    """
+    Streaming variant of /api/process using server-sent events.
+    Sends a "classification" event as soon as the query is classified, then
+    "token" events as the answer is generated upstream, then "done".
+    Request errors before the stream starts get the same JSON responses as /api/process.
+    """
+    try:
+        timings = StageTimings()
+        with timings.stage("upload"):
+            user_query, question_id, zip_bytes = read_process_form()
+        plan = prepare_answer(user_query, question_id, zip_bytes, timings, speculate=False, combined=False)
+    except Exception as e:
+        return error_response(e)
+
+    def generate():
+        yield sse_event("classification", {
+            "query_category": plan.query_category,
+            "user_query_summary": plan.user_query_summary,
+        })
+        try:
+            if plan.system_prompt is None:
+                yield sse_event("token", {"text": "<mentor_required>"})
+            else:
+                cached = response_cache.get(plan.cache_key)
+                if cached is not None:
+                    yield sse_event("token", {"text": cached})
+                else:
+                    for text in stream_answer(plan, timings):
+                        yield sse_event("token", {"text": text})
+            yield sse_event("done", {"included_files": plan.files_sent, "timings": timings.server_timing()})
+        except Exception as e:
+            error = {"response": str(e)}
+            if isinstance(e, Overloaded):
+                error["retry_after"] = e.retry_after
+            yield sse_event("error", error)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": timings.server_timing()}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Job variant of /api/process for answers that take longer than the client or
+    proxy will wait: takes the same form, stores it as a job and returns 202
+    with the job id at once. Poll the status URL or subscribe to the events URL.
+    """
+    try:
+        user_query, question_id, zip_bytes = read_process_form()
+        job_id = job_store.submit(user_query, question_id, zip_bytes, g.trace_id)
+    except Exception as e:
+        return error_response(e)
+    job_workers.notify()
+    status_url = url_for("job_status", job_id=job_id)
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": status_url,
+        "events_url": url_for("job_events", job_id=job_id),
+    }), 202, {"Location": status_url}
+
+@app.route("/api/jobs/stats")
+def job_stats():
+    """Jobs in the store by status."""
+    return jsonify(job_store.stats()), 200
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    """
+    A job's status ("queued", "running", "done" or "failed"), stage, classification once known,
+    and result (the /api/process response body) or error.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"response": "Job not found"}), 404
+    return jsonify(job), 200
+
+@app.route("/api/jobs/<job_id>/events")
+def job_events(job_id):
+    """
+    Server-sent "status" events with the job's state each time its status or
+    stage changes; the stream ends once the job is done or failed. Each open
+    stream holds one of the gunicorn worker's threads, so it also ends after
+    JOB_EVENTS_MAX_DURATION; EventSource clients reconnect on their own.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({"response": "Job not found"}), 404
+
+    def generate():
+        for job in job_updates(job_store, job_id, max_duration=JOB_EVENTS_MAX_DURATION):
+            if job is None:
+                yield sse_event("error", {"response": "Job not found"})
+            elif not job:
+                yield ": keep-alive\n\n"
+            else:
+                yield sse_event("status", job)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,162 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are kept per process; with several gunicorn workers
+each worker reports its own series, so scrape the workers individually or
+sum them in the query.
+"""
+import bisect
+import threading
+import uuid
+
+from query_classifier import CATEGORIES
+
+# Seconds; LLM calls dominate, so the buckets reach well into the minutes.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _sample_value(value):
+    """A gauge value as exposition text: bools as 0/1, None (the sample is left out) for anything non-numeric."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def category_label(category):
+    """The known category a query_category label value names, "Other" for anything else; keeps label sets bounded."""
+    if not category:
+        return ""
+    return next((known for known in CATEGORIES if known in category), "Other")
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_gauges(self, name, help_text, callback):
+        """
+        callback() returns {label pairs tuple or (): value}, evaluated at scrape time.
+        Registering the same name again replaces the previous callback.
+        """
+        self._collectors[name] = (help_text, callback)
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for name, (help_text, callback) in list(self._collectors.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in sorted(callback().items()):
+                sample = _sample_value(value)
+                if sample is not None:
+                    lines.append(f"{name}{_format_labels(key)} {sample}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.counter("mentor_requests_total", "HTTP requests by endpoint and status code.")
+REQUEST_SECONDS = registry.histogram("mentor_request_duration_seconds", "HTTP request latency by endpoint.")
+STAGE_SECONDS = registry.histogram("mentor_stage_duration_seconds", "Pipeline stage latency.")
+LLM_CALL_SECONDS = registry.histogram("mentor_llm_call_duration_seconds", "LLM call latency by call and category.")
+LLM_TOKENS = registry.counter("mentor_llm_tokens_total", "LLM tokens by call, category and kind (prompt/completion).")
+UPSTREAM_RESPONSES = registry.counter("mentor_llm_upstream_responses_total", "Upstream LLM HTTP status codes.")
+
+
+def new_trace_id(incoming=None):
+    """Uses a sane client-supplied trace ID, otherwise generates one."""
+    if incoming and len(incoming) <= 64 and incoming.replace("-", "").isalnum():
+        return incoming
+    return uuid.uuid4().hex
+
+
+def record_usage(usage, call, category=""):
+    """Counts the prompt/completion tokens of one LLM response, if the API reported them."""
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            LLM_TOKENS.inc(tokens, call=call, category=category_label(category), kind=kind)
@@ -0,0 +1,154 @@
+"""
+Which model, and which endpoint, each LLM call goes to.
+
+There are two tiers. The reasoner (LLM_MODEL at REQUEST_URL) answers the
+code-heavy routes. The fast tier (LLM_FAST_MODEL, at LLM_FAST_URL or the same
+endpoint) takes the calls that don't need a reasoning model: the stages in
+LLM_FAST_CALLS (classification by default) and the answers of the categories
+in LLM_FAST_CATEGORIES (the few-shot publishing and IDE templates by
+default). Prompts estimated above LLM_FAST_MAX_PROMPT_TOKENS stay on the
+reasoner whatever their route. Without LLM_FAST_MODEL every call uses the
+reasoner, as before.
+
+Each tier has a latency budget: the read timeout of its calls. A fast call
+escalates to the reasoner when it fails, exceeds its budget or returns
+something that doesn't validate: a classification that isn't valid JSON
+with a known category, an unparseable or truncated combined reply, or an
+answer shorter than LLM_FAST_MIN_ANSWER_CHARS. Streamed answers can't be
+taken back once sent, so they use their tier without validation.
+"""
+import os
+import threading
+from collections import namedtuple
+
+import metrics
+from combined_call import parse_reply
+from pipeline import parse_classification
+from query_classifier import CATEGORIES
+
+REASONER = "reasoner"
+FAST = "fast"
+
+# latency_budget is the read timeout of the tier's calls in seconds; None keeps LLM_READ_TIMEOUT.
+ModelTier = namedtuple("ModelTier", ["name", "model", "url", "api_key", "latency_budget"])
+
+LLM_FAST_CALLS = frozenset(call for call in os.getenv("LLM_FAST_CALLS", "classify").split(",") if call)
+LLM_FAST_CATEGORIES = tuple(
+    category for category in os.getenv("LLM_FAST_CATEGORIES", "Code publishing issue,IDE issue").split(",") if category)
+LLM_FAST_MAX_PROMPT_TOKENS = int(os.getenv("LLM_FAST_MAX_PROMPT_TOKENS", 16000))
+LLM_FAST_MIN_ANSWER_CHARS = int(os.getenv("LLM_FAST_MIN_ANSWER_CHARS", 40))
+
+MODEL_CALLS = metrics.registry.counter("mentor_llm_model_calls_total", "LLM calls by model tier and call.")
+ESCALATIONS = metrics.registry.counter(
+    "mentor_llm_escalations_total", "Fast-tier calls redone on the reasoner, by call and reason (error, invalid).")
+
+
+def tiers_from_env():
+    """(reasoner, fast) tiers from LLM_MODEL, REQUEST_URL, API_KEY and the LLM_FAST_* settings; fast may be None."""
+    reasoner = ModelTier(REASONER, os.getenv("LLM_MODEL", "DEEPSEEK-REASONER"), os.getenv("REQUEST_URL"),
+                         os.getenv("API_KEY"), float(os.getenv("LLM_REASONER_BUDGET", 0)) or None)
+    fast_model = os.getenv("LLM_FAST_MODEL")
+    if not fast_model:
+        return reasoner, None
+    fast = ModelTier(FAST, fast_model, os.getenv("LLM_FAST_URL") or reasoner.url,
+                     os.getenv("LLM_FAST_API_KEY") or reasoner.api_key,
+                     float(os.getenv("LLM_FAST_BUDGET", 20)) or None)
+    return reasoner, fast
+
+
+def valid_classification(content):
+    try:
+        result = parse_classification(content)
+    except ValueError:
+        return False
+    category = result.get("query_category") if isinstance(result, dict) else None
+    return isinstance(category, str) and any(known in category for known in CATEGORIES)
+
+
+def valid_combined_reply(content):
+    try:
+        _, answer = parse_reply(content)
+    except ValueError:
+        return False
+    return answer is not None
+
+
+def valid_answer(content):
+    return len(content.strip()) >= LLM_FAST_MIN_ANSWER_CHARS
+
+
+# What a fast-tier reply has to pass, by call, to be used without escalating.
+VALIDATORS = {
+    "classify": valid_classification,
+    "combined": valid_combined_reply,
+    "answer": valid_answer,
+    "speculative": valid_answer,
+}
+
+
+class ModelRouter:
+    """Picks the tier of each call and decides escalations; thread-safe counters for /api/llm/stats."""
+
+    def __init__(self, reasoner, fast=None, fast_calls=LLM_FAST_CALLS, fast_categories=LLM_FAST_CATEGORIES,
+                 fast_max_prompt_tokens=LLM_FAST_MAX_PROMPT_TOKENS):
+        self.reasoner = reasoner
+        self.fast = fast
+        self.fast_calls = fast_calls
+        self.fast_categories = fast_categories
+        self.fast_max_prompt_tokens = fast_max_prompt_tokens
+        self._lock = threading.Lock()
+        self.calls = {REASONER: 0, FAST: 0}
+        self.escalations = {"error": 0, "invalid": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(*tiers_from_env())
+
+    @property
+    def tiers(self):
+        return [tier for tier in (self.reasoner, self.fast) if tier is not None]
+
+    def tier_for(self, call, category="", prompt_tokens=0):
+        """The tier a call starts on: fast for the fast stages and categories, unless its prompt is too large."""
+        tier = self.reasoner
+        if self.fast is not None and prompt_tokens <= self.fast_max_prompt_tokens:
+            if call in self.fast_calls or (
+                    call in ("answer", "speculative")
+                    and any(fast in (category or "") for fast in self.fast_categories)):
+                tier = self.fast
+        self._count(tier, call)
+        return tier
+
+    def accepts(self, tier, call, content):
+        """False when a fast-tier reply fails its call's validation and should be redone on the reasoner."""
+        if tier is not self.fast:
+            return True
+        validate = VALIDATORS.get(call)
+        return validate is None or validate(content)
+
+    def escalate(self, tier, call, reason):
+        """The reasoner, when a call on the fast tier failed (reason "error") or didn't validate ("invalid"); else None."""
+        if self.fast is None or tier is not self.fast:
+            return None
+        with self._lock:
+            self.escalations[reason] += 1
+        ESCALATIONS.inc(call=call, reason=reason)
+        self._count(self.reasoner, call)
+        return self.reasoner
+
+    def _count(self, tier, call):
+        with self._lock:
+            self.calls[tier.name] += 1
+        MODEL_CALLS.inc(tier=tier.name, call=call)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tiers": {tier.name: {"model": tier.model, "latency_budget": tier.latency_budget}
+                          for tier in self.tiers},
+                "calls": dict(self.calls),
+                "escalations": dict(self.escalations),
+            }
+
+
+router = ModelRouter.from_env()
@@ -0,0 +1,356 @@
+"""
+Transport-independent steps of the /api/process pipeline, shared by the
+Flask app (main.py) and the ASGI app (asgi_app.py).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from prompts import (
+    conceptual_doubt_prompt,
+    get_implementation_guidance_prompt,
+    get_test_cases_qr_v0_prompt,
+    get_specific_errors_qr_v0_prompt,
+    get_publishing_related_query_system_prompt,
+    get_ide_related_queries_system_prompt,
+)
+import app_logging
+import metrics
+from context_builder import build_code_context, index_files
+from few_shot import ide_examples, publishing_examples
+from jobs import JobStore
+from query_classifier import LOCAL_CLASSIFIER_ENABLED, LocalClassifier, load_model
+from question_catalog import QuestionCatalog
+from question_store import QuestionStore
+from question_text import render_question_context
+from response_cache import ResponseCache, answer_cache_key, content_hash, normalize_query
+from submission_store import SubmissionStore
+from test_cases import relevant_test_cases
+from zip_ingest import ZipIngestError, read_text_members
+
+logger = logging.getLogger(__name__)
+
+# While the LLM classifies a query, load the question and the user's code in the
+# background even though the category may not need them: the wait is free. With 0
+# they are only loaded once the category is known to need them.
+PREFETCH_INPUTS = os.getenv("PREFETCH_INPUTS", "1") == "1"
+
+# Configuration for file uploads
+ALLOWED_EXTENSIONS = {'zip'}
+
+# Everything the answer step needs once classification and extraction are done.
+# system_prompt is None when the query has to go to a mentor. speculative_answer
+# is the pending answer of an adopted speculation (see speculation.py), and answer
+# the one a combined classify+answer call already returned (see combined_call.py).
+AnswerPlan = namedtuple("AnswerPlan", [
+    "analysis_result", "user_query_summary", "query_category",
+    "system_prompt", "user_prompt", "files_sent", "cache_key", "speculative_answer", "answer",
+], defaults=(None, None))
+
+
+class RequestError(Exception):
+    """A problem with the request itself, reported to the client with status_code."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+# Path to the commands.csv file
+COMMANDS_CSV_PATH = 'commands.csv'
+
+# Compiled, memory-mapped catalog (python question_catalog.py build), shared across workers.
+# When it is missing or older than commands.csv we fall back to parsing the CSV once
+# into memory; both reload automatically when the files change.
+question_catalog = QuestionCatalog(COMMANDS_CSV_PATH)
+question_store = QuestionStore(COMMANDS_CSV_PATH)
+if not question_catalog.is_fresh():
+    logger.warning("Question catalog missing or stale, falling back to commands.csv")
+    question_store.refresh()
+
+# Answers keyed on question, normalized summary, category, prompts, error and code (see answer_cache_key)
+response_cache = ResponseCache()
+
+# Extracted uploads by zip digest, shared by all workers (SUBMISSION_STORE_* settings)
+submission_store = SubmissionStore()
+
+# Jobs of the asynchronous /api/jobs mode (JOBS_DB_PATH, JOB_* settings), shared by all workers
+job_store = JobStore()
+
+# Answers obvious queries without the LLM classification call (LOCAL_CLASSIFIER_* settings)
+local_classifier = LocalClassifier(load_model()) if LOCAL_CLASSIFIER_ENABLED else None
+
+metrics.registry.add_gauges(
+    "mentor_answer_cache", "Answer cache counters and size.",
+    lambda: {(("stat", key),): value for key, value in response_cache.stats().items()},
+)
+metrics.registry.add_gauges(
+    "mentor_local_classifier", "Classifications answered locally vs sent to the LLM.",
+    lambda: {(("stat", key),): int(value) if isinstance(value, bool) else value
+             for key, value in local_classifier.stats().items()
+             if isinstance(value, (int, float))} if local_classifier else {},
+)
+metrics.registry.add_gauges(
+    "mentor_submission_store", "Reuse of extracted submissions and the store's size on disk.",
+    lambda: {(("stat", key),): value for key, value in submission_store.stats().items()},
+)
+metrics.registry.add_gauges(
+    "mentor_jobs", "Jobs in the job store by status.",
+    lambda: {(("status", status),): count for status, count in job_store.stats().items()},
+)
+metrics.registry.add_gauges(
+    "mentor_log_records_dropped", "Log records dropped because the log queue was full.",
+    lambda: {(): app_logging.dropped_records()},
+)
+
+
+def allowed_file(filename):
+    """Check if the file has an allowed extension."""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def extract_question_id(filename):
+    """
+    Extracts the question ID from the zip file's name.
+    Assumes the zip file name is in the format "RJSCPYQN94.zip".
+    """
+    # Remove the .zip extension and extract the question ID
+    if filename.endswith('.zip'):
+        return filename[:-4]  # Remove the last 4 characters (.zip)
+    return None
+
+
+def get_question_details(question_id):
+    """
+    Fetches the question details for the question ID from the compiled catalog,
+    or from the in-memory CSV store when the catalog is stale.
+    Returns None if the question ID is not present in commands.csv.
+    """
+    try:
+        if question_catalog.is_fresh():
+            record = question_catalog.get(question_id)
+        else:
+            record = question_store.get(question_id)
+        if record is None:
+            return None
+        return record._asdict()
+    except Exception:
+        logger.exception("Error fetching question details")
+        return None
+
+
+def extract_user_code(zip_source):
+    """
+    Reads all text files from the uploaded zip file in memory.
+    Returns a list of (file name, content) tuples.
+    Raises ZipIngestError if the archive is rejected.
+    """
+    try:
+        files = read_text_members(zip_source)
+        logger.info("Extracted %d files from the zip", len(files))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Extracted files", extra={"files": [name for name, _ in files]})
+
+        if not files:
+            logger.info("No valid text files found in the zip file")
+        return files
+    except ZipIngestError:
+        raise
+    except Exception:
+        logger.exception("Error extracting user code")
+        return None
+
+
+class StageTimings:
+    """
+    Wall-clock duration of each pipeline stage for one request.
+    Safe to record from the worker threads that run stages concurrently.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+        metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timed(self, stage, func, *args):
+        """Calls func(*args) and records its duration under stage."""
+        with self.stage(stage):
+            return func(*args)
+
+    def overlap_saved(self, wall_stage, stages):
+        """Seconds saved by running stages concurrently inside wall_stage instead of back to back."""
+        serial = sum(self.durations.get(stage, 0.0) for stage in stages)
+        return max(0.0, serial - self.durations.get(wall_stage, 0.0))
+
+    def server_timing(self):
+        """Formats the durations as a Server-Timing header value (milliseconds)."""
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.durations.items())
+
+
+def load_user_files(zip_bytes):
+    """
+    Extracts the user's files, or reuses the extraction of an identical earlier
+    upload, and tokenizes them for ranking.
+    Nothing here depends on the classification result.
+    """
+    return index_files(submission_store.load(zip_bytes, extract_user_code) or [])
+
+
+def build_messages(system_prompt, user_prompt):
+    """Prepare messages as required by the API."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def classify_locally(user_query):
+    """Returns the local classifier's result for confident predictions, otherwise None."""
+    if local_classifier is None:
+        return None
+    result = local_classifier.classify(user_query)
+    if result is not None:
+        logger.info("Classified locally", extra={"query_category": result["query_category"],
+                                                 "confidence": result["confidence"]})
+    return result
+
+
+def parse_classification(result):
+    """Parses the JSON the classification prompt returns, tolerating ``` fences."""
+    return json.loads(result.replace("```json", "").replace("```", ""))
+
+
+def classification_key(user_query):
+    """Single-flight key of the classification call: the normalized query."""
+    return content_hash(normalize_query(user_query))
+
+
+def code_query_text(analysis_result):
+    """Text the user's files are ranked against: the query summary plus any error description."""
+    return f"{analysis_result.get('user_query_summary', '')} {analysis_result.get('error_description', '')}"
+
+
+def build_issue_context(user_query_summary, question_context, user_code):
+    """
+    Construct the issue context sent to the code-based prompts.
+    question_context is normally the block rendered when the questions are loaded (see question_text).
+    """
+    return (
+        f"User Query: {user_query_summary}\n\n"
+        f"Question details:\n{question_context}\n\n"
+        f"User code: {user_code}"
+    )
+
+
+# Inputs an answer prompt can consume; each is only computed for routes that list it.
+QUESTION = "question"   # the question's details from commands.csv (get_question_details)
+USER_CODE = "user_code"  # the user's files from the zip (load_user_files)
+
+# How a query category is answered: the system prompt, built from the text the
+# few-shot examples are matched against, and the inputs the user prompt needs.
+# relevant_tests_only trims the question's test cases to the ones matching the query.
+AnswerRoute = namedtuple("AnswerRoute", ["categories", "prompt", "inputs", "relevant_tests_only"])
+
+ISSUE_CONTEXT = frozenset({QUESTION, USER_CODE})
+NO_INPUTS = frozenset()
+
+ANSWER_ROUTES = (
+    AnswerRoute(("Test case failures", "Unexpected output", "Mistakes Explanation"),
+                lambda query_text: get_test_cases_qr_v0_prompt(), ISSUE_CONTEXT, True),
+    AnswerRoute(("Fix specific errors",),
+                lambda query_text: get_specific_errors_qr_v0_prompt(), ISSUE_CONTEXT, False),
+    AnswerRoute(("Code publishing issue",),
+                lambda query_text: get_publishing_related_query_system_prompt(publishing_examples.select(query_text)),
+                NO_INPUTS, False),
+    AnswerRoute(("IDE issue",),
+                lambda query_text: get_ide_related_queries_system_prompt(ide_examples.select(query_text)),
+                NO_INPUTS, False),
+    AnswerRoute(("Conceptual doubts",),
+                lambda query_text: conceptual_doubt_prompt(), NO_INPUTS, False),
+    AnswerRoute(("Problem solving approach", "Implementation guidance"),
+                lambda query_text: get_implementation_guidance_prompt(), ISSUE_CONTEXT, False),
+)
+
+
+def route_for(query_category):
+    """The first AnswerRoute with a category contained in query_category; None when a mentor is required."""
+    for route in ANSWER_ROUTES:
+        if any(category in query_category for category in route.categories):
+            return route
+    return None
+
+
+def required_inputs(query_category):
+    """The inputs (QUESTION, USER_CODE) the answer for query_category consumes."""
+    route = route_for(query_category)
+    return route.inputs if route is not None else NO_INPUTS
+
+
+def input_loaders(question_id, zip_bytes):
+    """The (stage, function, argument) that loads each route input of one request."""
+    return {
+        QUESTION: ("lookup", get_question_details, question_id),
+        USER_CODE: ("extract", load_user_files, zip_bytes),
+    }
+
+
+def plan_answer(question_id, analysis_result, question_details, user_files, timings):
+    """
+    Builds the answer prompt for a classified query. question_details and
+    user_files only need to be loaded for the inputs the category's route lists.
+    Raises RequestError if the route needs the question and it is unknown.
+    """
+    user_query_summary = analysis_result.get("user_query_summary", "")
+    query_category = analysis_result.get("query_category", "Other")
+
+    route = route_for(query_category)
+    if route is None:
+        return AnswerPlan(analysis_result, user_query_summary, query_category, None, None, [], None)
+    if QUESTION in route.inputs and not question_details:
+        raise RequestError("Question details not found")
+
+    query_text = code_query_text(analysis_result)
+    system_prompt = route.prompt(query_text)
+
+    user_code, files_sent, question_context = "", [], ""
+    if route.inputs == ISSUE_CONTEXT:
+        test_cases = question_details["question_test_cases"]
+        question_context = question_details["question_context"]
+        if route.relevant_tests_only:
+            with timings.stage("test_cases"):
+                relevant = relevant_test_cases(test_cases, query_text)
+            if relevant is not test_cases:
+                test_cases = relevant
+                question_context = render_question_context(question_details["question_content"], test_cases)
+
+        # Keep only the files relevant to the query
+        with timings.stage("context"):
+            user_code, files_sent = build_code_context(user_files or [], query_text, test_cases)
+        user_prompt = build_issue_context(user_query_summary, question_context, user_code)
+    else:
+        user_prompt = user_query_summary
+
+    cache_key = answer_cache_key(question_id, user_query_summary, query_category, system_prompt, user_code,
+                                 question_context, analysis_result.get("error_description", ""))
+    return AnswerPlan(analysis_result, user_query_summary, query_category,
+                      system_prompt, user_prompt, files_sent, cache_key)
+
+
+def sse_event(event, data):
+    """Formats one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
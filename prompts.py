@@ -9,8 +9,7 @@ Could you be elaborate and be more specific about your query. So that we could h
 "OUT_OF_SCOPE"
 """
 
-def get_query_classification_prompt():
-    prompt = """
+QUERY_CLASSIFICATION_INSTRUCTIONS = """
     As a helpful coding mentor , Your current task is to first summarize the user query in detail and then classify user query in following categories, You would recieve user query along with images they have shared related to query, Assume you've access to user code as well. Here are the valid categories you can classify into:
     <Test case failures> - Query related to test case/s or specific test cases are failing.
     <Mistakes Explanation> - Query about identifying a mistake in the code or Assistance with resolving a specific error messags (or messages) or issue (or issues) in the code.
@@ -23,7 +22,10 @@ def get_query_classification_prompt():
 
     Remeber the github and git issues should be classified in Conceptual doubts category instead of Code publishing issue category
     Make sure you don't miss any critical detail in summarizing the user query and be as thorough as possible, and also add a valid and detailed decription of error like if its present. Don't add any explnation or solution for error add error description as per what user has shared  and be extremely careful and classify the query accurately in one of the categories, if you're confused then classify into <Other> category .
-    Reply in following format only and remeber to always return a valid json
+"""
+
+def get_query_classification_prompt():
+    prompt = QUERY_CLASSIFICATION_INSTRUCTIONS + """    Reply in following format only and remeber to always return a valid json
     {"user_query_summary":"//Add summary here", "error_description":"//Add detailed error description here , if any error is shared by user" ,"query_category" : "//Add category here"}
 
     Only reply with a valid json nothing else
@@ -183,11 +185,11 @@ Additional Templates:
       onClick={this.correct} // Remove the function call
       ```
     """
-def get_ide_related_queries_system_prompt():
+def get_ide_related_queries_system_prompt(examples=ide_queries_examples):
     prompt = f"""
   You're a helpful coding mentor specializing in debugging Integrated Development Environment (IDE) issues. Your job is to assist users with problems they encounter while using the IDE that we have developed. When presented with a user query, respond in a helpful and informative manner.
 Based on our previous interactions with users we've identified some general issues that they face , You can refer them from here:
-{ide_queries_examples}
+{examples}
 When addressing user queries, please follow this response format:
 ```
 Hi,
@@ -243,7 +245,7 @@ publishing_queries_example = """
 
         Refer to [this](https://learning.ccbp.in/discussions/27fa55f7-fbaf-4c4a-a45b-9e2e38f966e1) discussion to know how to publish your React Project."""
 
-def get_publishing_related_query_system_prompt():
+def get_publishing_related_query_system_prompt(examples=publishing_queries_example):
     prompt = f"""
 You're a helpful coding mentor specializing in assisting users with publishing issues. Your task is to guide users through the publishing process and help them resolve any problems they encounter. The general flow for publishing is as follows:
 User code should not have any errors after running npm start
@@ -253,7 +255,7 @@ ccbp publish codingPracticeID name.ccbp.tech
 (Here, name.ccbp.tech is the Domain URL, codingPracticeID is a unique ID corresponding to the questions they are answering, and name.ccbp.tech is a 15-character unique name)
 
 Here are some example queries and their resolutions for your reference:
-{publishing_queries_example}
+{examples}
 When addressing user queries, please follow this response format:
 ```
 Hi,
@@ -651,3 +653,30 @@ Hope it solved you query, Feel free to reach out to us if you have any other que
  """
 
     return prompt
+
+def get_classify_and_answer_prompt(answer_instructions):
+    """
+    The classification prompt extended to answer the query in the same reply
+    when it falls in one of the categories of answer_instructions, a list of
+    (categories, answer system prompt) pairs.
+    """
+    answered = ", ".join(f"<{category}>" for categories, _ in answer_instructions for category in categories)
+    sections = "\n\n".join(
+        f"### Answer instructions for {', '.join(f'<{category}>' for category in categories)}\n{instructions.strip()}"
+        for categories, instructions in answer_instructions
+    )
+    prompt = QUERY_CLASSIFICATION_INSTRUCTIONS + f"""
+    Once you have classified the query, if its category is one of {answered}, also answer the user query in the same reply, following the answer instructions for that category below. For any other category leave the answer empty.
+
+{sections}
+
+## Reply format
+Reply in the following format only, the classification first and as valid json:
+<classification>
+{{"user_query_summary":"//Add summary here", "error_description":"//Add detailed error description here , if any error is shared by user" ,"query_category" : "//Add category here"}}
+</classification>
+<answer>
+//Add the answer here, or nothing if the category isn't one of {answered}
+</answer>
+"""
+    return prompt
@@ -0,0 +1,261 @@
+"""
+Local fast-path query classifier.
+
+Keyword rules plus a small multinomial naive Bayes model trained on labelled
+queries. When the local prediction is confident enough, analyze_user_query
+uses it directly and skips the LLM classification round trip; otherwise the
+LLM classifies as before.
+
+Train a model from labelled queries (e.g. LLM labels collected via LABEL_LOG_PATH):
+    python query_classifier.py train --labels llm_labels.jsonl --out query_classifier_model.json
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") == "1"
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", 0.9))
+# Naive Bayes posteriors are overconfident; predictions without a rule behind them
+# need a higher bar, and are only trusted from a model trained on real LLM labels.
+LOCAL_MODEL_THRESHOLD = float(os.getenv("LOCAL_MODEL_THRESHOLD", 0.99))
+# Long queries need a real summary, which only the LLM produces.
+LOCAL_CLASSIFIER_MAX_CHARS = int(os.getenv("LOCAL_CLASSIFIER_MAX_CHARS", 300))
+QUERY_CLASSIFIER_MODEL = os.getenv("QUERY_CLASSIFIER_MODEL", "query_classifier_model.json")
+SEED_LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_labels_seed.jsonl")
+# When set, every LLM classification is appended here as training/evaluation data.
+LABEL_LOG_PATH = os.getenv("LABEL_LOG_PATH")
+
+# Categories from get_query_classification_prompt
+CATEGORIES = (
+    "Test case failures",
+    "Mistakes Explanation",
+    "Unexpected output",
+    "Implementation guidance",
+    "Conceptual doubts",
+    "Code publishing issue",
+    "IDE issue",
+    "Other",
+)
+
+# (pattern, unless, category, confidence): unambiguous wording we see again and again.
+RULES = [
+    (re.compile(r"\bccbp\s+publish\b|\b(unable|not able|can ?not|can't) (to )?publish\b|\bpublish\w*\b.*\b(error|fail\w*|not working)\b", re.I),
+     re.compile(r"\bgit(hub)?\b", re.I), "Code publishing issue", 0.95),
+    (re.compile(r"no space left|port\s*\d+\s*(is\s+)?already in use|502 bad gateway|submission size exceeded|your code is empty|\b(new|create)\b.*\bworkspace\b", re.I),
+     None, "IDE issue", 0.95),
+    (re.compile(r"\btest[\s_-]*cases?\b.*\b(fail\w*|not pass\w*)\b|\b(fail\w*|not pass\w*)\b.*\btest[\s_-]*cases?\b|\bTEST_\d+\b", re.I),
+     None, "Test case failures", 0.93),
+]
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+_ERROR_LINE_RE = re.compile(r"\b\w*(error|exception|failed|cannot|can't|unable)\w*\b", re.I)
+
+
+def features(text):
+    """Lower-cased words plus adjacent-word bigrams."""
+    words = _WORD_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def match_rules(query):
+    """Returns (category, confidence) for the first matching keyword rule, or None."""
+    for pattern, unless, category, confidence in RULES:
+        if pattern.search(query) and not (unless and unless.search(query)):
+            return category, confidence
+    return None
+
+
+class NaiveBayesModel:
+    """
+    Multinomial naive Bayes with Laplace smoothing over features().
+    """
+
+    def __init__(self, class_counts, term_counts, seed_only=False):
+        self.seed_only = seed_only
+        self.class_counts = class_counts
+        self.term_counts = term_counts
+        self.vocabulary = {term for counts in term_counts.values() for term in counts}
+        self.class_totals = {label: sum(counts.values()) for label, counts in term_counts.items()}
+        self.total_docs = sum(class_counts.values())
+
+    @classmethod
+    def train(cls, examples):
+        """examples: iterable of (query, category)."""
+        class_counts = Counter()
+        term_counts = defaultdict(Counter)
+        for query, category in examples:
+            class_counts[category] += 1
+            term_counts[category].update(features(query))
+        return cls(dict(class_counts), {label: dict(counts) for label, counts in term_counts.items()})
+
+    def predict_proba(self, query):
+        """Posterior probability per category."""
+        terms = [term for term in features(query) if term in self.vocabulary]
+        vocab_size = len(self.vocabulary) or 1
+        scores = {}
+        for label, doc_count in self.class_counts.items():
+            counts = self.term_counts.get(label, {})
+            denominator = self.class_totals.get(label, 0) + vocab_size
+            score = math.log(doc_count / self.total_docs)
+            for term in terms:
+                score += math.log((counts.get(term, 0) + 1) / denominator)
+            scores[label] = score
+        if not scores:
+            return {}
+        top = max(scores.values())
+        exp = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exp.values())
+        return {label: value / total for label, value in exp.items()}
+
+    def to_dict(self):
+        return {"class_counts": self.class_counts, "term_counts": self.term_counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["class_counts"], data["term_counts"])
+
+
+def read_labels(path):
+    """Reads (query, category) pairs from a JSONL file of {"query", "query_category"} objects."""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if row.get("query") and row.get("query_category") in CATEGORIES:
+                examples.append((row["query"], row["query_category"]))
+    return examples
+
+
+def load_model(path=QUERY_CLASSIFIER_MODEL):
+    """Loads a trained model, or trains one from the bundled seed labels."""
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return NaiveBayesModel.from_dict(json.load(f))
+    model = NaiveBayesModel.train(read_labels(SEED_LABELS_PATH))
+    model.seed_only = True
+    return model
+
+
+class LocalClassifier:
+    """
+    Combines the keyword rules and the model into one prediction with a confidence.
+    """
+
+    def __init__(self, model=None, threshold=LOCAL_CLASSIFIER_THRESHOLD, model_threshold=LOCAL_MODEL_THRESHOLD,
+                 max_chars=LOCAL_CLASSIFIER_MAX_CHARS):
+        self.model = model
+        self.threshold = threshold
+        self.model_threshold = model_threshold
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.fallbacks = 0
+
+    def predict(self, query):
+        """Returns (category, confidence, source) without applying the threshold."""
+        probabilities = self.model.predict_proba(query) if self.model else {}
+        model_category, model_confidence = max(probabilities.items(), key=lambda item: item[1], default=(None, 0.0))
+        rule = match_rules(query)
+        if rule is None:
+            return model_category, model_confidence, "model"
+        category, confidence = rule
+        if model_category == category:
+            # Rule and model agree: combine them as independent evidence.
+            confidence = 1 - (1 - confidence) * (1 - model_confidence)
+        elif model_confidence >= self.threshold:
+            # A confident model disagreeing with a rule is a reason to ask the LLM.
+            confidence = min(confidence, 1 - model_confidence)
+        return category, confidence, "rules"
+
+    def classify(self, query):
+        """
+        Returns an analyze_user_query-shaped result for confident predictions,
+        or None when the LLM should classify the query.
+        """
+        category, confidence, source = self.predict(query) if len(query) <= self.max_chars else (None, 0.0, None)
+        threshold = self.threshold
+        if source == "model" and self.model is not None:
+            threshold = float("inf") if self.model.seed_only else self.model_threshold
+        if category is None or category == "Other" or confidence < threshold:
+            with self._lock:
+                self.fallbacks += 1
+            return None
+        with self._lock:
+            self.local_hits += 1
+        return self._result(query, category, confidence, source)
+
+    def guess(self, query, min_confidence):
+        """
+        Like classify(), but only requires min_confidence and doesn't count towards
+        the stats; for work that is cheap to throw away when the guess is wrong.
+        """
+        category, confidence, source = self.predict(query)
+        if category is None or category == "Other" or confidence < min_confidence:
+            return None
+        return self._result(query, category, confidence, source)
+
+    @staticmethod
+    def _result(query, category, confidence, source):
+        error_lines = [line.strip() for line in query.splitlines() if _ERROR_LINE_RE.search(line)]
+        return {
+            "user_query_summary": " ".join(query.split()),
+            "error_description": "\n".join(error_lines),
+            "query_category": category,
+            "classifier": source,
+            "confidence": round(confidence, 3),
+        }
+
+    def stats(self):
+        with self._lock:
+            total = self.local_hits + self.fallbacks
+            return {
+                "enabled": LOCAL_CLASSIFIER_ENABLED,
+                "threshold": self.threshold,
+                "model_threshold": self.model_threshold,
+                "model_seed_only": bool(self.model and self.model.seed_only),
+                "local_hits": self.local_hits,
+                "llm_fallbacks": self.fallbacks,
+                "llm_calls_saved_rate": self.local_hits / total if total else 0.0,
+            }
+
+
+_label_log_lock = threading.Lock()
+
+
+def record_llm_label(query, category):
+    """Appends an LLM classification to LABEL_LOG_PATH, if configured."""
+    if not LABEL_LOG_PATH:
+        return
+    line = json.dumps({"query": query, "query_category": category}) + "\n"
+    with _label_log_lock:
+        with open(LABEL_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local query classifier.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    train = subcommands.add_parser("train", help="train a model from labelled JSONL files")
+    train.add_argument("--labels", action="append", default=[], help="JSONL of {query, query_category}; repeatable")
+    train.add_argument("--no-seed", action="store_true", help="don't include the bundled seed labels")
+    train.add_argument("--out", default=QUERY_CLASSIFIER_MODEL)
+    args = parser.parse_args()
+
+    examples = [] if args.no_seed else read_labels(SEED_LABELS_PATH)
+    for path in args.labels:
+        examples.extend(read_labels(path))
+    model = NaiveBayesModel.train(examples)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f)
+    print(f"Trained on {len(examples)} labelled queries, wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Compiled, memory-mapped question catalog.
+
+commands.csv is compiled into a single binary file laid out as:
+
+    header  | magic, source csv mtime_ns, source csv size, entry count
+    entries | question_command_id + (offset, length) per text field + context_tokens
+    data    | utf-8 field values
+
+Workers mmap the file read-only, so the pages are shared between gunicorn
+processes and only the fields of the requested question are ever decoded.
+
+Rebuild with:
+    python question_catalog.py build [--csv commands.csv] [--out commands.qcat]
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from question_store import QuestionRecord, read_questions
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MAGIC = b"QCAT0003"
+MAX_ID_BYTES = 32
+
+# Every QuestionRecord field but the trailing token count is text.
+TEXT_FIELDS = QuestionRecord._fields[:-1]
+
+HEADER = struct.Struct("<8sqqI")
+ENTRY = struct.Struct(f"<{MAX_ID_BYTES}s" + "QI" * len(TEXT_FIELDS) + "I")
+
+
+def catalog_path_for(csv_path):
+    """Default location of the compiled catalog next to the CSV."""
+    return os.path.splitext(csv_path)[0] + ".qcat"
+
+
+def build_catalog(csv_path, catalog_path=None):
+    """
+    Compiles csv_path into the binary catalog format and atomically replaces catalog_path.
+    Returns the number of questions written.
+    """
+    catalog_path = catalog_path or catalog_path_for(csv_path)
+    stat = os.stat(csv_path)
+    questions = read_questions(csv_path)
+
+    data_start = HEADER.size + ENTRY.size * len(questions)
+    entries = []
+    blobs = []
+    offset = data_start
+    for question_id in sorted(questions):
+        encoded_id = question_id.encode("utf-8")
+        if len(encoded_id) > MAX_ID_BYTES:
+            raise ValueError(f"question_command_id too long for catalog: {question_id!r}")
+        record = questions[question_id]
+        spans = []
+        for field in TEXT_FIELDS:
+            blob = getattr(record, field).encode("utf-8")
+            spans.extend((offset, len(blob)))
+            blobs.append(blob)
+            offset += len(blob)
+        entries.append(ENTRY.pack(encoded_id, *spans, record.context_tokens))
+
+    tmp_path = f"{catalog_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(CATALOG_MAGIC, stat.st_mtime_ns, stat.st_size, len(entries)))
+        out.writelines(entries)
+        out.writelines(blobs)
+    os.replace(tmp_path, catalog_path)
+    return len(entries)
+
+
+class QuestionCatalog:
+    """
+    Read-only view over a compiled catalog file.
+    The catalog is only used while it matches the current commands.csv;
+    callers should fall back to the CSV when is_fresh() is False.
+    """
+
+    def __init__(self, csv_path, catalog_path=None):
+        self.csv_path = csv_path
+        self.catalog_path = catalog_path or catalog_path_for(csv_path)
+        self._view = (None, {})
+        self._source = None
+        self._catalog_mtime = None
+        self._lock = threading.Lock()
+
+    def _open(self, catalog_mtime):
+        with open(self.catalog_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, source_mtime, source_size, count = HEADER.unpack_from(mm, 0)
+        if magic != CATALOG_MAGIC:
+            mm.close()
+            raise ValueError(f"{self.catalog_path} is not a question catalog")
+
+        # The offset table is tiny; the field data stays in the mapped pages.
+        offsets = {}
+        for i in range(count):
+            encoded_id, *spans = ENTRY.unpack_from(mm, HEADER.size + i * ENTRY.size)
+            offsets[encoded_id.rstrip(b"\0").decode("utf-8")] = tuple(spans)
+
+        # Swapped as one tuple so readers never pair an old map with new offsets;
+        # a previous map stays alive until the readers holding it are done.
+        self._view = (mm, offsets)
+        self._source = (source_mtime, source_size)
+        self._catalog_mtime = catalog_mtime
+
+    def is_fresh(self):
+        """True when the catalog exists and was compiled from the current commands.csv."""
+        try:
+            catalog_mtime = os.stat(self.catalog_path).st_mtime_ns
+            csv_stat = os.stat(self.csv_path)
+        except FileNotFoundError:
+            return False
+        if catalog_mtime != self._catalog_mtime:
+            with self._lock:
+                if catalog_mtime != self._catalog_mtime:
+                    try:
+                        self._open(catalog_mtime)
+                    except (OSError, ValueError, struct.error) as e:
+                        logger.warning("Error opening question catalog: %s", e)
+                        return False
+        return self._source == (csv_stat.st_mtime_ns, csv_stat.st_size)
+
+    def get_field(self, question_id, field):
+        """Decodes a single field of a question straight from the mapped file."""
+        mm, offsets = self._view
+        spans = offsets.get(question_id)
+        if spans is None:
+            return None
+        if field == "context_tokens":
+            return spans[-1]
+        i = TEXT_FIELDS.index(field)
+        offset, length = spans[2 * i], spans[2 * i + 1]
+        return mm[offset:offset + length].decode("utf-8")
+
+    def get(self, question_id):
+        """Returns the QuestionRecord for question_id, or None if it is unknown."""
+        mm, offsets = self._view
+        spans = offsets.get(question_id)
+        if spans is None:
+            return None
+        return QuestionRecord(*(
+            mm[spans[i]:spans[i] + spans[i + 1]].decode("utf-8")
+            for i in range(0, len(spans) - 1, 2)
+        ), spans[-1])
+
+    def __len__(self):
+        return len(self._view[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile commands.csv into a memory-mapped question catalog.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="(re)build the catalog from the CSV")
+    build.add_argument("--csv", default="commands.csv")
+    build.add_argument("--out", default=None, help="defaults to the CSV path with a .qcat extension")
+    check = subcommands.add_parser("check", help="exit non-zero if the catalog is missing or stale")
+    check.add_argument("--csv", default="commands.csv")
+    check.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_catalog(args.csv, args.out)
+        print(f"Wrote {count} questions to {args.out or catalog_path_for(args.csv)}")
+    else:
+        catalog = QuestionCatalog(args.csv, args.out)
+        if not catalog.is_fresh():
+            print(f"{catalog.catalog_path} is missing or stale, rebuild it with: python question_catalog.py build")
+            raise SystemExit(1)
+        print(f"{catalog.catalog_path} is up to date ({len(catalog)} questions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+from question_text import prepare_question
+
+# Only the columns the prompts actually use are kept in memory, already cleaned
+# (see question_text). question_context is the rendered block the prompts get and
+# context_tokens its estimated size.
+QuestionRecord = namedtuple("QuestionRecord", [
+    "question_content", "question_test_cases", "question_context", "context_tokens",
+])
+SOURCE_FIELDS = ("question_content", "question_test_cases")
+
+logger = logging.getLogger(__name__)
+
+
+def read_questions(csv_path):
+    """
+    Parses commands.csv into a dict of question_command_id -> QuestionRecord.
+    """
+    df = pd.read_csv(
+        csv_path,
+        usecols=["question_command_id", *SOURCE_FIELDS],
+        dtype=str,
+        keep_default_na=False,
+    )
+    index = {}
+    for question_id, rows in df.groupby("question_command_id", sort=False):
+        # A few ids appear on more than one row; keep every distinct value
+        # so nothing the old per-request lookup returned is lost.
+        index[question_id] = QuestionRecord(*prepare_question(*(
+            "\n\n".join(dict.fromkeys(rows[field]))
+            for field in SOURCE_FIELDS
+        )))
+    return index
+
+
+class QuestionStore:
+    """
+    In-memory index of commands.csv keyed by question_command_id.
+    The CSV is parsed once and re-parsed only when its mtime changes.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self._index = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self, mtime):
+        index = read_questions(self.csv_path)
+        self._index = index
+        self._mtime = mtime
+        logger.info("Loaded %d questions from %s", len(index), self.csv_path)
+
+    def refresh(self):
+        """Reloads the index if commands.csv changed on disk since the last load."""
+        mtime = os.stat(self.csv_path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._load(mtime)
+
+    def get(self, question_id):
+        """Returns the QuestionRecord for question_id, or None if it is unknown."""
+        self.refresh()
+        return self._index.get(question_id)
+
+    def __len__(self):
+        return len(self._index)
@@ -0,0 +1,84 @@
+"""
+Compact, prompt-ready text for commands.csv questions.
+
+The question content is markdown with embedded images and videos (<img>,
+<video> in centred <div>s) and links to design images; none of that helps the
+model. clean_markdown() removes only that media, with targeted patterns, and
+leaves everything else as written: fenced code (indented ones in list items
+too), inline code and JSX, <details> sections and the test instructions.
+Test cases are kept verbatim. Questions are cleaned and rendered once when
+commands.csv is loaded, not per request.
+"""
+import re
+
+from context_builder import estimate_tokens
+
+MEDIA_EXTENSIONS = ("png", "jpg", "jpeg", "gif", "svg", "webp", "mp4", "webm", "mov")
+
+# Fenced blocks, indented ones included, and inline code are never touched.
+_FENCE_RE = re.compile(r"(^[ \t]*```.*?^[ \t]*```[ \t]*$)", re.M | re.S)
+_INLINE_CODE_RE = re.compile(r"`[^`\n]+`")
+_PLACEHOLDER_RE = re.compile(r"\x00(\d+)\x00")
+# An embedded image (with a src; a bare "<img>" in prose is text) or a whole <video> element.
+_HTML_MEDIA_RE = re.compile(r"<img\b[^>]*\bsrc=[^>]*>|<video\b[^>]*>.*?</video>", re.I | re.S)
+# The centring <div> around an image or video, once it is empty.
+_EMPTY_DIV_RE = re.compile(r"<div\b[^>]*>\s*</div>", re.I)
+_MD_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_MD_MEDIA_LINK_RE = re.compile(
+    r"\[([^\]]*)\]\(\s*https?://[^)\s]+\.(?:" + "|".join(MEDIA_EXTENSIONS) + r")(?:\?[^)\s]*)?\s*\)", re.I)
+# Headings that only introduced an image or video we removed.
+_MEDIA_HEADING_RE = re.compile(r"^#+ .*\b(image|gif|video|output)s? below:?[ \t]*$", re.I | re.M)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _clean_prose(text):
+    """Removes the media from a markdown segment that contains no fenced code."""
+    # Inline code can mention <img src=...> as an example; keep it.
+    spans = []
+
+    def stash(match):
+        spans.append(match.group(0))
+        return f"\x00{len(spans) - 1}\x00"
+
+    text = _INLINE_CODE_RE.sub(stash, text)
+    text = _HTML_MEDIA_RE.sub("", text)
+    text = _EMPTY_DIV_RE.sub("", text)
+    text = _MD_IMAGE_RE.sub("", text)
+    # Design mock-ups keep only their label. Resource links are labelled with the URL
+    # itself (image src values the tests check), so those keep the URL.
+    text = _MD_MEDIA_LINK_RE.sub(lambda m: m.group(1), text)
+    text = _MEDIA_HEADING_RE.sub("", text)
+    return _PLACEHOLDER_RE.sub(lambda m: spans[int(m.group(1))], text)
+
+
+def clean_markdown(text):
+    """Removes images and videos from question markdown; code and all other text stay as they are."""
+    if not text:
+        return ""
+    parts = _FENCE_RE.split(text)
+    # split() with one group alternates prose and fenced blocks.
+    cleaned = [
+        part if i % 2 else _clean_prose(part)
+        for i, part in enumerate(parts)
+    ]
+    text = "\n".join(line.rstrip() for line in "".join(cleaned).split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def render_question_context(content, test_cases):
+    """The question block sent to the code-based prompts."""
+    sections = [f"Question:\n{content}"] if content else []
+    if test_cases:
+        sections.append(f"Test cases:\n{test_cases}")
+    return "\n\n".join(sections)
+
+
+def prepare_question(content, test_cases):
+    """
+    Cleans one question's raw fields.
+    Returns (question_content, question_test_cases, question_context, context_tokens).
+    """
+    content = clean_markdown(content)
+    test_cases = (test_cases or "").strip()
+    context = render_question_context(content, test_cases)
+    return content, test_cases, context, estimate_tokens(context)
@@ -0,0 +1,108 @@
+"""
+In-process LRU cache for mentor answers.
+
+Answers are generated at temperature 0.0, so the same question, query,
+category, code and prompt produce the same answer; resubmissions can be
+served from memory instead of another reasoner call.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 6 * 60 * 60))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def content_hash(text):
+    """Short, stable digest of a string."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query summary."""
+    return _WHITESPACE_RE.sub(" ", text or "").strip().strip(".!?").lower()
+
+
+def answer_cache_key(question_id, user_query_summary, query_category, system_prompt, user_code="",
+                     question_context="", error_description=""):
+    """
+    Key for one answer call. The system prompt is hashed into the key, so editing
+    prompts.py invalidates every entry built from the old prompt.
+    user_code and question_context (the question text and the test cases chosen
+    for it) are what was actually sent, so an edited question CSV invalidates its
+    entries too; both are empty for prompts that don't include them.
+    """
+    return content_hash("\0".join((
+        question_id or "",
+        normalize_query(user_query_summary),
+        query_category or "",
+        content_hash(system_prompt),
+        content_hash(user_code),
+        content_hash(question_context),
+        str(error_description or ""),
+    )))
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached value, or None on a miss or an expired entry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,157 @@
+"""
+Single-flight coalescing of identical in-flight LLM calls.
+
+When several requests need the same call at the same time (same normalized
+query for classification, same answer cache key for the answer), the first
+one makes the call and the others wait for its result instead of sending
+their own. Coalescing is per process; gunicorn workers don't share calls.
+"""
+import asyncio
+import threading
+
+import metrics
+from llm_client import LLMError
+
+COALESCED = metrics.registry.counter(
+    "mentor_llm_calls_coalesced_total", "LLM calls avoided by joining an identical in-flight call.")
+
+
+def _waiter_error(error):
+    """
+    What the waiters of a failed call get. A leader that was cancelled, or
+    whose client went away (GeneratorExit), gives them an LLMError: they are
+    still running and need an exception their error handling catches.
+    """
+    if error is None or isinstance(error, Exception):
+        return error
+    return LLMError("The identical request being answered was cancelled")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _Counters:
+    def __init__(self, name):
+        self.name = name
+        self.leaders = 0
+        self.collapsed = 0
+
+    def _joined(self):
+        self.collapsed += 1
+        COALESCED.inc(call=self.name)
+
+    def stats(self, in_flight):
+        calls = self.leaders + self.collapsed
+        return {
+            "in_flight": in_flight,
+            "calls": self.leaders,
+            "collapsed": self.collapsed,
+            "collapsed_rate": self.collapsed / calls if calls else 0.0,
+        }
+
+
+class SingleFlight(_Counters):
+    """
+    Thread-based single flight for the Flask app.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Returns (call, is_leader). The leader must call finish(); everyone
+        else calls call.wait() for the leader's result or exception.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._joined()
+                return call, False
+            call = self._calls[key] = _Call()
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        call.result = result
+        call.error = _waiter_error(error)
+        with self._lock:
+            self._calls.pop(key, None)
+        call.done.set()
+
+    def do(self, key, fn):
+        """Runs fn() unless an identical call is in flight, and returns its result."""
+        call, leader = self.acquire(key)
+        if not leader:
+            return call.wait()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return super().stats(len(self._calls))
+
+
+class AsyncSingleFlight(_Counters):
+    """
+    asyncio single flight for the ASGI app; all callers run on one event loop.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._calls = {}
+
+    def acquire(self, key):
+        """Returns (future, is_leader); the leader must call finish()."""
+        future = self._calls.get(key)
+        if future is not None:
+            self._joined()
+            return future, False
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting when the leader fails; don't warn about it.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.leaders += 1
+        return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        self._calls.pop(key, None)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(_waiter_error(error))
+        else:
+            future.set_result(result)
+
+    async def do(self, key, fn):
+        """Awaits fn() unless an identical call is in flight, and returns its result."""
+        future, leader = self.acquire(key)
+        if not leader:
+            # shield: one waiter being cancelled must not cancel the shared call.
+            return await asyncio.shield(future)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result=result)
+        return result
+
+    def stats(self):
+        return super().stats(len(self._calls))
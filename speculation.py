@@ -0,0 +1,128 @@
+"""
+Speculative answer generation (opt-in, SPECULATIVE_ANSWERS=1).
+
+Normally the answer call waits for the LLM classification, so a request pays
+two reasoner round trips back to back. In speculative mode the local
+classifier guesses the category up front, even below its usual confidence
+threshold. The answer call for that category's prompt then starts alongside
+the classification call, built from the raw query the way a locally
+classified request would be.
+
+When the LLM classification lands on the same answer route
+(pipeline.ANSWER_ROUTES), the speculative answer is used; otherwise it is
+cancelled (mid-stream if need be) and the tokens it spent are counted as
+wasted. Speculative calls get the
+lowest limiter priority, so they never delay regular calls.
+
+Only /api/process and jobs speculate; the streaming endpoint already shows
+the answer as it is generated.
+"""
+import os
+import threading
+
+import metrics
+from pipeline import local_classifier, route_for
+from query_classifier import LocalClassifier, load_model
+
+SPECULATIVE_ANSWERS = os.getenv("SPECULATIVE_ANSWERS", "0") == "1"
+# Lowest local-classifier confidence worth spending a speculative answer call on.
+SPECULATION_MIN_CONFIDENCE = float(os.getenv("SPECULATION_MIN_CONFIDENCE", 0.5))
+# Threads for speculative calls in the Flask app; a request whose guess finds them
+# all busy just doesn't speculate.
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", 16))
+
+SPECULATIONS = metrics.registry.counter(
+    "mentor_speculations_total", "Speculative answer calls by outcome (kept, discarded, failed, skipped).")
+WASTED_TOKENS = metrics.registry.counter(
+    "mentor_speculation_wasted_tokens_total", "Tokens spent on discarded speculative answers, by kind.")
+
+# The speculation guesses even when the local fast path is disabled.
+predictor = local_classifier or (LocalClassifier(load_model()) if SPECULATIVE_ANSWERS else None)
+
+
+def guess_category(user_query):
+    """The local prediction to speculate on, shaped like a classification result; None when there is none."""
+    if predictor is None:
+        return None
+    return predictor.guess(user_query, SPECULATION_MIN_CONFIDENCE)
+
+
+class _Tracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"started": 0, "kept": 0, "discarded": 0, "failed": 0, "skipped": 0}
+        self.wasted = {"prompt": 0, "completion": 0}
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+        if outcome != "started":
+            SPECULATIONS.inc(outcome=outcome)
+
+    def waste(self, prompt_tokens, completion_tokens):
+        with self._lock:
+            self.wasted["prompt"] += prompt_tokens
+            self.wasted["completion"] += completion_tokens
+        WASTED_TOKENS.inc(prompt_tokens, kind="prompt")
+        WASTED_TOKENS.inc(completion_tokens, kind="completion")
+
+    def stats(self):
+        with self._lock:
+            decided = self.counts["kept"] + self.counts["discarded"]
+            return dict(
+                self.counts,
+                enabled=SPECULATIVE_ANSWERS,
+                hit_rate=self.counts["kept"] / decided if decided else 0.0,
+                wasted_prompt_tokens=self.wasted["prompt"],
+                wasted_completion_tokens=self.wasted["completion"],
+            )
+
+
+tracker = _Tracker()
+
+
+class Speculation:
+    """
+    One request's speculative answer. The app's runner reports the tokens its
+    call spent with spent(); the request decides with keep() or discard().
+    Whichever comes last counts a discarded call's tokens as wasted.
+    """
+
+    def __init__(self, guess):
+        self.guess = guess
+        # The runner's pending AnswerPlan and answer text (Futures or asyncio tasks).
+        self.plan = None
+        self.answer = None
+        self.discarded = False
+        self._spent = None
+        self._lock = threading.Lock()
+        tracker.count("started")
+
+    def agrees(self, analysis_result):
+        """True when the real classification is answered with the same prompt as the guess."""
+        route = route_for(analysis_result.get("query_category", "Other"))
+        return route is not None and route is route_for(self.guess["query_category"])
+
+    def keep(self):
+        tracker.count("kept")
+
+    def discard(self):
+        with self._lock:
+            if self.discarded:
+                return
+            self.discarded = True
+            spent = self._spent
+        tracker.count("discarded")
+        if spent:
+            tracker.waste(*spent)
+
+    def spent(self, prompt_tokens, completion_tokens):
+        """Records the call's token usage once it finished or was cut short."""
+        with self._lock:
+            self._spent = (prompt_tokens, completion_tokens)
+            discarded = self.discarded
+        if discarded:
+            tracker.waste(prompt_tokens, completion_tokens)
+
+    def failed(self):
+        tracker.count("failed")
@@ -0,0 +1,185 @@
+"""
+Content-addressed store of extracted submissions.
+
+Uploads are keyed by the SHA-256 of the zip itself, not its file name, so two
+users uploading RJSCPYQN94.zip at once never see each other's code, and the
+same submission uploaded again (a retry, a follow-up question, another
+gunicorn worker) reuses the extraction instead of unzipping it again.
+
+Only the extracted, noise-filtered text files are kept, compressed, one file
+per submission under SUBMISSION_STORE_DIR; the zips themselves are never
+written to disk. Reads refresh an entry's mtime, and once the directory grows
+past SUBMISSION_STORE_MAX_BYTES the least recently used entries are deleted.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import zlib
+
+from context_builder import is_noise
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_STORE_DIR = os.getenv("SUBMISSION_STORE_DIR", "submissions")
+# 0 disables the store; every upload is extracted again.
+SUBMISSION_STORE_MAX_BYTES = int(os.getenv("SUBMISSION_STORE_MAX_BYTES", 256 * 1024 * 1024))
+# Eviction deletes down to this fraction of the limit, so it doesn't run on every write.
+LOW_WATER_MARK = 0.8
+# Bump when the extraction or filtering changes; old entries then age out.
+FORMAT_VERSION = "v1"
+SUFFIX = ".json.z"
+
+
+def submission_digest(zip_bytes):
+    """Hex SHA-256 of an uploaded zip."""
+    return hashlib.sha256(zip_bytes).hexdigest()
+
+
+class SubmissionStore:
+    """
+    Extracted files by zip digest, on disk, with size-bounded LRU eviction.
+    Safe to share between threads and between processes using the same directory.
+    """
+
+    def __init__(self, root=SUBMISSION_STORE_DIR, max_bytes=SUBMISSION_STORE_MAX_BYTES):
+        self.root = os.path.join(root, FORMAT_VERSION)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Bytes on disk, as of the last scan plus our own writes since; other processes
+        # write too, so eviction rescans before deleting anything.
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + SUFFIX)
+
+    def get(self, digest):
+        """The stored (name, text) list for a digest, or None."""
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        try:
+            return [tuple(item) for item in json.loads(zlib.decompress(data))]
+        except (zlib.error, ValueError):
+            logger.warning("Discarding corrupt submission entry", extra={"digest": digest})
+            self._remove(path)
+            return None
+
+    def put(self, digest, files):
+        """Stores the (name, text) list for a digest, replacing any entry atomically."""
+        path = self._path(digest)
+        data = zlib.compress(json.dumps(files).encode("utf-8"), 6)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            self._remove(tmp)
+            raise
+        with self._lock:
+            self.writes += 1
+            if self._size is not None:
+                self._size += len(data)
+            due = self._size is None or self._size > self.max_bytes
+        if due:
+            self.evict()
+
+    def load(self, zip_bytes, extract):
+        """
+        The noise-filtered (name, text) files of an uploaded zip, from the store when
+        this exact zip was seen before, else extract(zip_bytes) filtered and stored.
+        extract's errors propagate, and a None result (extraction failed) isn't stored.
+        """
+        if not self.enabled:
+            return extract(zip_bytes)
+        digest = submission_digest(zip_bytes)
+        files = self.get(digest)
+        if files is not None:
+            with self._lock:
+                self.hits += 1
+            logger.info("Reused extracted submission", extra={"digest": digest[:12], "files": len(files)})
+            return files
+        with self._lock:
+            self.misses += 1
+        files = extract(zip_bytes)
+        if files is None:
+            return None
+        files = [(name, text) for name, text in files if not is_noise(name)]
+        try:
+            self.put(digest, files)
+        except OSError:
+            logger.exception("Could not store the extracted submission")
+        return files
+
+    def _entries(self):
+        """(mtime, size, path) of every stored entry."""
+        entries = []
+        try:
+            shards = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return entries
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Rescans the store and deletes least recently used entries while it is over its limit."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * LOW_WATER_MARK
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                if self._remove(path):
+                    total -= size
+                    evicted += 1
+            logger.info("Evicted submissions", extra={"evicted": evicted, "bytes": total})
+        with self._lock:
+            self._size = total
+            self.evictions += evicted
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "bytes": self._size or 0,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,112 @@
+"""
+Per-question index of individual test cases.
+
+question_test_cases is one free-text blob of "TEST_n: ..." (or
+"Test_case_n: ...") lines, often dozens of them. For the test-case prompt only
+the cases that match the user's query summary and error description are sent,
+followed by a one-line list of the ids that were left out.
+"""
+import math
+import os
+import re
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+from context_builder import tokenize
+
+# More cases than this are trimmed to the relevant ones.
+MAX_TEST_CASES = int(os.getenv("MAX_TEST_CASES", 5))
+
+# number is the case's position in its id ("TEST_12" -> 12); text is whitespace-normalized.
+TestCase = namedtuple("TestCase", ["case_id", "number", "text", "terms"])
+
+_CASE_START_RE = re.compile(r"^\s*((?:TEST|Test_case)_(\d+))\s*:\s*", re.I)
+_BOILERPLATE = {"```", "here are the test cases to verify:"}
+# "TEST_3", "test case 3", "testcase #3", "test 3"
+_REFERENCE_RE = re.compile(r"\btest(?:[\s_-]*case)?[\s_-]*(?:no\.?\s*|#\s*)?(\d+)\b", re.I)
+
+
+@lru_cache(maxsize=1024)
+def index_test_cases(text):
+    """
+    Splits a question's test-case text into TestCases, in order.
+    Cached per distinct text, so each question is parsed once per process.
+    """
+    cases = []
+    current = None
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.lower() in _BOILERPLATE:
+            continue
+        match = _CASE_START_RE.match(line)
+        if match:
+            current = [match.group(1), int(match.group(2)), [line[match.end():].strip()]]
+            cases.append(current)
+        elif current is not None:
+            current[2].append(stripped)
+    return tuple(
+        TestCase(case_id, number, " ".join(" ".join(parts).split()).rstrip(","), Counter(tokenize(" ".join(parts))))
+        for case_id, number, parts in cases
+    )
+
+
+def referenced_numbers(query_text):
+    """Test case numbers the user mentioned explicitly."""
+    return {int(number) for number in _REFERENCE_RE.findall(query_text or "")}
+
+
+def score_test_cases(cases, query_text):
+    """Scores each case by the idf-weighted query terms it contains."""
+    query_terms = set(tokenize(query_text))
+    document_frequency = Counter(term for case in cases for term in set(case.terms) & query_terms)
+    total = len(cases)
+    idf = {term: math.log(1 + total / count) for term, count in document_frequency.items()}
+    return [sum(idf[term] for term in idf if term in case.terms) for case in cases]
+
+
+def select_test_cases(cases, query_text, max_cases=None):
+    """
+    Picks the cases relevant to query_text: the ones referenced by number first,
+    then the best scoring. Returns (selected, omitted), each in original order.
+    """
+    if max_cases is None:
+        max_cases = MAX_TEST_CASES
+    referenced = referenced_numbers(query_text)
+    scores = score_test_cases(cases, query_text)
+    ranked = sorted(
+        (i for i, score in enumerate(scores) if score > 0 or cases[i].number in referenced),
+        key=lambda i: (cases[i].number not in referenced, -scores[i], i),
+    )
+    chosen = set(ranked[:max(max_cases, sum(1 for case in cases if case.number in referenced))])
+    selected = [case for i, case in enumerate(cases) if i in chosen]
+    omitted = [case for i, case in enumerate(cases) if i not in chosen]
+    return selected, omitted
+
+
+def summarize_ids(cases):
+    """Compact id list, runs of consecutive numbers collapsed: "TEST_1-TEST_4, TEST_7"."""
+    runs = []
+    for case in cases:
+        if runs and case.number == runs[-1][-1].number + 1:
+            runs[-1].append(case)
+        else:
+            runs.append([case])
+    return ", ".join(run[0].case_id if len(run) == 1 else f"{run[0].case_id}-{run[-1].case_id}" for run in runs)
+
+
+def relevant_test_cases(test_case_text, query_text, max_cases=None):
+    """
+    The test-case text to send for query_text. Returns test_case_text unchanged
+    when it has few cases or none of them match the query.
+    """
+    if max_cases is None:
+        max_cases = MAX_TEST_CASES
+    cases = index_test_cases(test_case_text)
+    if len(cases) <= max_cases:
+        return test_case_text
+    selected, omitted = select_test_cases(cases, query_text, max_cases)
+    if not selected:
+        return test_case_text
+    lines = [f"{case.case_id}: {case.text}" for case in selected]
+    lines.append(f"\n{len(omitted)} more test cases not shown: {summarize_ids(sorted(omitted, key=lambda case: case.number))}")
+    return "\n".join(lines)
@@ -0,0 +1,52 @@
+"""
+Hedged requests and the app's concurrency limiter, against the local LLM stub.
+"""
+import os
+import sys
+import time
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "benchmarks")]
+
+import hedging  # noqa: E402
+from concurrency_limiter import PRIORITY_ANSWER, AdaptiveLimiter  # noqa: E402
+from llm_client import LLMClient  # noqa: E402
+from llm_stub import start_stub  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "My test fails"}]
+
+
+@pytest.fixture
+def slow_and_fast(monkeypatch):
+    monkeypatch.setattr(hedging, "LLM_HEDGE_INITIAL_DELAY", 0.1)
+    servers = [start_stub(latency=latency) for latency in (1.0, 0.0)]
+    yield [url for _, url in servers]
+    for server, _ in servers:
+        server.shutdown()
+
+
+def test_losing_attempt_keeps_a_limiter_slot_until_it_finishes(slow_and_fast):
+    limiter = AdaptiveLimiter(initial=4)
+    client = hedging.HedgedClient([LLMClient(url, "stub", max_retries=0) for url in slow_and_fast],
+                                  hedging=True, max_hedge_ratio=1.0)
+    client.limiter = limiter
+    with limiter.slot(PRIORITY_ANSWER):
+        client.complete(MESSAGES, "stub-model")
+    assert client.stats()["hedging"]["hedge_wins"] == 1
+    # The hedge won; the primary is still running upstream and still counted.
+    assert limiter.stats()["in_flight"] == 1
+    time.sleep(1.2)
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_no_hedge_without_a_free_slot(slow_and_fast):
+    limiter = AdaptiveLimiter(initial=1)
+    client = hedging.HedgedClient([LLMClient(url, "stub", max_retries=0) for url in slow_and_fast],
+                                  hedging=True, max_hedge_ratio=1.0)
+    client.limiter = limiter
+    with limiter.slot(PRIORITY_ANSWER):
+        client.complete(MESSAGES, "stub-model")
+    assert client.stats()["hedging"]["hedged"] == 0
+    assert limiter.stats()["in_flight"] == 0
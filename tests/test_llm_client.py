@@ -0,0 +1,65 @@
+"""
+Streams that outlive their read timeout, against the local LLM stub: the error
+says it timed out, so a model's latency budget doesn't count against the
+endpoint (see hedging.endpoint_fault).
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "benchmarks")]
+
+from hedging import HedgedClient  # noqa: E402
+from llm_client import AsyncLLMClient, LLMClient, LLMError  # noqa: E402
+from llm_stub import start_stub  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "My test fails"}]
+
+
+@pytest.fixture(scope="module")
+def slow_stream_url():
+    # Headers come at once, then one word every second: only the body outlives the timeout.
+    server, url = start_stub(latency=0.0, token_delay=1.0)
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def fast_url():
+    server, url = start_stub(latency=0.0)
+    yield url
+    server.shutdown()
+
+
+def test_sync_stream_read_timeout_is_timed_out(slow_stream_url):
+    client = LLMClient(slow_stream_url, "stub", max_retries=0)
+    with pytest.raises(LLMError) as info:
+        list(client.stream_chat(MESSAGES, "stub-model", read_timeout=0.2))
+    assert info.value.timed_out
+
+
+def test_async_stream_read_timeout_is_timed_out(slow_stream_url):
+    async def stream():
+        client = AsyncLLMClient(slow_stream_url, "stub", max_retries=0)
+        try:
+            return [text async for text in client.stream_chat(MESSAGES, "stub-model", read_timeout=0.2)]
+        finally:
+            await client.aclose()
+
+    with pytest.raises(LLMError) as info:
+        asyncio.run(stream())
+    assert info.value.timed_out
+
+
+def test_stream_over_budget_neither_trips_the_breaker_nor_fails_over(slow_stream_url, fast_url):
+    client = HedgedClient([LLMClient(slow_stream_url, "stub", max_retries=0), LLMClient(fast_url, "stub")],
+                          hedging=False)
+    client.endpoints[0].breaker.failure_threshold = 1
+    with pytest.raises(LLMError):
+        list(client.stream_chat(MESSAGES, "stub-model", read_timeout=0.2))
+    stats = client.stats()
+    assert [endpoint["breaker"] for endpoint in stats["endpoints"]] == ["closed", "closed"]
+    assert stats["hedging"]["failovers"] == 0
@@ -0,0 +1,77 @@
+"""
+clean_markdown() over every question in commands.csv: only images, videos and
+their wrappers go; every other line of the question and the test cases stays.
+"""
+import os
+import re
+import sys
+
+import pandas as pd
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from question_text import clean_markdown, prepare_question  # noqa: E402
+
+# What may disappear from a line: embedded media and markdown images. The centring
+# <div> around an image or video goes too, as lines of its own.
+MEDIA = re.compile(r"<img\b[^>]*>|</?video\b[^>]*>|<source\b[^>]*>|!\[[^\]]*\]\([^)]*\)", re.I)
+MEDIA_LINK = re.compile(r"\[([^\]]*)\]\(\s*https?://[^)\s]+\.(?:png|jpe?g|gif|svg|webp|mp4|webm|mov)[^)]*\)", re.I)
+MEDIA_HEADING = re.compile(r"^#+ .*\b(image|gif|video|output)s? below:?$", re.I)
+WRAPPER = re.compile(r"^\s*(<div\b[^>]*>|</div>)\s*$", re.I)
+
+
+def load_questions():
+    df = pd.read_csv(os.path.join(REPO_ROOT, "commands.csv"), dtype=str, keep_default_na=False)
+    return df.drop_duplicates("question_command_id")
+
+
+QUESTIONS = load_questions()
+IDS = list(QUESTIONS.question_command_id)
+CONTENTS = list(zip(IDS, QUESTIONS.question_content))
+TEST_CASES = list(zip(IDS, QUESTIONS.question_test_cases))
+
+
+def without_media(line):
+    """A line with its media removed, as a reader would write it by hand."""
+    line = MEDIA_LINK.sub(lambda m: m.group(1), MEDIA.sub("", line)).rstrip()
+    return "" if MEDIA_HEADING.match(line.strip()) else line
+
+
+def text_lines(text):
+    return [line for line in text.split("\n") if line.strip()]
+
+
+@pytest.mark.parametrize("question_id, content", CONTENTS, ids=IDS)
+def test_only_media_is_removed(question_id, content):
+    before = [line for line in text_lines(content) if not WRAPPER.match(line)]
+    after = [line for line in text_lines(clean_markdown(content)) if not WRAPPER.match(line)]
+    assert after == text_lines("\n".join(without_media(line) for line in before)), question_id
+
+
+@pytest.mark.parametrize("question_id, content", CONTENTS, ids=IDS)
+def test_code_and_instructions_survive(question_id, content):
+    cleaned = clean_markdown(content)
+    for snippet in re.findall(r"data-testid=\S+", content):
+        assert snippet in cleaned, (question_id, snippet)
+    for fence in re.findall(r"^[ \t]*```.*?^[ \t]*```[ \t]*$", content, re.M | re.S):
+        assert fence in cleaned, (question_id, fence[:80])
+    for jsx in re.findall(r"<[A-Z]\w*[^>]*/?>", content):
+        assert jsx in cleaned, (question_id, jsx)
+    marker = "The following instructions are required for the tests to pass"
+    if marker in content:
+        section = content[content.index(marker):].split("\n\n", 2)[:2]
+        assert all(part.strip() in cleaned for part in section), question_id
+
+
+def test_media_is_gone():
+    cleaned = "\n".join(clean_markdown(content) for content in QUESTIONS.question_content)
+    assert "<img " not in cleaned.replace("`<img ", "")
+    assert "<video" not in cleaned
+    assert "![" not in cleaned
+
+
+@pytest.mark.parametrize("question_id, test_cases", TEST_CASES, ids=IDS)
+def test_test_cases_are_verbatim(question_id, test_cases):
+    assert prepare_question("", test_cases)[1] == test_cases.strip(), question_id
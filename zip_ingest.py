@@ -0,0 +1,92 @@
+"""
+Bounded, in-memory reading of uploaded code archives.
+
+Members are streamed straight out of the zip; nothing is written to disk.
+"""
+import io
+import logging
+import os
+import zipfile
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+MAX_MEMBER_BYTES = int(os.getenv("MAX_MEMBER_BYTES", 1024 * 1024))
+MAX_TOTAL_BYTES = int(os.getenv("MAX_TOTAL_BYTES", 5 * 1024 * 1024))
+MAX_MEMBERS = int(os.getenv("MAX_MEMBERS", 5000))
+MAX_COMPRESSION_RATIO = int(os.getenv("MAX_COMPRESSION_RATIO", 100))
+
+logger = logging.getLogger(__name__)
+
+SNIFF_BYTES = 1024
+BINARY_SIGNATURES = (
+    b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"%PDF", b"PK\x03\x04",
+    b"\x7fELF", b"RIFF", b"\x00\x00\x01\x00", b"wOFF", b"wOF2",
+)
+
+
+class ZipIngestError(ValueError):
+    """The upload is not an archive we are willing to read (corrupt, too large, zip bomb)."""
+
+
+def looks_binary(head):
+    """Sniffs the first bytes of a member for well known binary signatures or NUL bytes."""
+    return head.startswith(BINARY_SIGNATURES) or b"\0" in head
+
+
+def read_text_members(source):
+    """
+    Reads the text files of a zip archive into memory.
+    source is a path, bytes or a binary file object.
+    Returns a list of (member name, text) tuples in archive order.
+    Raises ZipIngestError for corrupt archives and likely zip bombs.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        zip_ref = zipfile.ZipFile(source, 'r')
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ZipIngestError(f"Invalid zip file: {e}") from e
+
+    files = []
+    total = 0
+    with zip_ref:
+        members = [info for info in zip_ref.infolist() if not info.is_dir()]
+        if len(members) > MAX_MEMBERS:
+            raise ZipIngestError(f"Zip file has too many files ({len(members)} > {MAX_MEMBERS})")
+
+        declared = sum(info.file_size for info in members)
+        compressed = sum(info.compress_size for info in members) or 1
+        if declared / compressed > MAX_COMPRESSION_RATIO:
+            raise ZipIngestError("Zip file compression ratio is too high")
+
+        for info in members:
+            if info.file_size > MAX_MEMBER_BYTES:
+                logger.debug("Skipping large file: %s (%d bytes)", info.filename, info.file_size)
+                continue
+            if total + info.file_size > MAX_TOTAL_BYTES:
+                logger.info("Total size limit reached, skipping remaining files from: %s", info.filename)
+                break
+            try:
+                with zip_ref.open(info) as member:
+                    head = member.read(SNIFF_BYTES)
+                    if looks_binary(head):
+                        continue
+                    # Header sizes can lie; never read past the per-member cap.
+                    data = head + member.read(MAX_MEMBER_BYTES + 1 - len(head))
+            except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError) as e:
+                logger.warning("Error reading file %s: %s", info.filename, e)
+                continue
+            if len(data) > MAX_MEMBER_BYTES:
+                raise ZipIngestError(f"{info.filename} is larger than its declared size")
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError:
+                logger.debug("Skipping binary or non-utf-8 file: %s", info.filename)
+                continue
+            total += len(data)
+            files.append((info.filename, text))
+    return files
+
+
+def format_user_code(files):
+    """Joins (name, text) tuples into the "=== name ===" layout used in the prompts."""
+    return "".join(f"\n\n=== {name} ===\n{text}" for name, text in files)